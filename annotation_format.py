@@ -0,0 +1,289 @@
+"""Compact binary per-image annotation format (.ann).
+
+Layout (little endian, every section 8-byte aligned):
+
+    header      HEADER_DTYPE, one record
+    instances   INSTANCE_DTYPE, one record per instance
+    vertices    uint16 (n_vertices, 2), coordinates quantized to [0, 65535] of the image size
+    rle         uint32 run lengths of the source masks, cropped to each mask's bbox
+
+Files are opened with numpy.memmap and every section is a view into the
+mapping, so loading creates no per-vertex Python objects.
+"""
+import os
+import numpy as np
+
+MAGIC = b"YANN"
+VERSION = 1
+QUANT = 65535
+
+# Instance flags
+FLAG_REVIEWED = 1
+FLAG_EDITED = 2
+
+# Instance provenance
+PROVENANCE_IMPORTED = 0
+PROVENANCE_MODEL = 1
+PROVENANCE_MANUAL = 2
+
+HEADER_DTYPE = np.dtype([
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("reserved", "<u2"),
+    ("img_w", "<u4"),
+    ("img_h", "<u4"),
+    ("n_instances", "<u4"),
+    ("n_vertices", "<u4"),
+    ("n_rle", "<u4"),
+    ("pad", "<u4"),
+])
+
+INSTANCE_DTYPE = np.dtype([
+    ("class_id", "<u2"),
+    ("flags", "u1"),
+    ("provenance", "u1"),
+    ("score", "<f4"),
+    ("vertex_start", "<u4"),
+    ("vertex_count", "<u4"),
+    ("rle_start", "<u4"),
+    ("rle_count", "<u4"),
+    ("mask_x", "<u4"),
+    ("mask_y", "<u4"),
+    ("mask_w", "<u4"),
+    ("mask_h", "<u4"),
+])
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+# Byte offset of the instance table, which directly follows the header.
+INSTANCES_OFFSET = _align(HEADER_DTYPE.itemsize)
+
+
+def annotation_path_for(txt_path):
+    """Binary annotation path next to a YOLO txt label path"""
+    return os.path.splitext(txt_path)[0] + ".ann"
+
+
+def rle_encode(mask):
+    """Run lengths of a 2D bool mask in row-major order, starting with a 0-run"""
+    flat = np.asarray(mask, dtype=bool).ravel()
+    if flat.size == 0:
+        return np.zeros(0, dtype=np.uint32)
+    change = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], change, [flat.size]))
+    runs = np.diff(bounds).astype(np.uint32)
+    if flat[0]:
+        runs = np.concatenate((np.zeros(1, dtype=np.uint32), runs))
+    return runs
+
+
+def rle_decode(runs, height, width):
+    """Inverse of rle_encode"""
+    values = np.zeros(len(runs), dtype=bool)
+    values[1::2] = True
+    return np.repeat(values, runs.astype(np.int64)).reshape(height, width)
+
+
+def crop_mask(mask):
+    """Crop a full-image bool mask to its bounding box, returning (x, y, crop)"""
+    mask = np.asarray(mask, dtype=bool)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        return 0, 0, np.zeros((0, 0), dtype=bool)
+    y0, y1 = rows[0], rows[-1] + 1
+    x0, x1 = cols[0], cols[-1] + 1
+    return int(x0), int(y0), mask[y0:y1, x0:x1]
+
+
+class AnnotationInstance:
+    """Compact annotation record used by file I/O, the store and background pipelines.
+
+    Shapes are only built from these for the image on screen
+    (Shape.from_instance / Shape.to_instance).
+    """
+
+    __slots__ = ("class_id", "points", "score", "flags", "provenance", "mask")
+
+    def __init__(self, class_id, points, score=1.0, flags=0, provenance=PROVENANCE_IMPORTED, mask=None):
+        self.class_id = class_id
+        # (N, 2) array of absolute pixel coordinates
+        self.points = points
+        self.score = score
+        self.flags = flags
+        self.provenance = provenance
+        # None, or (x, y, width, height, rle runs) of the source mask
+        self.mask = mask
+
+
+def encode_annotations(img_w, img_h, instances):
+    """Serialize AnnotationInstance records to bytes"""
+    instances = list(instances)
+    table = np.zeros(len(instances), dtype=INSTANCE_DTYPE)
+    vertex_chunks = []
+    rle_chunks = []
+    n_vertices = 0
+    n_rle = 0
+    scale = np.array([QUANT / max(img_w, 1), QUANT / max(img_h, 1)], dtype=np.float64)
+    for i, inst in enumerate(instances):
+        pts = np.asarray(inst.points, dtype=np.float64).reshape(-1, 2)
+        q = np.clip(np.rint(pts * scale), 0, QUANT).astype(np.uint16)
+        rec = table[i]
+        rec["class_id"] = inst.class_id
+        rec["flags"] = inst.flags
+        rec["provenance"] = inst.provenance
+        rec["score"] = 1.0 if inst.score is None else inst.score
+        rec["vertex_start"] = n_vertices
+        rec["vertex_count"] = len(q)
+        vertex_chunks.append(q)
+        n_vertices += len(q)
+        if inst.mask is not None:
+            x, y, w, h, runs = inst.mask
+            runs = np.asarray(runs, dtype=np.uint32)
+            rec["rle_start"] = n_rle
+            rec["rle_count"] = len(runs)
+            rec["mask_x"], rec["mask_y"], rec["mask_w"], rec["mask_h"] = x, y, w, h
+            rle_chunks.append(runs)
+            n_rle += len(runs)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"] = MAGIC
+    header["version"] = VERSION
+    header["img_w"] = img_w
+    header["img_h"] = img_h
+    header["n_instances"] = len(instances)
+    header["n_vertices"] = n_vertices
+    header["n_rle"] = n_rle
+
+    vertices = np.concatenate(vertex_chunks) if vertex_chunks else np.zeros((0, 2), dtype=np.uint16)
+    rle = np.concatenate(rle_chunks) if rle_chunks else np.zeros(0, dtype=np.uint32)
+    parts = []
+    for section in (header, table, vertices, rle):
+        data = section.tobytes()
+        parts.append(data + b"\0" * (_align(len(data)) - len(data)))
+    return b"".join(parts)
+
+
+class AnnotationFile:
+    """Read-only view over an encoded annotation buffer (memmap or bytes)"""
+
+    def __init__(self, buffer):
+        buf = np.frombuffer(buffer, dtype=np.uint8) if not isinstance(buffer, np.ndarray) else buffer
+        header = buf[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)[0]
+        if header["magic"] != MAGIC:
+            raise ValueError("Not an annotation file")
+        if header["version"] != VERSION:
+            raise ValueError(f"Unsupported annotation version: {header['version']}")
+        self.img_w = int(header["img_w"])
+        self.img_h = int(header["img_h"])
+        n_instances = int(header["n_instances"])
+        n_vertices = int(header["n_vertices"])
+        n_rle = int(header["n_rle"])
+
+        offset = INSTANCES_OFFSET
+        size = n_instances * INSTANCE_DTYPE.itemsize
+        self.instances = buf[offset:offset + size].view(INSTANCE_DTYPE)
+        offset = _align(offset + size)
+        size = n_vertices * 4
+        self.vertices = buf[offset:offset + size].view(np.uint16).reshape(-1, 2)
+        offset = _align(offset + size)
+        self.rle = buf[offset:offset + n_rle * 4].view(np.uint32)
+
+    @classmethod
+    def open(cls, path):
+        if os.path.getsize(path) == 0:
+            raise ValueError("Empty annotation file")
+        return cls(np.memmap(path, dtype=np.uint8, mode="r"))
+
+    def __len__(self):
+        return len(self.instances)
+
+    def normalized_polygon(self, i):
+        """Vertices of instance i as (N, 2) float32 in [0, 1]"""
+        rec = self.instances[i]
+        start = int(rec["vertex_start"])
+        q = self.vertices[start:start + int(rec["vertex_count"])]
+        return q.astype(np.float32) / QUANT
+
+    def polygon(self, i, img_w=None, img_h=None):
+        """Vertices of instance i as (N, 2) float32 pixel coordinates"""
+        w = img_w or self.img_w
+        h = img_h or self.img_h
+        return self.normalized_polygon(i) * np.array([w, h], dtype=np.float32)
+
+    def mask_rle(self, i):
+        """(x, y, width, height, runs) of the source mask of instance i, or None"""
+        rec = self.instances[i]
+        if rec["rle_count"] == 0:
+            return None
+        start = int(rec["rle_start"])
+        runs = self.rle[start:start + int(rec["rle_count"])]
+        return int(rec["mask_x"]), int(rec["mask_y"]), int(rec["mask_w"]), int(rec["mask_h"]), runs
+
+    def instance(self, i, img_w=None, img_h=None):
+        """AnnotationInstance record of instance i, with its points in pixels"""
+        rec = self.instances[i]
+        mask = self.mask_rle(i)
+        if mask is not None:
+            x, y, w, h, runs = mask
+            mask = (x, y, w, h, np.array(runs))
+        return AnnotationInstance(
+            int(rec["class_id"]),
+            self.polygon(i, img_w, img_h),
+            float(rec["score"]),
+            flags=int(rec["flags"]),
+            provenance=int(rec["provenance"]),
+            mask=mask,
+        )
+
+    def records(self, img_w=None, img_h=None):
+        """AnnotationInstance records of every instance"""
+        return [self.instance(i, img_w, img_h) for i in range(len(self))]
+
+    def mask(self, i):
+        """Full-image bool source mask of instance i, or None"""
+        rle = self.mask_rle(i)
+        if rle is None:
+            return None
+        x, y, w, h, runs = rle
+        full = np.zeros((self.img_h, self.img_w), dtype=bool)
+        full[y:y + h, x:x + w] = rle_decode(runs, h, w)
+        return full
+
+
+def ann_to_yolo_lines(ann):
+    """YOLO-seg txt lines (with trailing score) for an AnnotationFile"""
+    lines = []
+    for i in range(len(ann)):
+        rec = ann.instances[i]
+        coords = ann.normalized_polygon(i).ravel()
+        if coords.size == 0:
+            continue
+        parts = [str(int(rec["class_id"]))] + [f"{v:.6f}" for v in coords.tolist()] + [f"{float(rec['score']):.6f}"]
+        lines.append(" ".join(parts))
+    return lines
+
+
+def read_yolo_instances(txt_path, img_w, img_h, provenance=PROVENANCE_IMPORTED):
+    """Parse a YOLO-seg txt file into AnnotationInstance records"""
+    instances = []
+    with open(txt_path, "r") as f:
+        for line in f:
+            parts = line.split()
+            if not parts:
+                continue
+            try:
+                if len(parts) % 2 == 0:
+                    score = float(parts[-1])
+                    coords = parts[1:-1]
+                else:
+                    score = 1.0
+                    coords = parts[1:]
+                pts = np.array(coords, dtype=np.float64).reshape(-1, 2) * (img_w, img_h)
+                instances.append(AnnotationInstance(int(parts[0]), pts, score, provenance=provenance))
+            except ValueError as e:
+                print(f"Error parsing line {line}: {e}")
+    return instances
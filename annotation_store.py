@@ -0,0 +1,336 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+import annotation_format
+from annotation_format import (
+    AnnotationFile, INSTANCE_DTYPE, INSTANCES_OFFSET, encode_annotations, read_yolo_instances
+)
+from dataset_stats import DatasetStats
+
+STORE_FILENAME = "annotations.db"
+
+
+# Reviewed flag, instance count and the instance table of a row's blob, for DatasetStats.
+STATS_COLUMNS = "reviewed, num_instances, substr(data, {}, num_instances * {})".format(
+    INSTANCES_OFFSET + 1, INSTANCE_DTYPE.itemsize
+)
+
+
+def stats_of(rows):
+    """DatasetStats of rows selected with STATS_COLUMNS"""
+    reviewed, counts, tables = zip(*rows) if rows else ((), (), ())
+    return DatasetStats.from_tables(reviewed, counts, np.frombuffer(b"".join(tables), dtype=INSTANCE_DTYPE))
+
+
+def store_path_for(labels_dir):
+    """Workspace annotation store that sits next to the labels folder"""
+    return os.path.join(os.path.dirname(os.path.abspath(labels_dir)), STORE_FILENAME)
+
+
+class AnnotationStore:
+    """Single-file SQLite store holding the annotations of every image in a workspace.
+
+    Each image is one row keyed by its basename. The shapes are kept as one
+    blob in the binary .ann layout (see annotation_format), so reading an
+    image is a single primary-key lookup and the blob is parsed without
+    copying. Per-image summaries (instance count, average score, reviewed)
+    live in plain columns so the file list can query them in bulk.
+
+    Dataset statistics are kept as running totals (DatasetStats), updated
+    in the same transaction as every write and saved in the meta table
+    with the row count, reviewed count and newest `updated` time they
+    describe. When the store is opened, or another connection has written
+    to it, those marks are compared with the rows; totals that don't match
+    are dropped until rebuild_stats recounts them.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            CREATE TABLE IF NOT EXISTS images (
+                name TEXT PRIMARY KEY,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                num_instances INTEGER NOT NULL DEFAULT 0,
+                avg_score REAL,
+                reviewed INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                data BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS image_hashes (
+                name TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                hash INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS images_updated ON images (updated);
+            CREATE INDEX IF NOT EXISTS images_reviewed ON images (reviewed);
+            """
+        )
+        self.conn.execute(
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(self.SCHEMA_VERSION),),
+        )
+        self._stats = None
+        self._stats_updated = None
+        self._load_stats()
+
+    def _marks(self):
+        """(row count, reviewed count, newest updated) of the images table, from the indexes"""
+        rows, reviewed = self.conn.execute(
+            "SELECT COUNT(*), (SELECT COUNT(*) FROM images WHERE reviewed = 1) FROM images"
+        ).fetchone()
+        updated = self.conn.execute("SELECT MAX(updated) FROM images").fetchone()[0]
+        return rows, reviewed, updated
+
+    def _data_version(self):
+        # Changes only when another connection commits.
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load_stats(self):
+        with self._lock:
+            self._data_version_seen = self._data_version()
+            rows, reviewed, updated = self._marks()
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'stats'").fetchone()
+            if row is None:
+                stats, stats_updated = (DatasetStats(), None) if rows == 0 else (None, None)
+            else:
+                saved = json.loads(row[0])
+                stats, stats_updated = DatasetStats.from_json(saved["stats"]), saved["updated"]
+            if stats is not None and (stats.rows, stats.reviewed, stats_updated) != (rows, reviewed, updated):
+                stats = None
+            self._stats, self._stats_updated = stats, updated
+
+    def _save_stats(self):
+        """Persist the totals; called inside the write transaction that changed them"""
+        if self._stats is None:
+            return
+        value = json.dumps({"stats": self._stats.to_json(), "updated": self._stats_updated})
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('stats', ?)", (value,))
+
+    def dataset_stats(self):
+        """Copy of the current DatasetStats, or None while they have to be rebuilt"""
+        with self._lock:
+            version = self._data_version()
+            if version != self._data_version_seen:
+                # Written by another process: keep the totals only if the marks still match.
+                self._load_stats()
+            return None if self._stats is None else self._stats.copy()
+
+    def rebuild_stats(self):
+        """Recount the totals from every row and save them.
+
+        Only the instance table of each blob is read, and all of them are
+        counted in one NumPy pass outside the lock; if anything was written
+        in between, the count starts over.
+        """
+        while True:
+            with self._lock:
+                marks = self._marks()
+                rows = self.conn.execute(f"SELECT {STATS_COLUMNS} FROM images").fetchall()
+            stats = stats_of(rows)
+            with self._lock:
+                if self._marks() != marks:
+                    continue
+                self._stats, self._stats_updated = stats, marks[2]
+                self._data_version_seen = self._data_version()
+                self._save_stats()
+                return stats.copy()
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def names(self):
+        with self._lock:
+            return {row[0] for row in self.conn.execute("SELECT name FROM images")}
+
+    def __contains__(self, name):
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM images WHERE name = ?", (name,)).fetchone() is not None
+
+    def get(self, name):
+        """AnnotationFile view of an image's annotations, or None"""
+        with self._lock:
+            row = self.conn.execute("SELECT data FROM images WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            return None
+        return AnnotationFile(row[0])
+
+    def summary(self, name):
+        """(num_instances, avg_score, reviewed) of an image, or None if it has no row"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT num_instances, avg_score, reviewed FROM images WHERE name = ?", (name,)
+            ).fetchone()
+
+    def summaries(self):
+        """{name: (num_instances, avg_score, reviewed)} for every image, in one query"""
+        with self._lock:
+            rows = self.conn.execute("SELECT name, num_instances, avg_score, reviewed FROM images").fetchall()
+        return {name: (n, score, reviewed) for name, n, score, reviewed in rows}
+
+    def reviewed_items(self):
+        """{name: updated} of every reviewed image"""
+        with self._lock:
+            return dict(self.conn.execute("SELECT name, updated FROM images WHERE reviewed = 1"))
+
+    @staticmethod
+    def _row(name, img_w, img_h, instances, reviewed):
+        instances = list(instances)
+        scores = [1.0 if inst.score is None else inst.score for inst in instances]
+        avg_score = sum(scores) / len(scores) if scores else None
+        data = encode_annotations(img_w, img_h, instances)
+        return (name, img_w, img_h, len(instances), avg_score, int(reviewed), time.time(), data)
+
+    def put(self, name, img_w, img_h, instances, reviewed=None):
+        """Replace an image's annotations. reviewed=None keeps the current flag."""
+        self.put_many([(name, img_w, img_h, instances, reviewed)])
+
+    def put_many(self, items):
+        """Replace the annotations of several images in one transaction"""
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                old_rows, new_rows = [], []
+                for name, img_w, img_h, instances, reviewed in items:
+                    current = self.conn.execute(
+                        f"SELECT {STATS_COLUMNS} FROM images WHERE name = ?", (name,)
+                    ).fetchone()
+                    if reviewed is None:
+                        reviewed = bool(current and current[0])
+                    row = self._row(name, img_w, img_h, instances, reviewed)
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO images "
+                        "(name, width, height, num_instances, avg_score, reviewed, updated, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        row,
+                    )
+                    if current is not None:
+                        old_rows.append(current)
+                    n, updated, data = row[3], row[-2], row[-1]
+                    new_rows.append((reviewed, n, data[INSTANCES_OFFSET:INSTANCES_OFFSET + n * INSTANCE_DTYPE.itemsize]))
+                    if self._stats is not None:
+                        self._stats_updated = max(self._stats_updated or 0.0, updated)
+                if self._stats is not None:
+                    self._stats.merge(stats_of(old_rows), -1)
+                    self._stats.merge(stats_of(new_rows))
+                    self._save_stats()
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                # The saved totals were rolled back with the rows.
+                self._load_stats()
+                raise
+
+    def delete(self, names):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            if self._stats is not None:
+                rows = [
+                    self.conn.execute(f"SELECT {STATS_COLUMNS} FROM images WHERE name = ?", (name,)).fetchone()
+                    for name in names
+                ]
+                self._stats.merge(stats_of([row for row in rows if row is not None]), -1)
+            self.conn.executemany("DELETE FROM images WHERE name = ?", [(n,) for n in names])
+            self.conn.executemany("DELETE FROM image_hashes WHERE name = ?", [(n,) for n in names])
+            if self._stats is not None:
+                self._stats_updated = self.conn.execute("SELECT MAX(updated) FROM images").fetchone()[0]
+                self._save_stats()
+            self.conn.execute("COMMIT")
+
+    def hashes(self):
+        """{name: (mtime, hash)} of the cached perceptual hashes"""
+        with self._lock:
+            rows = self.conn.execute("SELECT name, mtime, hash FROM image_hashes").fetchall()
+        # SQLite integers are signed; hashes are stored as the int64 bit pattern.
+        return {name: (mtime, h & 0xFFFFFFFFFFFFFFFF) for name, mtime, h in rows}
+
+    def put_hashes(self, items):
+        """Cache perceptual hashes given as (name, mtime, hash) tuples"""
+        rows = [(name, mtime, h - (1 << 64) if h >= 1 << 63 else h) for name, mtime, h in items]
+        with self._lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO image_hashes (name, mtime, hash) VALUES (?, ?, ?)", rows
+            )
+            self.conn.execute("COMMIT")
+
+    def import_labels_dir(self, labels_dir, image_sizes):
+        """Bulk import .ann / YOLO txt files for images not yet in the store.
+
+        image_sizes maps image basename -> (width, height). Returns the number
+        of images imported.
+        """
+        # Small batches (e.g. files arriving in a watched folder) are looked up one by one.
+        if len(image_sizes) > 1000:
+            existing = self.names()
+        else:
+            existing = {name for name in image_sizes if name in self}
+        reviewed_names = set()
+        reviewed_path = os.path.join(labels_dir, ".reviewed")
+        if os.path.exists(reviewed_path):
+            with open(reviewed_path, "r") as f:
+                reviewed_names = {line.strip() for line in f if line.strip()}
+        items = []
+        for name, (img_w, img_h) in image_sizes.items():
+            if name in existing:
+                continue
+            stem = os.path.splitext(name)[0]
+            ann_path = os.path.join(labels_dir, stem + ".ann")
+            txt_path = os.path.join(labels_dir, stem + ".txt")
+            if os.path.exists(ann_path) and os.path.getsize(ann_path):
+                instances = AnnotationFile.open(ann_path).records(img_w, img_h)
+            elif os.path.exists(txt_path):
+                instances = read_yolo_instances(txt_path, img_w, img_h)
+            else:
+                continue
+            items.append((name, img_w, img_h, instances, name in reviewed_names))
+        if items:
+            self.put_many(items)
+        return len(items)
+
+    def write_yolo_txt(self, name, txt_path):
+        """Materialize one image's annotations as YOLO-seg txt; False if it has none"""
+        ann = self.get(name)
+        if ann is None:
+            return False
+        with open(txt_path, "w") as f:
+            f.write("\n".join(annotation_format.ann_to_yolo_lines(ann)))
+        return True
+
+    def materialize_yolo_labels(self, labels_dir, names=None):
+        """Write YOLO txt for images whose txt is missing or older than the store row.
+
+        Returns the number of files written.
+        """
+        os.makedirs(labels_dir, exist_ok=True)
+        with self._lock:
+            rows = self.conn.execute("SELECT name, updated FROM images").fetchall()
+        names = None if names is None else set(names)
+        written = 0
+        for name, updated in rows:
+            if names is not None and name not in names:
+                continue
+            txt_path = os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt")
+            if os.path.exists(txt_path) and os.path.getmtime(txt_path) >= updated:
+                continue
+            self.write_yolo_txt(name, txt_path)
+            written += 1
+        return written
+
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+from collections import Counter
+
+import annotation_format
+from profiler import profiler
+
+DATASET_DIRNAME = "dataset"
+MANIFEST_FILENAME = "manifest.json"
+SPLITS = ("train", "val", "gate")
+# Share of new images reserved for evaluating trained models; never trained or validated on.
+GATE_FRACTION = 0.1
+
+
+def dataset_dir_for(labels_dir):
+    """Generated training dataset folder, next to the labels folder"""
+    return os.path.join(os.path.dirname(os.path.abspath(labels_dir)), DATASET_DIRNAME)
+
+
+def _split_key(name, seed):
+    """Stable pseudo-random ordering key of an image within its stratum"""
+    return hashlib.sha1(f"{seed}:{name}".encode("utf-8")).hexdigest()
+
+
+def _stratum(ann):
+    """Most frequent class of an image, or -1 for images without instances"""
+    if not len(ann):
+        return -1
+    return Counter(ann.instances["class_id"].tolist()).most_common(1)[0][0]
+
+
+def _link(src, dst):
+    """Symlink dst -> src, falling back to a hard link; never copies pixels"""
+    try:
+        os.symlink(src, dst)
+    except OSError:
+        os.link(src, dst)
+
+
+class DatasetBuilder:
+    """Assembles a YOLO-seg training dataset from the reviewed images of a workspace.
+
+    Images are linked, not copied, into images/{train,val,gate} (to their
+    pre-resized copy when image_source provides one, see TrainImageCache);
+    labels are written from the annotation store into labels/{train,val,gate}.
+    The split is deterministic: an image keeps its split once assigned. A
+    pseudo-random gate_fraction of new images goes to the gate split, which
+    data.yaml leaves out, so the trained model can be evaluated on images it
+    was neither trained nor validated on (see model_gate); the rest is
+    split stratified by each image's most frequent class, so every stratum
+    stays close to the validation fraction. A manifest records what was
+    written, so later rounds only touch new, edited or removed images.
+    """
+
+    def __init__(self, out_dir, val_fraction=0.2, seed=0, gate_fraction=GATE_FRACTION):
+        self.out_dir = out_dir
+        self.val_fraction = val_fraction
+        self.gate_fraction = gate_fraction
+        self.seed = seed
+        self.manifest_path = os.path.join(out_dir, MANIFEST_FILENAME)
+
+    def manifest(self):
+        """{name: {split, stratum, source, updated}} of the images in the dataset"""
+        return self._load_manifest()
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("seed") != self.seed:
+            return {}
+        return manifest.get("images", {})
+
+    def _save_manifest(self, images):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"seed": self.seed, "images": images}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _paths(self, split, name):
+        stem = os.path.splitext(name)[0]
+        return (
+            os.path.join(self.out_dir, "images", split, name),
+            os.path.join(self.out_dir, "labels", split, stem + ".txt"),
+        )
+
+    def _remove(self, entry, name):
+        for path in self._paths(entry["split"], name):
+            if os.path.lexists(path):
+                os.remove(path)
+
+    def _assign_splits(self, manifest, new_items):
+        """Assign new (name, stratum) items to train/val/gate, keeping existing assignments"""
+        counts = {}
+        for entry in manifest.values():
+            if entry["split"] == "gate":
+                continue
+            total, val = counts.get(entry["stratum"], (0, 0))
+            counts[entry["stratum"]] = (total + 1, val + (entry["split"] == "val"))
+        splits = {}
+        for name, stratum in sorted(new_items, key=lambda item: _split_key(item[0], self.seed)):
+            # Decided by the name alone, so datasets from before the gate split don't make it catch up.
+            if int(_split_key(name, f"gate:{self.seed}")[:8], 16) < self.gate_fraction * 2 ** 32:
+                splits[name] = "gate"
+                continue
+            total, val = counts.get(stratum, (0, 0))
+            total += 1
+            is_val = val < round(total * self.val_fraction)
+            counts[stratum] = (total, val + is_val)
+            splits[name] = "val" if is_val else "train"
+        return splits
+
+    def build(self, annotation_store, image_paths, class_names, image_source=None):
+        """Sync the dataset with the workspace and write data.yaml; returns its path and stats.
+
+        image_source(path) gives the file to link for an image, by default the image itself.
+        """
+        with profiler.span("dataset.build"):
+            for split in SPLITS:
+                os.makedirs(os.path.join(self.out_dir, "images", split), exist_ok=True)
+                os.makedirs(os.path.join(self.out_dir, "labels", split), exist_ok=True)
+
+            sources = {os.path.basename(p): os.path.abspath(p) for p in image_paths}
+            reviewed = {
+                name: updated for name, updated in annotation_store.reviewed_items().items() if name in sources
+            }
+            manifest = self._load_manifest()
+
+            removed = [name for name in manifest if name not in reviewed]
+            for name in removed:
+                self._remove(manifest.pop(name), name)
+
+            new_items = []
+            anns = {}
+            for name, updated in reviewed.items():
+                entry = manifest.get(name)
+                if entry is not None and entry["updated"] == updated and entry["source"] == sources[name]:
+                    continue
+                ann = annotation_store.get(name)
+                anns[name] = ann
+                if entry is None:
+                    new_items.append((name, _stratum(ann)))
+            splits = self._assign_splits(manifest, new_items)
+            strata = dict(new_items)
+
+            for name, ann in anns.items():
+                entry = manifest.get(name)
+                if entry is None:
+                    entry = {"split": splits[name], "stratum": strata[name]}
+                    manifest[name] = entry
+                _, label_path = self._paths(entry["split"], name)
+                with open(label_path, "w") as f:
+                    f.write("\n".join(annotation_format.ann_to_yolo_lines(ann)))
+                entry["source"] = sources[name]
+                entry["updated"] = reviewed[name]
+
+            # Every image's link target is checked: a resized copy may have been cached since the last build.
+            for name, entry in manifest.items():
+                target = image_source(sources[name]) if image_source is not None else sources[name]
+                img_link, _ = self._paths(entry["split"], name)
+                if entry.get("link") != target or name in anns and not os.path.lexists(img_link):
+                    if os.path.lexists(img_link):
+                        os.remove(img_link)
+                    _link(target, img_link)
+                    entry["link"] = target
+
+            self._save_manifest(manifest)
+            counts = self._write_lists(manifest)
+            yaml_path = self.write_yaml(class_names)
+        stats = {"train": counts["train"], "val": counts["val"], "gate": counts["gate"], "added": len(new_items),
+                 "updated": len(anns) - len(new_items), "removed": len(removed)}
+        return yaml_path, stats
+
+    def _write_lists(self, manifest):
+        lists = {split: [] for split in SPLITS}
+        for name in sorted(manifest):
+            split = manifest[name]["split"]
+            lists[split].append(f"./images/{split}/{name}")
+        for split, lines in lists.items():
+            with open(os.path.join(self.out_dir, f"{split}.txt"), "w") as f:
+                f.write("\n".join(lines) + ("\n" if lines else ""))
+        return {split: len(lines) for split, lines in lists.items()}
+
+    def write_yaml(self, class_names, train_list="train.txt", yaml_name="data.yaml"):
+        yaml_path = os.path.join(self.out_dir, yaml_name)
+        lines = [
+            f"path: {json.dumps(os.path.abspath(self.out_dir))}",
+            f"train: {train_list}",
+            "val: val.txt",
+            "",
+            "names:",
+        ]
+        # JSON strings are valid YAML scalars, so class names need no further escaping.
+        lines += [f"  {i}: {json.dumps(name, ensure_ascii=False)}" for i, name in enumerate(class_names)]
+        with open(yaml_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return yaml_path
@@ -0,0 +1,110 @@
+import json
+
+import numpy as np
+
+SCORE_BINS = 10
+# Upper bounds of the vertex count histogram buckets; the last bucket is open.
+VERTEX_BOUNDS = (4, 8, 16, 32, 64, 128, 256)
+
+
+class DatasetStats:
+    """Class balance and labeling progress of a workspace as running totals.
+
+    Totals change by deltas: when images' annotations are replaced, the
+    totals of the old rows are subtracted and those of the new rows added
+    (see AnnotationStore), so nothing is ever rescanned to keep them
+    current. Only the instance tables of the encoded annotations are read,
+    never the vertices.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.reviewed = 0
+        self.predicted = 0
+        self.instances = {}
+        self.images = {}
+        self.vertex_total = 0
+        self.scores = np.zeros(SCORE_BINS, dtype=np.int64)
+        self.vertices = np.zeros(len(VERTEX_BOUNDS) + 1, dtype=np.int64)
+
+    @classmethod
+    def from_tables(cls, reviewed, counts, table):
+        """Totals of a batch of images in one pass.
+
+        reviewed and counts hold each image's flag and instance count, table
+        is their INSTANCE_DTYPE tables concatenated in the same order.
+        """
+        reviewed = np.asarray(reviewed, dtype=bool)
+        counts = np.asarray(counts, dtype=np.int64)
+        stats = cls()
+        stats.rows = len(reviewed)
+        stats.reviewed = int(reviewed.sum())
+        stats.predicted = int((~reviewed & (counts > 0)).sum())
+        if not len(table):
+            return stats
+        class_ids = table["class_id"].astype(np.int64)
+        n_classes = int(class_ids.max()) + 1
+        # Unique (image, class) pairs give the number of images containing each class.
+        pairs = np.unique(np.repeat(np.arange(len(counts)), counts) * n_classes + class_ids)
+        instances = np.bincount(class_ids, minlength=n_classes)
+        images = np.bincount(pairs % n_classes, minlength=n_classes)
+        stats.instances = {c: int(n) for c, n in enumerate(instances.tolist()) if n}
+        stats.images = {c: int(n) for c, n in enumerate(images.tolist()) if n}
+        bins = np.clip((table["score"] * SCORE_BINS).astype(np.int64), 0, SCORE_BINS - 1)
+        stats.scores = np.bincount(bins, minlength=SCORE_BINS).astype(np.int64)
+        vertex_counts = table["vertex_count"]
+        stats.vertices = np.bincount(
+            np.searchsorted(VERTEX_BOUNDS, vertex_counts), minlength=len(VERTEX_BOUNDS) + 1
+        ).astype(np.int64)
+        stats.vertex_total = int(vertex_counts.sum())
+        return stats
+
+    def merge(self, other, sign=1):
+        """Add (sign=1) or subtract (sign=-1) the totals of another DatasetStats"""
+        self.rows += sign * other.rows
+        self.reviewed += sign * other.reviewed
+        self.predicted += sign * other.predicted
+        for totals, deltas in ((self.instances, other.instances), (self.images, other.images)):
+            for class_id, n in deltas.items():
+                total = totals.get(class_id, 0) + sign * n
+                if total:
+                    totals[class_id] = total
+                else:
+                    totals.pop(class_id, None)
+        self.vertex_total += sign * other.vertex_total
+        self.scores += sign * other.scores
+        self.vertices += sign * other.vertices
+
+    @property
+    def num_instances(self):
+        return sum(self.instances.values())
+
+    def copy(self):
+        return DatasetStats.from_json(self.to_json())
+
+    def to_json(self):
+        return json.dumps({
+            "rows": self.rows,
+            "reviewed": self.reviewed,
+            "predicted": self.predicted,
+            "instances": self.instances,
+            "images": self.images,
+            "vertex_total": self.vertex_total,
+            "scores": self.scores.tolist(),
+            "vertices": self.vertices.tolist(),
+        }, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        stats = cls()
+        stats.rows = data["rows"]
+        stats.reviewed = data["reviewed"]
+        stats.predicted = data["predicted"]
+        # JSON object keys are strings.
+        stats.instances = {int(k): v for k, v in data["instances"].items()}
+        stats.images = {int(k): v for k, v in data["images"].items()}
+        stats.vertex_total = data["vertex_total"]
+        stats.scores = np.array(data["scores"], dtype=np.int64)
+        stats.vertices = np.array(data["vertices"], dtype=np.int64)
+        return stats
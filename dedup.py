@@ -0,0 +1,132 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from profiler import profiler
+
+# Popcount of every byte value, for Hamming distances on packed uint64 hashes.
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(64, dtype=np.uint64))
+
+
+def _pack_bits(bits):
+    """Pack 64 booleans into one uint64"""
+    return np.uint64(np.sum(_BIT_WEIGHTS[bits.ravel()], dtype=np.uint64))
+
+
+def dhash(gray):
+    """64-bit difference hash of a grayscale image"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack_bits(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray):
+    """64-bit DCT perceptual hash of a grayscale image"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8]
+    return _pack_bits(low > np.median(low.ravel()[1:]))
+
+
+HASH_FUNCTIONS = {"dhash": dhash, "phash": phash}
+
+
+def hash_image(path, method="dhash"):
+    """Hash one image file, decoding it at reduced resolution; None if unreadable"""
+    gray = cv2.imread(path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if gray is None:
+        return None
+    return HASH_FUNCTIONS[method](gray)
+
+
+def compute_hashes(paths, method="dhash", workers=None, progress=None):
+    """Hash images in a thread pool (OpenCV releases the GIL while decoding).
+
+    Returns (hashes, valid): a uint64 array and a bool array marking images
+    that could be decoded. progress(done, total) is called from the calling
+    thread every few hundred images.
+    """
+    n = len(paths)
+    hashes = np.zeros(n, dtype=np.uint64)
+    valid = np.zeros(n, dtype=bool)
+    workers = workers or min(8, os.cpu_count() or 1)
+    with profiler.span("dedup.hash"), ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, h in enumerate(pool.map(lambda p: hash_image(p, method), paths, chunksize=16)):
+            if h is not None:
+                hashes[i] = h
+                valid[i] = True
+            if progress is not None and (i % 256 == 0 or i == n - 1):
+                progress(i + 1, n)
+    return hashes, valid
+
+
+def hamming(a, b):
+    """Element-wise Hamming distance between two uint64 arrays"""
+    x = np.bitwise_xor(a, b)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.uint8)
+
+
+def _candidate_pairs(hashes, valid, threshold, window):
+    """Index pairs within `threshold` bits among nearby items of several orderings.
+
+    Neighbours up to `window` apart are compared in the original (capture)
+    order and in the orders obtained by sorting on each 16-bit band of the
+    hash. This is approximate: two hashes within 3 bits always share a band
+    exactly and so sort into the same run of that ordering, but a pair
+    further apart than `window` in every ordering (e.g. in a run of more
+    than `window` hashes with the same band) is missed.
+    """
+    n = len(hashes)
+    orders = [np.arange(n)]
+    for band in range(4):
+        key = (hashes >> np.uint64(16 * band)) & np.uint64(0xFFFF)
+        orders.append(np.argsort(key, kind="stable"))
+
+    pairs_a, pairs_b = [], []
+    for order in orders:
+        h = hashes[order]
+        ok = valid[order]
+        for k in range(1, min(window, n - 1) + 1):
+            close = (hamming(h[:-k], h[k:]) <= threshold) & ok[:-k] & ok[k:]
+            idx = np.flatnonzero(close)
+            if idx.size:
+                pairs_a.append(order[idx])
+                pairs_b.append(order[idx + k])
+    if not pairs_a:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(pairs_a), np.concatenate(pairs_b)
+
+
+def cluster_hashes(hashes, valid=None, threshold=6, window=16):
+    """Group near-duplicate hashes.
+
+    Returns an int64 array mapping each item to its cluster id, which is the
+    index of the cluster's first item (its representative).
+    """
+    n = len(hashes)
+    if valid is None:
+        valid = np.ones(n, dtype=bool)
+    labels = np.arange(n, dtype=np.int64)
+    if n < 2:
+        return labels
+    with profiler.span("dedup.cluster"):
+        a, b = _candidate_pairs(hashes, valid, threshold, window)
+        # Connected components by min-label propagation with pointer jumping.
+        while a.size:
+            m = np.minimum(labels[a], labels[b])
+            new = labels.copy()
+            np.minimum.at(new, a, m)
+            np.minimum.at(new, b, m)
+            new = new[new]
+            if np.array_equal(new, labels):
+                break
+            labels = new
+    return labels
+
+
+def cluster_sizes(clusters):
+    """Number of members of each item's cluster"""
+    counts = np.bincount(clusters, minlength=len(clusters))
+    return counts[clusters]
@@ -0,0 +1,212 @@
+import os
+import threading
+
+import numpy as np
+
+EMBEDDINGS_FILENAME = "embeddings.npy"
+NAMES_FILENAME = "embeddings.names"
+
+
+def embedding_dir_for(labels_dir):
+    """Embedding files sit next to the labels folder, like the annotation store"""
+    return os.path.dirname(os.path.abspath(labels_dir))
+
+
+class EmbeddingStore:
+    """Per-image backbone embeddings in a memory-mapped float16 matrix.
+
+    Row i of embeddings.npy belongs to line i of embeddings.names. Rows are
+    appended (the file doubles in capacity when full) and updated in place
+    when an image is predicted again, so the matrix never has to fit in
+    memory as float32.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory):
+        self.matrix_path = os.path.join(directory, EMBEDDINGS_FILENAME)
+        self.names_path = os.path.join(directory, NAMES_FILENAME)
+        self._lock = threading.Lock()
+        self.names = []
+        self.rows = {}
+        self.matrix = None
+        # Rows overwritten since take_changed_rows() last ran; None after a reset.
+        self._changed = set()
+        if os.path.exists(self.matrix_path) and os.path.exists(self.names_path):
+            self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+            with open(self.names_path, "r") as f:
+                names = [line.rstrip("\n") for line in f]
+            # A crash between writing a row and its name leaves extra rows unused.
+            self.names = names[:len(self.matrix)]
+            self.rows = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def dim(self):
+        return None if self.matrix is None else self.matrix.shape[1]
+
+    def _allocate(self, capacity, dim):
+        tmp_path = self.matrix_path + ".tmp"
+        matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=(capacity, dim))
+        if self.matrix is not None and self.matrix.shape[1] == dim:
+            matrix[:len(self.names)] = self.matrix[:len(self.names)]
+        matrix.flush()
+        del matrix
+        self.matrix = None
+        os.replace(tmp_path, self.matrix_path)
+        self.matrix = np.load(self.matrix_path, mmap_mode="r+")
+
+    def _reset(self, dim):
+        """Drop every embedding, e.g. after switching to a model with another width"""
+        self.names = []
+        self.rows = {}
+        self.matrix = None
+        self._changed = None
+        open(self.names_path, "w").close()
+        self._allocate(self.INITIAL_CAPACITY, dim)
+
+    def put(self, name, embedding):
+        embedding = np.asarray(embedding, dtype=np.float16).ravel()
+        with self._lock:
+            if self.matrix is None or self.matrix.shape[1] != embedding.size:
+                self._reset(embedding.size)
+            row = self.rows.get(name)
+            if row is not None:
+                self.matrix[row] = embedding
+                if self._changed is not None:
+                    self._changed.add(row)
+                return
+            row = len(self.names)
+            if row >= len(self.matrix):
+                self._allocate(2 * len(self.matrix), embedding.size)
+            self.matrix[row] = embedding
+            self.matrix.flush()
+            with open(self.names_path, "a") as f:
+                f.write(name + "\n")
+            self.names.append(name)
+            self.rows[name] = row
+
+    def features(self):
+        """(names, float16 view of the filled rows)"""
+        with self._lock:
+            if self.matrix is None:
+                return [], np.zeros((0, 0), dtype=np.float16)
+            n = len(self.names)
+            return list(self.names), self.matrix[:n]
+
+    def take_changed_rows(self):
+        """Rows updated in place since the last call, or None if every row may have changed"""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            return changed
+
+    def flush(self):
+        with self._lock:
+            if self.matrix is not None:
+                self.matrix.flush()
+
+
+class KCenterGreedy:
+    """Incremental k-center-greedy (core-set) selection over embeddings.
+
+    Embeddings are L2-normalized and randomly projected to a few dozen
+    dimensions once, then every pick is one vectorized distance update, so
+    selecting a batch from 100k images takes seconds. The distance of each
+    row to its nearest center is kept between calls: new rows, re-embedded
+    rows and new centers (e.g. freshly reviewed images) only cost an
+    update, not a restart.
+    """
+
+    PROJECTION_DIM = 64
+    CHUNK = 8192
+    CENTER_CHUNK = 256
+
+    def __init__(self, seed=0):
+        self.seed = seed
+        self.clear()
+
+    def clear(self):
+        self.projection = None
+        self.points = np.zeros((0, 0), dtype=np.float32)
+        self.min_dist = np.zeros(0, dtype=np.float32)
+        self.centers = set()
+
+    def _project(self, features):
+        features = np.asarray(features, dtype=np.float32)
+        norms = np.linalg.norm(features, axis=1, keepdims=True)
+        features = features / np.maximum(norms, 1e-12)
+        if self.projection is None or self.projection.shape[0] != features.shape[1]:
+            rng = np.random.default_rng(self.seed)
+            dim = min(self.PROJECTION_DIM, features.shape[1])
+            self.projection = rng.standard_normal((features.shape[1], dim)).astype(np.float32) / np.sqrt(dim)
+        return features @ self.projection
+
+    def _distances_to(self, rows, center):
+        diff = self.points[rows] - self.points[center]
+        return np.einsum("ij,ij->i", diff, diff)
+
+    def _min_distances(self, points, centers, out):
+        """Lower `out` to each point's squared distance to its nearest center"""
+        sq_points = np.einsum("ij,ij->i", points, points)
+        for start in range(0, len(centers), self.CENTER_CHUNK):
+            c = self.points[centers[start:start + self.CENTER_CHUNK]]
+            # |p - c|^2 = |p|^2 + |c|^2 - 2 p.c; |p|^2 is added after the min.
+            d = points @ (-2 * c.T)
+            d += np.einsum("ij,ij->i", c, c)
+            np.minimum(out, np.maximum(d.min(axis=1) + sq_points, 0), out=out)
+
+    def update(self, features, changed=()):
+        """Sync with the embedding matrix; rows beyond the known count are new, changed rows were updated"""
+        n_known = len(self.points)
+        if features.shape[0] < n_known or (n_known and features.shape[1] != self.projection.shape[0]):
+            # The store was reset; start over.
+            self.clear()
+            n_known = 0
+        changed = np.array(sorted(r for r in changed if r < n_known), dtype=np.int64)
+        if len(changed):
+            self.points[changed] = self._project(features[changed])
+            if self.centers.intersection(changed.tolist()):
+                # A center moved: every distance may have grown.
+                self.min_dist = np.full(n_known, np.inf, dtype=np.float32)
+                self._min_distances(self.points, sorted(self.centers), self.min_dist)
+            else:
+                dist = np.full(len(changed), np.inf, dtype=np.float32)
+                self._min_distances(self.points[changed], sorted(self.centers), dist)
+                self.min_dist[changed] = dist
+        if features.shape[0] == n_known:
+            return
+        new_points = np.concatenate([
+            self._project(features[start:start + self.CHUNK])
+            for start in range(n_known, features.shape[0], self.CHUNK)
+        ])
+        self.points = new_points if not n_known else np.concatenate([self.points, new_points])
+        new_dist = np.full(len(new_points), np.inf, dtype=np.float32)
+        self._min_distances(new_points, sorted(self.centers), new_dist)
+        self.min_dist = np.concatenate([self.min_dist, new_dist])
+
+    def add_centers(self, rows):
+        """Mark rows (e.g. reviewed images) as already covered"""
+        new = sorted(set(int(r) for r in rows) - self.centers)
+        if new:
+            self.centers.update(new)
+            self._min_distances(self.points, new, self.min_dist)
+
+    def select(self, k, candidates=None):
+        """Greedily pick up to k candidate rows farthest from every center"""
+        if candidates is None:
+            candidates = np.arange(len(self.points))
+        candidates = np.asarray(candidates, dtype=np.int64)
+        if not len(candidates):
+            return []
+        dist = self.min_dist[candidates].copy()
+        picked = []
+        for _ in range(min(k, len(candidates))):
+            best = int(np.argmax(dist))
+            if dist[best] <= 0:
+                break
+            row = int(candidates[best])
+            picked.append(row)
+            np.minimum(dist, self._distances_to(candidates, row), out=dist)
+        return picked
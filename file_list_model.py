@@ -0,0 +1,296 @@
+import os
+import numpy as np
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QSize
+from PyQt5.QtGui import QPixmap, QPainter, QColor, QIcon
+from dedup import cluster_sizes
+
+
+UNKNOWN, UNLABELED, PREDICTED, REVIEWED = -1, 0, 1, 2
+
+STATUS_NAMES = {
+    UNLABELED: "Unlabeled",
+    PREDICTED: "Predicted",
+    REVIEWED: "Reviewed",
+}
+
+STATUS_COLORS = {
+    UNLABELED: QColor(150, 150, 150),
+    PREDICTED: QColor(230, 150, 30),
+    REVIEWED: QColor(60, 180, 75),
+}
+
+
+class FileStatusStore:
+    """Per-image status (labeled / predicted / reviewed, confidence) kept in flat arrays.
+
+    Statuses are read lazily from the workspace AnnotationStore on first
+    access (or in one bulk query for sorting/filtering) and cached until
+    `invalidate` is called.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self.names = []
+        self.annotation_store = None
+        self.status = np.empty(0, dtype=np.int8)
+        self.confidence = np.empty(0, dtype=np.float32)
+        self.num_instances = np.empty(0, dtype=np.int32)
+        self.cluster = np.empty(0, dtype=np.int64)
+        self.cluster_size = np.empty(0, dtype=np.int64)
+        self.selected = np.empty(0, dtype=bool)
+
+    def reset(self, paths, annotation_store=None):
+        n = len(paths)
+        self.paths = paths
+        self.names = [os.path.basename(p) for p in paths]
+        self.annotation_store = annotation_store
+        self.status = np.full(n, UNKNOWN, dtype=np.int8)
+        self.confidence = np.full(n, np.nan, dtype=np.float32)
+        self.num_instances = np.zeros(n, dtype=np.int32)
+        self.cluster = np.arange(n, dtype=np.int64)
+        self.cluster_size = np.ones(n, dtype=np.int64)
+        self.selected = np.zeros(n, dtype=bool)
+
+    def extend(self, paths):
+        """Append images with unknown status, each in its own near-duplicate cluster"""
+        n, k = len(self.paths), len(paths)
+        self.paths = self.paths + list(paths)
+        self.names = self.names + [os.path.basename(p) for p in paths]
+        self.status = np.concatenate([self.status, np.full(k, UNKNOWN, dtype=np.int8)])
+        self.confidence = np.concatenate([self.confidence, np.full(k, np.nan, dtype=np.float32)])
+        self.num_instances = np.concatenate([self.num_instances, np.zeros(k, dtype=np.int32)])
+        self.cluster = np.concatenate([self.cluster, np.arange(n, n + k, dtype=np.int64)])
+        self.cluster_size = np.concatenate([self.cluster_size, np.ones(k, dtype=np.int64)])
+        self.selected = np.concatenate([self.selected, np.zeros(k, dtype=bool)])
+
+    def __len__(self):
+        return len(self.paths)
+
+    def ensure(self, row):
+        if self.status[row] == UNKNOWN:
+            summary = self.annotation_store.summary(self.names[row]) if self.annotation_store else None
+            self._set(row, summary)
+
+    def ensure_all(self):
+        unknown = np.flatnonzero(self.status == UNKNOWN)
+        if not len(unknown):
+            return
+        summaries = self.annotation_store.summaries() if self.annotation_store else {}
+        for row in unknown:
+            self._set(row, summaries.get(self.names[row]))
+
+    def _set(self, row, summary):
+        num_instances, avg_score, reviewed = summary if summary else (0, None, False)
+        self.num_instances[row] = num_instances
+        self.confidence[row] = np.nan if avg_score is None else avg_score
+        if reviewed:
+            self.status[row] = REVIEWED
+        elif num_instances:
+            self.status[row] = PREDICTED
+        else:
+            self.status[row] = UNLABELED
+
+    def invalidate(self, row):
+        self.status[row] = UNKNOWN
+
+
+class FileListModel(QAbstractListModel):
+    """Virtual list of workspace images.
+
+    Only rows the view asks for are materialized. Filtering and sorting
+    reorder an index array instead of rebuilding items, so the model stays
+    cheap with 100k+ images.
+    """
+
+    StatusRole = Qt.UserRole + 1
+    ConfidenceRole = Qt.UserRole + 2
+    SourceRowRole = Qt.UserRole + 3
+    PathRole = Qt.UserRole + 4
+
+    FILTER_ALL, FILTER_UNLABELED, FILTER_PREDICTED, FILTER_REVIEWED, FILTER_LOW_CONF, FILTER_REPRESENTATIVES, FILTER_SELECTED = range(7)
+    FILTER_NAMES = ["All", "Unlabeled", "Predicted", "Reviewed", "Low Confidence", "Skip Near-Duplicates", "Diverse Selection"]
+    SORT_NAME, SORT_STATUS, SORT_CONFIDENCE = range(3)
+    SORT_NAMES = ["Name", "Status", "Confidence"]
+
+    LOW_CONFIDENCE = 0.5
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.store = FileStatusStore()
+        self.names = []
+        self._order = np.empty(0, dtype=np.int64)
+        self._view_row = np.empty(0, dtype=np.int64)
+        self.filter_mode = self.FILTER_ALL
+        self.sort_key = self.SORT_NAME
+        self.sort_order = Qt.AscendingOrder
+        self.name_filter = ""
+        self._icons = {status: self._make_badge(color) for status, color in STATUS_COLORS.items()}
+
+    @staticmethod
+    def _make_badge(color):
+        pixmap = QPixmap(QSize(12, 12))
+        pixmap.fill(Qt.transparent)
+        p = QPainter(pixmap)
+        p.setRenderHint(QPainter.Antialiasing)
+        p.setBrush(color)
+        p.setPen(Qt.NoPen)
+        p.drawEllipse(1, 1, 10, 10)
+        p.end()
+        return QIcon(pixmap)
+
+    def set_paths(self, paths, annotation_store=None):
+        self.beginResetModel()
+        self.store.reset(list(paths), annotation_store)
+        self.names = self.store.names
+        self._rebuild_order()
+        self.endResetModel()
+
+    def append_paths(self, paths):
+        """Add images at the end without resetting the view"""
+        if not paths:
+            return
+        n = len(self.store)
+        unordered = (
+            self.filter_mode != self.FILTER_ALL or self.name_filter
+            or self.sort_key != self.SORT_NAME or self.sort_order != Qt.AscendingOrder
+        )
+        if unordered:
+            self.store.extend(paths)
+            self.names = self.store.names
+            self._reorder()
+            return
+        # Unfiltered and in workspace order: the new rows simply go last.
+        self.beginInsertRows(QModelIndex(), n, n + len(paths) - 1)
+        self.store.extend(paths)
+        self.names = self.store.names
+        new_rows = np.arange(n, n + len(paths), dtype=np.int64)
+        self._order = np.concatenate([self._order, new_rows])
+        self._view_row = np.concatenate([self._view_row, new_rows])
+        self.endInsertRows()
+
+    def set_clusters(self, clusters):
+        """Set near-duplicate cluster ids (index of each cluster's representative)"""
+        self.store.cluster = np.asarray(clusters, dtype=np.int64)
+        self.store.cluster_size = cluster_sizes(self.store.cluster)
+        self._reorder()
+
+    def set_selection(self, rows):
+        """Mark the images picked for the next labeling batch"""
+        self.store.selected[:] = False
+        self.store.selected[np.asarray(rows, dtype=np.int64)] = True
+        self._reorder()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._order)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._order):
+            return None
+        row = int(self._order[index.row()])
+        if role == Qt.DisplayRole:
+            return self.names[row]
+        if role == self.SourceRowRole:
+            return row
+        if role == self.PathRole:
+            return self.store.paths[row]
+
+        self.store.ensure(row)
+        status = int(self.store.status[row])
+        conf = float(self.store.confidence[row])
+        if role == Qt.DecorationRole:
+            return self._icons[status]
+        if role == Qt.ToolTipRole:
+            text = f"{self.names[row]}\n{STATUS_NAMES[status]}, {self.store.num_instances[row]} instance(s)"
+            if not np.isnan(conf):
+                text += f"\nAvg. confidence: {conf:.2f}"
+            if self.store.cluster_size[row] > 1:
+                rep = self.store.cluster[row]
+                text += f"\nNear-duplicate cluster of {self.store.cluster_size[row]}"
+                if rep != row:
+                    text += f" (representative: {self.names[rep]})"
+            return text
+        if role == self.StatusRole:
+            return status
+        if role == self.ConfidenceRole:
+            return None if np.isnan(conf) else conf
+        return None
+
+    def source_row(self, view_row):
+        return int(self._order[view_row])
+
+    def view_row(self, source_row):
+        """View row of an image index, or -1 if it is filtered out"""
+        if not (0 <= source_row < len(self._view_row)):
+            return -1
+        return int(self._view_row[source_row])
+
+    def refresh_row(self, source_row):
+        """Drop the cached status of an image and repaint its row"""
+        self.store.invalidate(source_row)
+        row = self.view_row(source_row)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def set_filter(self, mode, name_filter=None):
+        self.filter_mode = mode
+        if name_filter is not None:
+            self.name_filter = name_filter
+        self._reorder()
+
+    def set_sort(self, key, order=Qt.AscendingOrder):
+        self.sort_key = key
+        self.sort_order = order
+        self._reorder()
+
+    def _reorder(self):
+        self.layoutAboutToBeChanged.emit()
+        self._rebuild_order()
+        self.layoutChanged.emit()
+
+    def _rebuild_order(self):
+        n = len(self.store)
+        rows = np.arange(n, dtype=np.int64)
+        needs_status = (
+            self.filter_mode not in (self.FILTER_ALL, self.FILTER_REPRESENTATIVES, self.FILTER_SELECTED)
+            or self.sort_key != self.SORT_NAME
+        )
+        if needs_status:
+            self.store.ensure_all()
+
+        status = self.store.status
+        if self.filter_mode == self.FILTER_UNLABELED:
+            rows = rows[status == UNLABELED]
+        elif self.filter_mode == self.FILTER_PREDICTED:
+            rows = rows[status == PREDICTED]
+        elif self.filter_mode == self.FILTER_REVIEWED:
+            rows = rows[status == REVIEWED]
+        elif self.filter_mode == self.FILTER_LOW_CONF:
+            rows = rows[self.store.confidence < self.LOW_CONFIDENCE]
+        elif self.filter_mode == self.FILTER_REPRESENTATIVES:
+            rows = rows[self.store.cluster == rows]
+        elif self.filter_mode == self.FILTER_SELECTED:
+            rows = rows[self.store.selected]
+
+        if self.name_filter:
+            needle = self.name_filter.lower()
+            keep = np.fromiter((needle in self.names[r].lower() for r in rows), dtype=bool, count=len(rows))
+            rows = rows[keep]
+
+        if self.sort_key == self.SORT_STATUS:
+            rows = rows[np.argsort(status[rows], kind='stable')]
+        elif self.sort_key == self.SORT_CONFIDENCE:
+            # Unlabeled images (NaN) always go last.
+            conf = self.store.confidence[rows]
+            key = np.where(np.isnan(conf), np.inf, conf)
+            if self.sort_order == Qt.DescendingOrder:
+                key = np.where(np.isnan(conf), np.inf, -conf)
+            rows = rows[np.argsort(key, kind='stable')]
+        if self.sort_order == Qt.DescendingOrder and self.sort_key != self.SORT_CONFIDENCE:
+            rows = rows[::-1]
+
+        self._order = rows
+        self._view_row = np.full(n, -1, dtype=np.int64)
+        self._view_row[rows] = np.arange(len(rows), dtype=np.int64)
@@ -0,0 +1,115 @@
+import os
+
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+class FolderWatcher(QObject):
+    """Reports images that arrive in or are rewritten in a watched folder.
+
+    QFileSystemWatcher (inotify on Linux) only says that the folder
+    changed. Notifications are throttled to one check per CHECK_MS, which
+    lists the folder by name only: existing files are not stat'ed, so a
+    check stays cheap with thousands of images. New files are held back
+    until their size and mtime stop changing between two checks, so
+    files still being written are not picked up half-finished. Only a
+    notification that brings no new names (a rewrite in place) compares
+    the mtimes of the known files.
+    """
+
+    files_added = pyqtSignal(list)
+    files_changed = pyqtSignal(list)
+
+    CHECK_MS = 500
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.folder = None
+        self._known = {}
+        self._pending = {}
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(self.CHECK_MS)
+        self._timer.timeout.connect(self.check)
+        self._notified = False
+
+    def is_watching(self):
+        return self.folder is not None
+
+    def watch(self, folder, names):
+        """Start watching folder; names are the images already in the workspace"""
+        self.stop()
+        self.folder = folder
+        self._known = {}
+        names = set(names)
+        for entry in os.scandir(folder):
+            if entry.name in names:
+                self._known[entry.name] = self._signature(entry.path)
+        self._pending = {}
+        self._watcher.addPath(folder)
+
+    def stop(self):
+        if self.folder is not None:
+            self._watcher.removePath(self.folder)
+        self.folder = None
+        self._timer.stop()
+        self._pending = {}
+
+    @staticmethod
+    def _signature(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def _on_directory_changed(self, path):
+        self._notified = True
+        # Throttle rather than debounce: a steady stream of arrivals must not postpone checks forever.
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def check(self):
+        if self.folder is None:
+            return
+        notified, self._notified = self._notified, False
+        try:
+            names = [e.name for e in os.scandir(self.folder) if e.name.lower().endswith(IMAGE_EXTENSIONS)]
+        except OSError:
+            return
+        new_names = [n for n in names if n not in self._known and n not in self._pending]
+        for name in new_names:
+            self._pending[name] = self._signature(os.path.join(self.folder, name))
+
+        changed = []
+        if notified and not new_names:
+            present = set(names)
+            for name, signature in self._known.items():
+                if name not in present:
+                    continue
+                current = self._signature(os.path.join(self.folder, name))
+                if current is not None and current != signature:
+                    self._known[name] = current
+                    changed.append(os.path.join(self.folder, name))
+
+        added = []
+        for name in [n for n in self._pending if n not in new_names]:
+            current = self._signature(os.path.join(self.folder, name))
+            if current is None:
+                del self._pending[name]  # deleted before it settled
+            elif current == self._pending[name] and current[0] > 0:
+                del self._pending[name]
+                self._known[name] = current
+                added.append(os.path.join(self.folder, name))
+            else:
+                self._pending[name] = current
+
+        if self._pending:
+            self._timer.start()
+        if added:
+            self.files_added.emit(sorted(added))
+        if changed:
+            self.files_changed.emit(sorted(changed))
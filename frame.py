@@ -0,0 +1,102 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+from PyQt5.QtGui import QImage, QImageIOHandler, QImageReader
+
+from profiler import profiler
+
+
+def image_size(path):
+    """(width, height) of an image as cv2.imread decodes it, read from the file header only; None if unreadable"""
+    reader = QImageReader(path)
+    size = reader.size()
+    if not size.isValid():
+        return None
+    # cv2.imread applies the EXIF orientation, which may swap the sides.
+    if reader.transformation() & QImageIOHandler.TransformationRotate90:
+        size.transpose()
+    return size.width(), size.height()
+
+
+class Frame:
+    """One decoded image, shared by the predictors and the viewer.
+
+    bgr is the cv2 array and must not be modified: qimage() wraps the same
+    buffer without copying it.
+    """
+
+    def __init__(self, path, bgr):
+        self.path = path
+        self.bgr = bgr
+
+    @property
+    def width(self):
+        return self.bgr.shape[1]
+
+    @property
+    def height(self):
+        return self.bgr.shape[0]
+
+    def qimage(self):
+        """QImage over the BGR buffer (Qt reads the channels in that order, so nothing is converted)"""
+        image = QImage(self.bgr.data, self.width, self.height, self.bgr.strides[0], QImage.Format_BGR888)
+        # The QImage doesn't own the buffer; keep the array alive as long as the image.
+        image.frame = self
+        return image
+
+    @classmethod
+    def decode(cls, path):
+        with profiler.span("frame.decode"):
+            bgr = cv2.imread(path)
+        if bgr is None:
+            print(f"Error reading image {path}")
+            return None
+        return cls(path, bgr)
+
+
+class FrameCache:
+    """Decoded frames of the images on screen and next to it, by path.
+
+    Whichever needs the image first (viewer, pre-label, prefetch or
+    click-to-segment job) decodes it, and the others reuse the frame.
+    """
+
+    SIZE = 4
+
+    def __init__(self):
+        self._frames = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._frames
+
+    def get(self, path, keep=True):
+        """Frame of an image, decoded if it isn't cached (and then cached if keep), or None if unreadable"""
+        with self._lock:
+            frame = self._frames.get(path)
+            if frame is not None:
+                self._frames.move_to_end(path)
+                return frame
+        frame = Frame.decode(path)
+        if frame is not None and keep:
+            with self._lock:
+                self._frames[path] = frame
+                while len(self._frames) > self.SIZE:
+                    self._frames.popitem(last=False)
+        return frame
+
+    def peek(self, path):
+        """Cached frame of an image, or None; never decodes"""
+        with self._lock:
+            return self._frames.get(path)
+
+    def discard(self, path):
+        """Forget the frame of an image whose file changed"""
+        with self._lock:
+            self._frames.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
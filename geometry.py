@@ -0,0 +1,181 @@
+import numpy as np
+
+# Coordinates are kept as separate contiguous x / y columns: NumPy
+# arithmetic on (N, 2) arrays broadcasts over a length-2 inner axis and is
+# an order of magnitude slower.
+
+
+def _vertex_distances(xs, ys, px, py):
+    """Squared distances from (px, py) to the vertices (xs, ys)"""
+    dx = xs - px
+    dx *= dx
+    dy = ys - py
+    dy *= dy
+    dx += dy
+    return dx
+
+
+def _edge_distances(sx, sy, dx, dy, inv_len2, px, py):
+    """Squared distances from (px, py) to the segments s + t * d, t in [0, 1]"""
+    rx = px - sx
+    ry = py - sy
+    t = rx * dx
+    t += ry * dy
+    t *= inv_len2
+    np.clip(t, 0, 1, out=t)
+    rx -= t * dx
+    ry -= t * dy
+    rx *= rx
+    ry *= ry
+    rx += ry
+    return rx
+
+
+def _edge_arrays(xs, ys, prev):
+    """(start x, start y, delta x, delta y, 1 / squared length) of the edges prev -> i"""
+    sx, sy = xs[prev], ys[prev]
+    dx, dy = xs - sx, ys - sy
+    len2 = dx * dx + dy * dy
+    # Zero-length edges get t = 0, i.e. the distance to their start point.
+    inv_len2 = np.divide(1, len2, out=np.zeros_like(len2), where=len2 > 0)
+    return sx, sy, dx, dy, inv_len2
+
+
+def _within(d2, epsilon):
+    i = int(np.argmin(d2))
+    return i if d2[i] <= epsilon * epsilon else None
+
+
+def nearest_vertex(points, point, epsilon):
+    """Index of the vertex of an (N, 2) array nearest to point within epsilon, or None"""
+    if not len(points):
+        return None
+    return _within(_vertex_distances(points[:, 0], points[:, 1], point[0], point[1]), epsilon)
+
+
+def nearest_edge(points, point, epsilon):
+    """Index i of the edge (points[i - 1], points[i]) nearest to point within epsilon, or None"""
+    if not len(points):
+        return None
+    xs, ys = points[:, 0], points[:, 1]
+    edges = _edge_arrays(xs, ys, np.arange(len(points)) - 1)
+    return _within(_edge_distances(*edges, point[0], point[1]), epsilon)
+
+
+class ShapeGeometryIndex:
+    """Concatenated vertex and edge arrays of a list of shapes.
+
+    Answers "nearest vertex / edge within epsilon" across every shape with
+    one NumPy pass instead of a Python loop per shape and point. Like the
+    per-shape hover loop it replaces, the topmost (last) shape with a hit
+    wins, and within it the nearest vertex or edge. The arrays are rebuilt
+    only when the shape list or a shape's geometry changed, which is seen
+    from Shape.points_array() returning a new array.
+    """
+
+    def __init__(self):
+        self.shapes = None
+        self._arrays = None
+        self.sync([])
+
+    def sync(self, shapes):
+        arrays = [shape.points_array() for shape in shapes]
+        # The indexed shapes and arrays are kept, so an identity match can't be a recycled id.
+        if self.shapes is not None and len(shapes) == len(self.shapes) and all(
+            shape is known and array is known_array
+            for shape, known, array, known_array in zip(shapes, self.shapes, arrays, self._arrays)
+        ):
+            return
+        self.shapes = list(shapes)
+        self._arrays = arrays
+        counts = np.array([len(a) for a in arrays], dtype=np.int64)
+        vertices = np.concatenate(arrays) if arrays else np.zeros((0, 2), dtype=np.float32)
+        self.xs = np.ascontiguousarray(vertices[:, 0])
+        self.ys = np.ascontiguousarray(vertices[:, 1])
+        self.shape_index = np.repeat(np.arange(len(arrays), dtype=np.int32), counts)
+        offsets = np.cumsum(counts) - counts
+        self.local_index = (np.arange(len(vertices)) - np.repeat(offsets, counts)).astype(np.int32)
+        # Edge i of a shape runs from its vertex i - 1 (wrapping) to vertex i.
+        prev = np.arange(len(vertices)) - 1
+        first = self.local_index == 0
+        prev[first] = np.repeat(offsets + counts - 1, counts)[first]
+        self.edges = _edge_arrays(self.xs, self.ys, prev)
+
+    def _topmost(self, d2, epsilon):
+        hits = np.flatnonzero(d2 <= epsilon * epsilon)
+        if not len(hits):
+            return None, None
+        top = self.shape_index[hits].max()
+        hits = hits[self.shape_index[hits] == top]
+        best = hits[np.argmin(d2[hits])]
+        return self.shapes[top], int(self.local_index[best])
+
+    def nearest_vertex(self, shapes, point, epsilon):
+        """(shape, vertex index) of the topmost shape with a vertex within epsilon, or (None, None)"""
+        self.sync(shapes)
+        if not len(self.xs):
+            return None, None
+        return self._topmost(_vertex_distances(self.xs, self.ys, point.x(), point.y()), epsilon)
+
+    def nearest_edge(self, shapes, point, epsilon):
+        """(shape, index) of the topmost shape with an edge within epsilon, or (None, None).
+
+        The index is that of the edge's end vertex, i.e. where a new vertex
+        is inserted with Shape.insert_point.
+        """
+        self.sync(shapes)
+        if not len(self.xs):
+            return None, None
+        return self._topmost(_edge_distances(*self.edges, point.x(), point.y()), epsilon)
+
+
+if __name__ == "__main__":
+    # Hover query benchmark: python geometry.py
+    import sys
+    import time
+
+    from PyQt5.QtCore import QPointF
+    from PyQt5.QtWidgets import QApplication
+
+    from shape import Shape
+
+    app = QApplication(sys.argv)
+    rng = np.random.default_rng(0)
+    n_shapes, n_points = 1000, 100
+    shapes = []
+    for _ in range(n_shapes):
+        center = rng.uniform(0, 4000, 2)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, n_points))
+        radii = rng.uniform(20, 60, n_points)
+        polygon = center + np.stack([np.cos(angles), np.sin(angles)], axis=1) * radii[:, None]
+        shape = Shape(label="bench", shape_type="polygon")
+        shape.points = [QPointF(x, y) for x, y in polygon.tolist()]
+        shape.close()
+        shapes.append(shape)
+    queries = [QPointF(x, y) for x, y in rng.uniform(0, 4000, (200, 2)).tolist()]
+    epsilon = 11.0
+
+    def per_shape_loop(point):
+        for shape in reversed(shapes):
+            index = shape.nearest_vertex(point, epsilon)
+            if index is not None:
+                return shape, index
+        return None, None
+
+    index = ShapeGeometryIndex()
+    start = time.perf_counter()
+    index.sync(shapes)
+    print(f"{n_shapes * n_points} vertices, index build {(time.perf_counter() - start) * 1e3:.1f} ms")
+    for name, query in (
+        ("index vertex", lambda q: index.nearest_vertex(shapes, q, epsilon)),
+        ("index edge", lambda q: index.nearest_edge(shapes, q, epsilon)),
+        ("per-shape numpy", per_shape_loop),
+    ):
+        start = time.perf_counter()
+        results = [query(q) for q in queries]
+        elapsed = (time.perf_counter() - start) / len(queries)
+        print(f"{name:>18}: {elapsed * 1e3:8.3f} ms/query")
+        if name == "index vertex":
+            reference = results
+        elif "edge" not in name:
+            assert [(id(s), i) for s, i in results] == [(id(s), i) for s, i in reference]
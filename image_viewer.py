@@ -1,9 +1,13 @@
 import math
+import time
+from collections import deque
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtCore import Qt
 
 from shape import Shape
+from geometry import ShapeGeometryIndex
 import utils
+from profiler import profiler
 
 CURSOR_DEFAULT = QtCore.Qt.ArrowCursor
 CURSOR_POINT = QtCore.Qt.PointingHandCursor
@@ -11,11 +15,42 @@ CURSOR_DRAW = QtCore.Qt.CrossCursor
 CURSOR_MOVE = QtCore.Qt.ClosedHandCursor
 CURSOR_GRAB = QtCore.Qt.OpenHandCursor
 
+
+class _ScaleSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(int, float, QtGui.QImage)
+
+
+class _ScaleTask(QtCore.QRunnable):
+    """Smoothly resample an image for one zoom level off the GUI thread"""
+
+    def __init__(self, generation, image, scale):
+        super().__init__()
+        self.generation = generation
+        self.image = image
+        self.scale = scale
+        self.signals = _ScaleSignals()
+
+    def run(self):
+        size = QtCore.QSize(
+            max(1, round(self.image.width() * self.scale)),
+            max(1, round(self.image.height() * self.scale)),
+        )
+        scaled = self.image.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+        self.signals.done.emit(self.generation, self.scale, scaled)
+
+
 class ImageViewer(QtWidgets.QWidget):
     polygon_selected = QtCore.pyqtSignal(object)
     new_polygon_drawn = QtCore.pyqtSignal(object)
+    region_selected = QtCore.pyqtSignal(QtCore.QRectF)
+    prompt_changed = QtCore.pyqtSignal()
+
+    CREATE, EDIT, REGION, PROMPT = 0, 1, 2, 3
 
-    CREATE, EDIT = 0, 1
+    # Delay after the last zoom step before the smooth pixmap is rebuilt.
+    RESCALE_DELAY_MS = 150
+    # Zoom levels whose scaled pixmap would exceed this many pixels are not cached.
+    MAX_CACHED_PIXELS = 48 * 1024 * 1024
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -24,6 +59,8 @@ class ImageViewer(QtWidgets.QWidget):
         self.shapes = []
         self.shapes_backups = []
         self.num_backups = 10
+        # Copies of the shapes as last loaded or saved, to tell real edits apart.
+        self.saved_shapes = []
         self.current = None
         self.selected_shapes = []
         self.line = Shape()
@@ -39,11 +76,64 @@ class ImageViewer(QtWidgets.QWidget):
         self.h_shape = None
         self.h_vertex = None
         self.moving_shape = False
+        # Vertices and edges of all shapes, for hover and vertex insertion hit tests.
+        self.geometry = ShapeGeometryIndex()
+        # Image-space box being dragged in REGION mode.
+        self.region_start = None
+        self.region_rect = None
+        # PROMPT mode: [(point, is_positive)] clicks and the mask polygon they produced.
+        self.prompt_points = []
+        self.prompt_shape = None
 
         self.is_panning = False
         self.pan_start_pos = QtCore.QPoint()
         self.offset = QtCore.QPointF()
 
+        # Mouse moves are coalesced to at most one per display refresh.
+        self._pending_move = None
+        self._move_timer = QtCore.QTimer(self)
+        self._move_timer.setSingleShot(True)
+        self._move_timer.timeout.connect(self._on_move_timer)
+        screen = QtGui.QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None else 0
+        self._move_timer.setInterval(max(1, int(1000 / (refresh_rate or 60))))
+
+        # Pre-scaled pixmap for the current zoom, so panning is a plain blit.
+        self._image = None
+        self._scaled_pixmap = None
+        self._scaled_scale = None
+        self._scale_generation = 0
+        self._scale_tasks = {}
+        self._rescale_timer = QtCore.QTimer(self)
+        self._rescale_timer.setSingleShot(True)
+        self._rescale_timer.setInterval(self.RESCALE_DELAY_MS)
+        self._rescale_timer.timeout.connect(self._start_rescale)
+
+        self.show_debug_overlay = False
+        self._frame_times = deque(maxlen=120)
+        self._overlay_timer = QtCore.QTimer(self)
+        self._overlay_timer.setInterval(500)
+        self._overlay_timer.timeout.connect(lambda: self.update(self._overlay_rect()))
+
+    def reset_shapes_history(self):
+        """Start the undo history from the current shapes, which are taken as saved"""
+        self.shapes_backups = []
+        self.store_shapes()
+        self.mark_saved()
+
+    def mark_saved(self):
+        self.saved_shapes = [shape.copy() for shape in self.shapes]
+
+    @property
+    def edited(self):
+        """Whether the shapes differ from when they were loaded or last saved"""
+        if len(self.shapes) != len(self.saved_shapes):
+            return True
+        return any(
+            shape.label != saved.label or shape.points != saved.points
+            for shape, saved in zip(self.shapes, self.saved_shapes)
+        )
+
     def store_shapes(self):
         shapes_backup = []
         for shape in self.shapes:
@@ -73,6 +163,45 @@ class ImageViewer(QtWidgets.QWidget):
             self.un_highlight()
             self.deselect_shape()
 
+    def set_region_mode(self, enabled):
+        """In region mode a left-button drag selects a box and emits region_selected"""
+        self.mode = self.REGION if enabled else self.EDIT
+        self.region_start = None
+        self.region_rect = None
+        if enabled:
+            self.un_highlight()
+            self.deselect_shape()
+        self.update()
+
+    def selecting_region(self):
+        return self.mode == self.REGION
+
+    def set_prompt_mode(self, enabled):
+        """In prompt mode left / right clicks add positive / negative points and emit prompt_changed"""
+        self.mode = self.PROMPT if enabled else self.EDIT
+        self.clear_prompt()
+        if enabled:
+            self.un_highlight()
+            self.deselect_shape()
+
+    def prompting(self):
+        return self.mode == self.PROMPT
+
+    def clear_prompt(self):
+        self.prompt_points = []
+        self.prompt_shape = None
+        self.update()
+
+    def set_prompt_shape(self, shape):
+        """Preview of the mask for the current prompt points"""
+        self.prompt_shape = shape
+        self.update()
+
+    def take_prompt_shape(self):
+        shape = self.prompt_shape
+        self.clear_prompt()
+        return shape
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -81,10 +210,77 @@ class ImageViewer(QtWidgets.QWidget):
 
     def set_image(self, pixmap):
         self.pixmap = pixmap
+        self._image = None
+        self._invalidate_scaled_pixmap()
+        self.update()
+
+    def _invalidate_scaled_pixmap(self):
+        self._scale_generation += 1
+        self._scaled_pixmap = None
+        self._scaled_scale = None
+
+    def _schedule_rescale(self):
+        """Rebuild the cached pixmap once the zoom has settled"""
+        if self.pixmap.isNull() or self._scaled_scale == self.scale:
+            return
+        self._invalidate_scaled_pixmap()
+        if self.pixmap.width() * self.pixmap.height() * self.scale * self.scale > self.MAX_CACHED_PIXELS:
+            return
+        self._rescale_timer.start()
+
+    def _start_rescale(self):
+        if self.pixmap.isNull():
+            return
+        if self._image is None:
+            self._image = self.pixmap.toImage()
+        task = _ScaleTask(self._scale_generation, self._image, self.scale)
+        task.signals.done.connect(self._on_rescaled)
+        self._scale_tasks[task.generation] = task
+        QtCore.QThreadPool.globalInstance().start(task)
+
+    def _on_rescaled(self, generation, scale, image):
+        self._scale_tasks.pop(generation, None)
+        if generation != self._scale_generation or scale != self.scale:
+            return
+        self._scaled_pixmap = QtGui.QPixmap.fromImage(image)
+        self._scaled_scale = scale
         self.update()
 
+    def rescale_pending(self):
+        return self._scaled_scale != self.scale and (
+            self._rescale_timer.isActive() or self._scale_generation in self._scale_tasks
+        )
+
+    def set_debug_overlay(self, enabled):
+        self.show_debug_overlay = enabled
+        self._frame_times.clear()
+        if enabled:
+            self._overlay_timer.start()
+        else:
+            self._overlay_timer.stop()
+        self.update()
+
+    def _overlay_rect(self):
+        return QtCore.QRect(0, 0, 330, 44)
+
+    def _paint_debug_overlay(self, p):
+        times = sorted(self._frame_times)
+        if times:
+            mean = sum(times) / len(times)
+            p95 = times[min(len(times) - 1, int(len(times) * 0.95))]
+            text = f"frame {mean:.2f} ms avg / {p95:.2f} ms p95 / {times[-1]:.2f} ms max"
+        else:
+            text = "frame -"
+        cache = "cached" if self._scaled_scale == self.scale else ("pending" if self.rescale_pending() else "none")
+        text += f"\nscale {self.scale:.3f}, pixmap cache: {cache}"
+        rect = self._overlay_rect()
+        p.fillRect(rect, QtGui.QColor(0, 0, 0, 160))
+        p.setPen(QtGui.QColor(255, 255, 255))
+        p.drawText(rect.adjusted(6, 4, -6, -4), Qt.AlignLeft | Qt.AlignTop, text)
+
     def clear_polygons(self):
         self.shapes = []
+        self.saved_shapes = []
         self.update()
 
     def find_shape(self, point):
@@ -102,37 +298,94 @@ class ImageViewer(QtWidgets.QWidget):
             if shape not in self.selected_shapes:
                 self.selected_shapes.append(shape)
             self.polygon_selected.emit(shape)
-        
-        self.update()
+            self.update_shapes(shape)
 
     def deselect_shape(self):
-        for shape in self.selected_shapes:
+        deselected = self.selected_shapes
+        for shape in deselected:
             shape.selected = False
         self.selected_shapes = []
         self.polygon_selected.emit(None)
-        self.update()
+        self.update_shapes(*deselected)
+
+    def shape_screen_rect(self, shape):
+        """Widget-space rectangle covering everything paint() may draw for a shape"""
+        if not shape.points:
+            return QtCore.QRect()
+        bbox = shape.cached_bounding_rect()
+        rect = QtCore.QRectF(
+            bbox.topLeft() * self.scale + self.offset,
+            bbox.bottomRight() * self.scale + self.offset,
+        )
+        # Largest vertex handle (NEAR_VERTEX highlight) plus the pen.
+        margin = Shape.point_size * 4 + Shape.line_width + 2
+        return rect.adjusted(-margin, -margin, margin, margin).toAlignedRect()
+
+    def update_shapes(self, *shapes):
+        """Repaint only the screen area covered by the given shapes"""
+        dirty = QtCore.QRect()
+        for shape in shapes:
+            if shape is not None:
+                dirty = dirty.united(self.shape_screen_rect(shape))
+        if not dirty.isEmpty():
+            self.update(dirty)
 
     def paintEvent(self, event):
         if self.pixmap.isNull():
             return
+        start = time.perf_counter()
+        with profiler.span("viewer.paint"):
+            self._paint(event)
+        if self.show_debug_overlay:
+            self._frame_times.append((time.perf_counter() - start) * 1000.0)
+
+    def _paint(self, event):
         p = self._painter
         p.begin(self)
         p.setRenderHint(QtGui.QPainter.Antialiasing)
-        p.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
+
+        if self._scaled_scale == self.scale:
+            # Cached pixmap already at screen resolution: a plain blit.
+            p.drawPixmap(QtCore.QPointF(self.offset), self._scaled_pixmap)
+        elif not self.rescale_pending():
+            p.setRenderHint(QtGui.QPainter.SmoothPixmapTransform)
 
         p.translate(self.offset)
         p.scale(self.scale, self.scale)
 
-        p.drawPixmap(0, 0, self.pixmap)
+        if self._scaled_scale != self.scale:
+            # Fast-transform preview while the smooth pixmap is being rebuilt.
+            p.drawPixmap(0, 0, self.pixmap)
 
         Shape.scale = self.scale
+        visible = self.image_rect_for(event.rect())
+        margin = Shape.point_size * 4 / self.scale
         for shape in self.shapes:
-            shape.paint(p)
+            if shape.selected or shape.intersects_rect(visible, margin):
+                shape.paint(p)
 
         if self.current:
             self.current.paint(p)
             self.line.paint(p)
 
+        if self.prompt_shape is not None:
+            self.prompt_shape.paint(p)
+        radius = Shape.point_size / self.scale
+        for point, positive in self.prompt_points:
+            p.setPen(QtGui.QPen(QtGui.QColor(255, 255, 255), 1 / self.scale))
+            p.setBrush(QtGui.QColor(0, 200, 0) if positive else QtGui.QColor(220, 0, 0))
+            p.drawEllipse(point, radius, radius)
+
+        if self.region_rect is not None:
+            pen = QtGui.QPen(QtGui.QColor(255, 255, 0), 1.5 / self.scale, Qt.DashLine)
+            p.setPen(pen)
+            p.setBrush(QtGui.QColor(255, 255, 0, 40))
+            p.drawRect(self.region_rect)
+
+        if self.show_debug_overlay:
+            p.resetTransform()
+            self._paint_debug_overlay(p)
+
         p.end()
 
     def wheelEvent(self, event: QtGui.QWheelEvent):
@@ -149,13 +402,24 @@ class ImageViewer(QtWidgets.QWidget):
         delta_pos = new_pos - old_pos
         self.offset += delta_pos * self.scale
         
+        self._schedule_rescale()
         self.update()
 
     def mousePressEvent(self, ev: QtGui.QMouseEvent):
+        self.flush_mouse_move()
         pos = self.transform_pos(ev.pos())
 
+        if self.prompting() and ev.button() in (Qt.LeftButton, Qt.RightButton):
+            self.prompt_points.append((pos, ev.button() == Qt.LeftButton))
+            self.update()
+            self.prompt_changed.emit()
+            return
+
         if ev.button() == Qt.LeftButton:
-            if self.drawing():
+            if self.selecting_region():
+                self.region_start = pos
+                self.region_rect = QtCore.QRectF(pos, pos)
+            elif self.drawing():
                 self.handle_drawing(pos)
             else:
                 if self.h_vertex is not None:
@@ -175,62 +439,137 @@ class ImageViewer(QtWidgets.QWidget):
             self.pan_start_pos = ev.pos()
 
     def mouseMoveEvent(self, ev: QtGui.QMouseEvent):
-        pos = self.transform_pos(ev.pos())
+        # Handle the first move right away, then at most one per refresh interval
+        # with the latest position; intermediate events are dropped.
+        if self._move_timer.isActive():
+            self._pending_move = (QtCore.QPoint(ev.pos()), ev.buttons())
+            return
+        self._move_timer.start()
+        self.handle_mouse_move(ev.pos(), ev.buttons())
+
+    def _on_move_timer(self):
+        if self._pending_move is not None:
+            self._move_timer.start()
+            self.flush_mouse_move()
+
+    def flush_mouse_move(self):
+        """Process a coalesced mouse move that is still waiting for the timer"""
+        if self._pending_move is not None:
+            widget_pos, buttons = self._pending_move
+            self._pending_move = None
+            self.handle_mouse_move(widget_pos, buttons)
+
+    def handle_mouse_move(self, widget_pos, buttons):
+        with profiler.span("viewer.mouse_move"):
+            self._handle_mouse_move(widget_pos, buttons)
+
+    def _handle_mouse_move(self, widget_pos, buttons):
+        pos = self.transform_pos(widget_pos)
 
         if self.is_panning:
-            delta = ev.pos() - self.pan_start_pos
+            delta = widget_pos - self.pan_start_pos
             self.offset += delta
-            self.pan_start_pos = ev.pos()
+            self.pan_start_pos = widget_pos
             self.update()
             return
 
+        if self.region_start is not None:
+            self.region_rect = QtCore.QRectF(self.region_start, pos).normalized()
+            self.update()
+            return
+
+        if self.selecting_region() or self.prompting():
+            return
+
         if self.drawing() and self.current:
             if self.close_enough(pos, self.current.points[0]):
                 pos = self.current.points[0]
+            old_line = self.shape_screen_rect(self.line)
             self.line.points = [self.current.points[-1], pos]
-            self.update()
+            self.update(old_line.united(self.shape_screen_rect(self.line)))
             return
 
         if self.editing():
-            if self.h_vertex is not None and (ev.buttons() & Qt.LeftButton):
+            if self.h_vertex is not None and (buttons & Qt.LeftButton):
+                old_rect = self.shape_screen_rect(self.h_shape)
                 self.h_shape.move_vertex_by(self.h_vertex, pos - self.prev_point)
                 self.prev_point = pos
-                self.update()
+                self.update(old_rect.united(self.shape_screen_rect(self.h_shape)))
                 return
             
-            if self.selected_shapes and (ev.buttons() & Qt.LeftButton):
+            if self.selected_shapes and (buttons & Qt.LeftButton):
+                dirty = QtCore.QRect()
+                for shape in self.selected_shapes:
+                    dirty = dirty.united(self.shape_screen_rect(shape))
                 dp = pos - self.prev_point
                 for shape in self.selected_shapes:
                     shape.move_by(dp)
+                    dirty = dirty.united(self.shape_screen_rect(shape))
                 self.prev_point = pos
-                self.update()
+                self.update(dirty)
                 return
 
         # Hover logic
-        self.un_highlight()
-        for shape in reversed(self.shapes):
-            index = shape.nearest_vertex(pos, self.epsilon / self.scale)
-            if index is not None:
-                self.h_shape = shape
-                self.h_vertex = index
-                shape.highlight_vertex(index, Shape.MOVE_VERTEX)
-                self.update()
-                break
-        else: # if no vertex found, check for shape
-            for shape in reversed(self.shapes):
-                if shape.contains_point(pos):
-                    self.h_shape = shape
-                    self.update()
-                    break
+        h_shape, h_vertex = self.geometry.nearest_vertex(self.shapes, pos, self.epsilon / self.scale)
+        if h_shape is None: # if no vertex found, check for shape
+            h_shape = self.find_shape(pos)
+        self.set_highlight(h_shape, h_vertex)
+
+    def set_highlight(self, shape, vertex):
+        """Change the hovered shape/vertex, repainting only if the drawing changes"""
+        if shape is self.h_shape and vertex == self.h_vertex:
+            return
+        old_shape, old_vertex = self.h_shape, self.h_vertex
+        if old_shape is not None:
+            old_shape.highlight_clear()
+        self.h_shape = shape
+        self.h_vertex = vertex
+        if shape is not None and vertex is not None:
+            shape.highlight_vertex(vertex, Shape.MOVE_VERTEX)
+        # Hovering a shape body does not change how it is drawn; only vertex highlights do.
+        dirty = []
+        if old_vertex is not None:
+            dirty.append(old_shape)
+        if vertex is not None:
+            dirty.append(shape)
+        self.update_shapes(*dirty)
 
     def mouseReleaseEvent(self, ev: QtGui.QMouseEvent):
+        self.flush_mouse_move()
         if ev.button() == Qt.MidButton:
             self.is_panning = False
+
+        if ev.button() == Qt.LeftButton and self.region_start is not None:
+            rect = self.region_rect
+            self.region_start = None
+            self.region_rect = None
+            self.update()
+            # A plain click (box smaller than the hit tolerance) selects nothing.
+            if min(rect.width(), rect.height()) * self.scale >= self.epsilon:
+                self.region_selected.emit(rect)
+            return
         
         if ev.button() == Qt.LeftButton and self.moving_shape:
             self.store_shapes()
             self.moving_shape = False
 
+    def mouseDoubleClickEvent(self, ev: QtGui.QMouseEvent):
+        if ev.button() != Qt.LeftButton or not self.editing():
+            return
+        self.flush_mouse_move()
+        pos = self.transform_pos(ev.pos())
+        epsilon = self.epsilon / self.scale
+        if self.geometry.nearest_vertex(self.shapes, pos, epsilon)[0] is not None:
+            return
+        # Double-clicking an edge inserts a vertex there.
+        shape, index = self.geometry.nearest_edge(self.shapes, pos, epsilon)
+        if shape is None or shape.shape_type != "polygon":
+            return
+        shape.insert_point(index, pos)
+        self.select_shape(shape)
+        self.set_highlight(shape, index)
+        self.store_shapes()
+
     def handle_drawing(self, pos):
         if self.current is None:
             self.current = Shape(shape_type='polygon')
@@ -252,19 +591,22 @@ class ImageViewer(QtWidgets.QWidget):
     def transform_pos(self, point):
         return (point - self.offset) / self.scale
 
+    def image_rect_for(self, widget_rect):
+        """Map a widget-space rectangle to image coordinates"""
+        top_left = self.transform_pos(QtCore.QPointF(widget_rect.topLeft()))
+        bottom_right = self.transform_pos(QtCore.QPointF(widget_rect.bottomRight()) + QtCore.QPointF(1, 1))
+        return QtCore.QRectF(top_left, bottom_right)
+
     def fit_to_window(self):
         if self.pixmap.isNull():
             return
         self.scale = min(self.width() / self.pixmap.width(), self.height() / self.pixmap.height())
         self.offset = QtCore.QPointF()
+        self._schedule_rescale()
         self.update()
 
     def un_highlight(self):
-        if self.h_shape:
-            self.h_shape.highlight_clear()
-        self.h_shape = None
-        self.h_vertex = None
-        self.update()
+        self.set_highlight(None, None)
 
     def set_draw_mode(self, enabled):
         self.set_editing(not enabled)
@@ -0,0 +1,90 @@
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class InstanceListModel(QAbstractListModel):
+    """Instances of the current image, keyed by the stable `Shape.id`.
+
+    The model shares the viewer's shape list. Changes are announced with
+    row-level insert/remove/update notifications, so editing one polygon only
+    repaints its own row, and shape -> row lookups are O(1).
+    """
+
+    ShapeRole = Qt.UserRole
+
+    def __init__(self, color_for_label=None, parent=None):
+        super().__init__(parent)
+        self._shapes = []
+        self._row_of = {}
+        self.color_for_label = color_for_label
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._shapes)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._shapes):
+            return None
+        shape = self._shapes[index.row()]
+        if role == Qt.DisplayRole:
+            score_text = f"({shape.score:.2f})" if shape.score is not None else ""
+            return f"[{index.row()}] {shape.label} {score_text}"
+        if role == Qt.ForegroundRole and self.color_for_label is not None:
+            return self.color_for_label(shape.label)
+        if role == self.ShapeRole:
+            return shape
+        return None
+
+    def shape_at(self, row):
+        return self._shapes[row]
+
+    def row_of(self, shape):
+        """Row of a shape, or -1 if it is not in the list"""
+        return self._row_of.get(shape.id, -1)
+
+    def _reindex(self, start=0):
+        for row in range(start, len(self._shapes)):
+            self._row_of[self._shapes[row].id] = row
+
+    def set_shapes(self, shapes):
+        """Attach to a new shape list (new image)"""
+        self.beginResetModel()
+        self._shapes = shapes
+        self._row_of = {}
+        self._reindex()
+        self.endResetModel()
+
+    def sync_shapes(self, shapes):
+        """Attach to a restored shape list (undo), touching only rows that differ"""
+        old = self._shapes
+        if len(old) != len(shapes) or any(a.id != b.id for a, b in zip(old, shapes)):
+            self.set_shapes(shapes)
+            return
+        self._shapes = shapes
+        for row, (a, b) in enumerate(zip(old, shapes)):
+            if a.label != b.label or a.score != b.score:
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+    def append_shape(self, shape):
+        row = len(self._shapes)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._shapes.append(shape)
+        self._row_of[shape.id] = row
+        self.endInsertRows()
+
+    def remove_shapes(self, shapes):
+        rows = sorted((row for row in map(self.row_of, shapes) if row >= 0), reverse=True)
+        for row in rows:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            del self._row_of[self._shapes[row].id]
+            del self._shapes[row]
+            self.endRemoveRows()
+        if rows:
+            self._reindex(rows[-1])
+
+    def update_shape(self, shape):
+        row = self.row_of(shape)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
@@ -0,0 +1,280 @@
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+import torch
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from profiler import profiler
+
+# Priority classes, highest first.
+PRIORITY_CURRENT, PRIORITY_PREFETCH, PRIORITY_PRELABEL, PRIORITY_TRAINING, PRIORITY_EXPORT = range(5)
+PRIORITY_NAMES = ["Current Image", "Prefetch", "Pre-label", "Training", "Export"]
+
+QUEUED, RUNNING, DONE, CANCELLED = "queued", "running", "done", "cancelled"
+
+
+def default_thread_caps():
+    """Torch intra-op threads per priority class; low priorities leave cores to the UI"""
+    cores = os.cpu_count() or 1
+    return {
+        PRIORITY_CURRENT: cores,
+        PRIORITY_PREFETCH: 1,
+        PRIORITY_PRELABEL: max(1, cores // 2),
+        PRIORITY_TRAINING: max(1, cores - 1),
+        PRIORITY_EXPORT: 1,
+    }
+
+
+def _thread_cpu_time(thread_id):
+    """CPU seconds used by a thread so far, or None where the platform can't tell"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A unit of background work; fn(job) runs on a scheduler worker"""
+
+    def __init__(self, scheduler, fn, priority, name, key=None, on_done=None, on_error=None):
+        self.scheduler = scheduler
+        self.fn = fn
+        self.priority = priority
+        self.name = name
+        self.key = key
+        self.on_done = on_done
+        self.on_error = on_error
+        self.state = QUEUED
+        self.thread_id = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        self.scheduler._cancel(self)
+
+    def checkpoint(self):
+        """Yield point for long jobs: blocks while the job's class is paused, raises if cancelled"""
+        if self.cancelled:
+            raise JobCancelled()
+        self.scheduler._wait_until_allowed(self)
+        if self.cancelled:
+            raise JobCancelled()
+
+    def cpu_time(self):
+        return None if self.thread_id is None else _thread_cpu_time(self.thread_id)
+
+
+class JobScheduler(QObject):
+    """In-app background job queue with priority classes.
+
+    Workers always take the highest-priority queued job. Each class has a
+    concurrency limit (jobs that share the model run one at a time) and a
+    torch intra-op thread cap that is applied on the worker before the job
+    runs. Pre-labeling and lower classes don't start, and pause at their
+    next checkpoint, while the user has been editing within IDLE_DELAY
+    seconds; since a paused job keeps its worker, they never take more than
+    all workers but one. Long-running work that owns its own thread
+    (training) can register as an external job to be governed and accounted
+    the same way.
+    """
+
+    IDLE_DELAY = 1.5
+    PAUSABLE_FROM = PRIORITY_PRELABEL
+    MAX_RUNNING = {PRIORITY_PRELABEL: 1, PRIORITY_TRAINING: 1, PRIORITY_EXPORT: 1}
+    INTEROP_THREADS = 2
+
+    job_finished = pyqtSignal(object, object)
+    job_failed = pyqtSignal(object, str)
+
+    def __init__(self, workers=2, parent=None):
+        super().__init__(parent)
+        self.thread_caps = default_thread_caps()
+        self._cond = threading.Condition()
+        self._queues = [deque() for _ in PRIORITY_NAMES]
+        self._keys = {}
+        self._running = []
+        # Workers pausable jobs may hold, so one is always free for current-image work.
+        self._pausable_slots = max(1, workers - 1)
+        self._last_activity = 0.0
+        self._shutdown = False
+        try:
+            torch.set_num_interop_threads(self.INTEROP_THREADS)
+        except RuntimeError:
+            pass  # only settable before torch starts any inter-op work
+
+        self.job_finished.connect(self._deliver_result)
+        self.job_failed.connect(self._deliver_error)
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, priority, name, key=None, on_done=None, on_error=None):
+        """Queue fn(job). on_done(result) / on_error(message) are called on the GUI thread.
+
+        If a job with the same key is already queued, that job is returned
+        instead of queueing a duplicate.
+        """
+        with self._cond:
+            if key is not None and key in self._keys:
+                return self._keys[key]
+            job = Job(self, fn, priority, name, key, on_done, on_error)
+            self._queues[priority].append(job)
+            if key is not None:
+                self._keys[key] = job
+            self._cond.notify()
+            return job
+
+    def find(self, key):
+        with self._cond:
+            return self._keys.get(key)
+
+    def reprioritize(self, key, priority):
+        """Move a queued job to another priority class; False if it is not queued"""
+        with self._cond:
+            job = self._keys.get(key)
+            if job is None or job.state != QUEUED or job.priority == priority:
+                return False
+            self._queues[job.priority].remove(job)
+            job.priority = priority
+            self._queues[priority].appendleft(job)
+            self._cond.notify()
+            return True
+
+    def cancel_all(self, priority=None):
+        """Cancel queued and running jobs, optionally of one priority class only"""
+        with self._cond:
+            classes = range(len(self._queues)) if priority is None else [priority]
+            for p in classes:
+                for job in self._queues[p]:
+                    job.cancelled = True
+                    job.state = CANCELLED
+                    self._keys.pop(job.key, None)
+                self._queues[p].clear()
+            for job in self._running:
+                if priority is None or job.priority == priority:
+                    job.cancelled = True
+            self._cond.notify_all()
+
+    def _cancel(self, job):
+        with self._cond:
+            if job.state == QUEUED:
+                self._queues[job.priority].remove(job)
+                job.state = CANCELLED
+                self._keys.pop(job.key, None)
+            self._cond.notify_all()
+
+    def mark_user_activity(self):
+        """Called on editing input; pauses pausable classes for IDLE_DELAY seconds"""
+        self._last_activity = time.monotonic()
+
+    def user_active(self):
+        return time.monotonic() - self._last_activity < self.IDLE_DELAY
+
+    def _paused(self, priority):
+        return priority >= self.PAUSABLE_FROM and self.user_active()
+
+    def _wait_until_allowed(self, job):
+        while self._paused(job.priority) and not job.cancelled and not self._shutdown:
+            with self._cond:
+                self._cond.wait(max(0.05, self.IDLE_DELAY - (time.monotonic() - self._last_activity)))
+
+    def _next_job(self):
+        """Highest-priority runnable job, or (None, seconds to wait)"""
+        wait = None
+        for priority, queue in enumerate(self._queues):
+            if not queue:
+                continue
+            limit = self.MAX_RUNNING.get(priority)
+            if limit is not None and sum(1 for j in self._running if j.priority == priority) >= limit:
+                continue
+            if priority >= self.PAUSABLE_FROM and self._pausable_slots <= sum(
+                1 for j in self._running if j.fn is not None and j.priority >= self.PAUSABLE_FROM
+            ):
+                continue
+            if self._paused(priority):
+                wait = max(0.05, self.IDLE_DELAY - (time.monotonic() - self._last_activity))
+                continue
+            return queue.popleft(), None
+        return None, wait
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._shutdown:
+                        return
+                    job, wait = self._next_job()
+                    if job is not None:
+                        break
+                    self._cond.wait(wait)
+                self._keys.pop(job.key, None)
+                job.state = RUNNING
+                job.thread_id = threading.get_ident()
+                self._running.append(job)
+            self._run(job)
+
+    def _run(self, job):
+        # The intra-op cap is per calling thread with torch's OpenMP backend.
+        torch.set_num_threads(self.thread_caps[job.priority])
+        try:
+            with profiler.span(f"job.{PRIORITY_NAMES[job.priority]}"):
+                result = job.fn(job)
+        except JobCancelled:
+            job.state = CANCELLED
+        except Exception:
+            job.state = DONE
+            self.job_failed.emit(job, traceback.format_exc())
+        else:
+            job.state = CANCELLED if job.cancelled else DONE
+            if not job.cancelled:
+                self.job_finished.emit(job, result)
+        finally:
+            with self._cond:
+                self._running.remove(job)
+                self._cond.notify_all()
+
+    def _deliver_result(self, job, result):
+        if job.on_done is not None and not job.cancelled:
+            job.on_done(result)
+
+    def _deliver_error(self, job, message):
+        print(f"Job '{job.name}' failed:\n{message}")
+        if job.on_error is not None:
+            job.on_error(message)
+
+    def register_external(self, name, priority):
+        """Account and govern work running on its own thread (call from that thread)"""
+        job = Job(self, None, priority, name)
+        job.state = RUNNING
+        job.thread_id = threading.get_ident()
+        torch.set_num_threads(self.thread_caps[priority])
+        with self._cond:
+            self._running.append(job)
+        return job
+
+    def unregister_external(self, job):
+        with self._cond:
+            if job in self._running:
+                self._running.remove(job)
+            job.state = DONE
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """(queue depth per class, [(job, cpu seconds or None)] of running jobs)"""
+        with self._cond:
+            depths = [len(queue) for queue in self._queues]
+            running = list(self._running)
+        return depths, [(job, job.cpu_time()) for job in running]
+
+    def shutdown(self):
+        self.cancel_all()
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
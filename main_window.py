@@ -1,19 +1,45 @@
 import os
 import sys
+import time
 import shutil
-import cv2
+import numpy as np
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QAction, QFileDialog, 
-    QListWidget, QMessageBox, QDockWidget, QListWidgetItem, QInputDialog, QLabel, QMenu, QDialog, QDialogButtonBox
+    QListWidget, QMessageBox, QDockWidget, QInputDialog, QLabel, QMenu, QDialog, QDialogButtonBox,
+    QListView, QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QLineEdit, QCheckBox, QStackedWidget
 )
 from PyQt5.QtGui import QPixmap, QIcon, QColor
-from PyQt5.QtCore import Qt, QPointF
+from PyQt5.QtCore import Qt, QPointF, QRectF, QTimer, QEvent
 from yolo_predictor import RealYOLOPredictor
+from promptable_segmenter import PromptableSegmenter, POSITIVE, NEGATIVE
 from image_viewer import ImageViewer
+from frame import FrameCache, image_size
 from shape import Shape
-from utils import load_yolo_labels, save_yolo_labels
+from utils import label_path_for, labels_dir_for, shapes_from_annotation, annotation_instances_from_shapes
+from annotation_format import annotation_path_for, AnnotationInstance, PROVENANCE_MODEL, PROVENANCE_MANUAL
+from annotation_store import AnnotationStore, store_path_for
 from training_dialog import TrainingDialog
-from training_thread import TrainingThread
+from dataset_builder import DatasetBuilder, dataset_dir_for
+from train_image_cache import TrainImageCache, train_cache_dir_for
+from training_rounds import TrainingRounds, MODE_INCREMENTAL, metrics_summary
+from job_scheduler import (
+    JobScheduler, PRIORITY_CURRENT, PRIORITY_PREFETCH, PRIORITY_PRELABEL, PRIORITY_TRAINING, PRIORITY_EXPORT,
+    PRIORITY_NAMES
+)
+from training_thread import TrainingThread, JobHistory, jobs_path_for
+from perf_dock import PerfDock
+from quantization import EVAL_SAMPLES, evaluate, format_report, sample_labeled_images
+from model_gate import compare_models, ground_truth, held_out_images, predictions_path_for
+from model_gate_dialog import ModelGateDialog
+from stats_dock import StatsDock
+from file_list_model import FileListModel, REVIEWED
+from folder_watcher import FolderWatcher
+from thumbnail_cache import ThumbnailCache, thumbnail_path_for
+from thumbnail_grid import ThumbnailGrid
+from instance_list_model import InstanceListModel
+from profiler import profiler
+from dedup import compute_hashes, cluster_hashes
+from embedding_store import EmbeddingStore, KCenterGreedy, embedding_dir_for
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -24,24 +50,66 @@ class MainWindow(QMainWindow):
         
         self.model = None
         self.model_path = None
+        self.segmenter = None
+        # Bumped per click-to-segment request so results of superseded clicks are dropped.
+        self.prompt_request = 0
         self.image_paths = []
+        self.image_folder = None
+        self.clusters = np.empty(0, dtype=np.int64)
+        self.annotation_store = None
+        self.thumbnail_cache = None
+        self.train_cache = None
+        self.train_cache_job = None
+        self.embedding_store = None
+        self.coreset = KCenterGreedy()
+        self.training_round = None
+        self.training_thread = None
+        self.job_history = None
+        self.scheduler = JobScheduler(parent=self)
+        # Bumped whenever a folder is opened so late job results of the previous one are dropped.
+        self.workspace_generation = 0
+        self.pending_prelabels = set()
+        # Decoded frames shared by the viewer and the jobs of the images around the current one.
+        self.frames = FrameCache()
+        self._job_cpu = {}
+        self._job_status_time = time.monotonic()
         self.current_image_index = -1
         self.class_names = []
+        self.class_index = {}
         self.color_map = []
 
         self.viewer = ImageViewer(self)
-        self.setCentralWidget(self.viewer)
+        # The viewer and the thumbnail grid share the central area.
+        self.central_stack = QStackedWidget()
+        self.central_stack.addWidget(self.viewer)
+        self.setCentralWidget(self.central_stack)
         
         self.create_actions()
         self.create_tool_bar()
         self.create_docks()
         self.create_status_bar()
+
+        self.thumbnail_grid = ThumbnailGrid(self.annotations_for, self.color_for_class)
+        self.thumbnail_grid.setModel(self.file_list_model)
+        self.thumbnail_grid.activated.connect(self.on_thumbnail_activated)
+        self.central_stack.addWidget(self.thumbnail_grid)
         
         self.set_actions_enabled(False)
         self.load_model_action.setEnabled(True)
 
+        self.viewer.installEventFilter(self)
+        self.job_status_timer = QTimer(self)
+        self.job_status_timer.timeout.connect(self.update_job_status)
+        self.job_status_timer.start(1000)
+
         self.viewer.polygon_selected.connect(self.on_polygon_selected)
         self.viewer.new_polygon_drawn.connect(self.on_new_polygon_drawn)
+        self.viewer.region_selected.connect(self.resegment_region)
+        self.viewer.prompt_changed.connect(self.on_prompt_changed)
+
+        self.folder_watcher = FolderWatcher(self)
+        self.folder_watcher.files_added.connect(self.on_watched_files_added)
+        self.folder_watcher.files_changed.connect(self.on_watched_files_changed)
 
     def create_actions(self):
         self.load_model_action = QAction(QIcon.fromTheme("document-open"), "1. Load Model (.pt)", self)
@@ -50,6 +118,13 @@ class MainWindow(QMainWindow):
         self.open_folder_action = QAction(QIcon.fromTheme("folder-open"), "2. Open Image Folder", self)
         self.open_folder_action.triggered.connect(self.open_folder)
 
+        self.watch_folder_action = QAction(QIcon.fromTheme("view-refresh"), "Watch Folder", self)
+        self.watch_folder_action.setCheckable(True)
+        self.watch_folder_action.toggled.connect(self.toggle_watch_folder)
+        self.watch_folder_action.setToolTip(
+            "Add images to the workspace as they arrive in the folder and pre-label them in the background."
+        )
+
         self.export_action = QAction(QIcon.fromTheme("document-send"), "3. Export", self)
         self.export_action.triggered.connect(self.export_files)
 
@@ -57,7 +132,7 @@ class MainWindow(QMainWindow):
         self.train_action.triggered.connect(self.open_training_dialog)
         
         self.save_labels_action = QAction(QIcon.fromTheme("document-save"), "Save Labels (Ctrl+S)", self)
-        self.save_labels_action.triggered.connect(self.save_current_labels)
+        self.save_labels_action.triggered.connect(lambda: self.save_current_labels(reviewed=True))
         self.save_labels_action.setShortcut("Ctrl+S")
         
         self.prev_image_action = QAction(QIcon.fromTheme("go-previous"), "Previous Image (A)", self)
@@ -73,6 +148,36 @@ class MainWindow(QMainWindow):
         self.draw_poly_action.triggered.connect(self.toggle_draw_mode)
         self.draw_poly_action.setShortcut("W")
         
+        self.region_action = QAction(QIcon.fromTheme("edit-select"), "Re-segment Region (R)", self)
+        self.region_action.setCheckable(True)
+        self.region_action.triggered.connect(self.toggle_region_mode)
+        self.region_action.setShortcut("R")
+        self.region_action.setToolTip(
+            "Drag a box to run the model on that crop only and replace the instances inside it."
+        )
+
+        self.prompt_action = QAction(QIcon.fromTheme("edit-find"), "Click to Segment (S)", self)
+        self.prompt_action.setCheckable(True)
+        self.prompt_action.triggered.connect(self.toggle_prompt_mode)
+        self.prompt_action.setShortcut("S")
+        self.prompt_action.setToolTip(
+            "Left-click inside an object (right-click to exclude), Enter to accept, Esc to clear."
+        )
+
+        self.load_segmenter_action = QAction("Load Segment Model (.pt)", self)
+        self.load_segmenter_action.triggered.connect(self.load_segmenter)
+        self.load_segmenter_action.setToolTip(
+            "Load a local promptable segmentation checkpoint (e.g. mobile_sam.pt) for Click to Segment."
+        )
+
+        self.grid_action = QAction(QIcon.fromTheme("view-grid"), "Grid View (G)", self)
+        self.grid_action.setCheckable(True)
+        self.grid_action.toggled.connect(self.toggle_grid_view)
+        self.grid_action.setShortcut("G")
+        self.grid_action.setToolTip(
+            "Show thumbnails of the listed images with their polygons; double-click one to open it."
+        )
+
         self.fit_window_action = QAction(QIcon.fromTheme("zoom-fit-best"), "Fit to Window", self)
         self.fit_window_action.triggered.connect(self.viewer.fit_to_window)
 
@@ -80,12 +185,60 @@ class MainWindow(QMainWindow):
         self.undo_action.triggered.connect(self.undo_shape)
         self.undo_action.setShortcut("Ctrl+Z")
 
+        self.cancel_training_action = QAction(QIcon.fromTheme("process-stop"), "Cancel Training", self)
+        self.cancel_training_action.triggered.connect(self.cancel_training)
+        self.cancel_training_action.setEnabled(False)
+
+        self.keep_masks_action = QAction("Keep Source Masks", self)
+        self.keep_masks_action.setCheckable(True)
+        self.keep_masks_action.setToolTip(
+            "Store the model's RLE-encoded source masks alongside pre-labeled polygons."
+        )
+
+        self.int8_action = QAction("INT8 CPU Inference", self)
+        self.int8_action.setCheckable(True)
+        self.int8_action.toggled.connect(self.apply_inference_mode)
+        self.int8_action.setToolTip(
+            "Pre-label with an INT8-quantized copy of the model on the CPU: faster, slightly different masks."
+        )
+
+        self.evaluate_int8_action = QAction("Evaluate INT8", self)
+        self.evaluate_int8_action.triggered.connect(self.evaluate_int8)
+        self.evaluate_int8_action.setToolTip(
+            "Compare latency and masks of the float and INT8 models on a sample of labeled images."
+        )
+
+        self.dedup_action = QAction("Skip Near-Duplicate Inference", self)
+        self.dedup_action.setCheckable(True)
+        self.dedup_action.setChecked(True)
+        self.dedup_action.setToolTip(
+            "Only pre-label one representative of each cluster of near-duplicate images."
+        )
+
+        self.copy_cluster_labels_action = QAction("Copy Labels to Cluster", self)
+        self.copy_cluster_labels_action.triggered.connect(self.copy_labels_to_cluster)
+        self.copy_cluster_labels_action.setToolTip(
+            "Copy the current image's labels to its unreviewed near-duplicates."
+        )
+
+        self.select_batch_action = QAction("Select Diverse Batch", self)
+        self.select_batch_action.triggered.connect(self.select_diverse_batch)
+        self.select_batch_action.setToolTip(
+            "Pick unreviewed images that best cover the data, using backbone embeddings."
+        )
+
+        self.debug_overlay_action = QAction("Debug Overlay", self)
+        self.debug_overlay_action.setCheckable(True)
+        self.debug_overlay_action.toggled.connect(self.viewer.set_debug_overlay)
+
     def create_tool_bar(self):
         tool_bar = self.addToolBar("Main ToolBar")
         tool_bar.addAction(self.load_model_action)
         tool_bar.addAction(self.open_folder_action)
+        tool_bar.addAction(self.watch_folder_action)
         tool_bar.addAction(self.export_action)
         tool_bar.addAction(self.train_action)
+        tool_bar.addAction(self.cancel_training_action)
         tool_bar.addSeparator()
         tool_bar.addAction(self.save_labels_action)
         tool_bar.addAction(self.undo_action)
@@ -94,13 +247,54 @@ class MainWindow(QMainWindow):
         tool_bar.addAction(self.next_image_action)
         tool_bar.addSeparator()
         tool_bar.addAction(self.draw_poly_action)
+        tool_bar.addAction(self.region_action)
+        tool_bar.addAction(self.prompt_action)
+        tool_bar.addAction(self.grid_action)
         tool_bar.addAction(self.fit_window_action)
+        tool_bar.addSeparator()
+        tool_bar.addAction(self.load_segmenter_action)
+        tool_bar.addAction(self.keep_masks_action)
+        tool_bar.addAction(self.int8_action)
+        tool_bar.addAction(self.evaluate_int8_action)
+        tool_bar.addAction(self.dedup_action)
+        tool_bar.addAction(self.copy_cluster_labels_action)
+        tool_bar.addAction(self.select_batch_action)
+        tool_bar.addSeparator()
+        tool_bar.addAction(self.debug_overlay_action)
+        self.perf_tool_bar = tool_bar
 
     def create_docks(self):
         file_list_dock = QDockWidget("File List", self)
-        self.file_list_widget = QListWidget()
-        self.file_list_widget.itemClicked.connect(self.on_file_item_clicked)
-        file_list_dock.setWidget(self.file_list_widget)
+        file_list_container = QWidget()
+        file_list_layout = QVBoxLayout(file_list_container)
+        file_list_layout.setContentsMargins(0, 0, 0, 0)
+
+        filter_layout = QHBoxLayout()
+        self.file_filter_combo = QComboBox()
+        self.file_filter_combo.addItems(FileListModel.FILTER_NAMES)
+        self.file_filter_combo.currentIndexChanged.connect(self.on_file_filter_changed)
+        self.file_sort_combo = QComboBox()
+        self.file_sort_combo.addItems(FileListModel.SORT_NAMES)
+        self.file_sort_combo.currentIndexChanged.connect(self.on_file_sort_changed)
+        self.file_sort_desc_checkbox = QCheckBox("Desc")
+        self.file_sort_desc_checkbox.toggled.connect(self.on_file_sort_changed)
+        filter_layout.addWidget(self.file_filter_combo)
+        filter_layout.addWidget(self.file_sort_combo)
+        filter_layout.addWidget(self.file_sort_desc_checkbox)
+        file_list_layout.addLayout(filter_layout)
+
+        self.file_search_edit = QLineEdit()
+        self.file_search_edit.setPlaceholderText("Filter by name...")
+        self.file_search_edit.textChanged.connect(self.on_file_filter_changed)
+        file_list_layout.addWidget(self.file_search_edit)
+
+        self.file_list_model = FileListModel(self)
+        self.file_list_view = QListView()
+        self.file_list_view.setUniformItemSizes(True)
+        self.file_list_view.setModel(self.file_list_model)
+        self.file_list_view.clicked.connect(self.on_file_index_clicked)
+        file_list_layout.addWidget(self.file_list_view)
+        file_list_dock.setWidget(file_list_container)
         file_list_dock.setFeatures(QDockWidget.DockWidgetMovable | QDockWidget.DockWidgetFloatable)
         self.addDockWidget(Qt.LeftDockWidgetArea, file_list_dock)
         
@@ -111,28 +305,51 @@ class MainWindow(QMainWindow):
         self.addDockWidget(Qt.LeftDockWidgetArea, class_list_dock)
 
         instance_list_dock = QDockWidget("Instance List", self)
-        self.instance_list_widget = QListWidget()
-        self.instance_list_widget.itemClicked.connect(self.on_instance_item_clicked)
-        self.instance_list_widget.itemDoubleClicked.connect(self.on_instance_double_clicked)
-        instance_list_dock.setWidget(self.instance_list_widget)
+        self.instance_list_model = InstanceListModel(self.color_for_label, self)
+        self.instance_list_view = QListView()
+        self.instance_list_view.setUniformItemSizes(True)
+        self.instance_list_view.setModel(self.instance_list_model)
+        self.instance_list_view.clicked.connect(self.on_instance_item_clicked)
+        self.instance_list_view.doubleClicked.connect(self.on_instance_double_clicked)
+        instance_list_dock.setWidget(self.instance_list_view)
         instance_list_dock.setFeatures(QDockWidget.DockWidgetMovable | QDockWidget.DockWidgetFloatable)
         self.addDockWidget(Qt.RightDockWidgetArea, instance_list_dock)
 
+        self.perf_dock = PerfDock(self)
+        self.addDockWidget(Qt.BottomDockWidgetArea, self.perf_dock)
+        self.perf_dock.hide()
+        self.perf_tool_bar.addAction(self.perf_dock.toggleViewAction())
+
+        self.stats_dock = StatsDock(lambda: (self.annotation_store, self.class_names, len(self.image_paths)), self)
+        self.stats_dock.rebuild_requested.connect(self.submit_stats_rebuild)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.stats_dock)
+        self.stats_dock.hide()
+        self.perf_tool_bar.addAction(self.stats_dock.toggleViewAction())
+
     def create_status_bar(self):
         self.statusBar().showMessage("Ready")
         self.conf_label = QLabel("Avg. Confidence: N/A")
         self.statusBar().addPermanentWidget(self.conf_label)
+        self.jobs_label = QLabel("Jobs: idle")
+        self.statusBar().addPermanentWidget(self.jobs_label)
 
     def set_actions_enabled(self, enabled):
         self.open_folder_action.setEnabled(enabled)
+        self.watch_folder_action.setEnabled(enabled)
         self.export_action.setEnabled(enabled)
         self.train_action.setEnabled(enabled)
         self.save_labels_action.setEnabled(enabled)
         self.prev_image_action.setEnabled(enabled)
         self.next_image_action.setEnabled(enabled)
         self.draw_poly_action.setEnabled(enabled)
+        self.region_action.setEnabled(enabled)
+        self.prompt_action.setEnabled(enabled)
+        self.grid_action.setEnabled(enabled)
         self.fit_window_action.setEnabled(enabled)
         self.undo_action.setEnabled(enabled)
+        self.copy_cluster_labels_action.setEnabled(enabled)
+        self.select_batch_action.setEnabled(enabled)
+        self.evaluate_int8_action.setEnabled(enabled)
 
     def load_model(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Load YOLO Model", "", "PyTorch Models (*.pt)")
@@ -140,8 +357,11 @@ class MainWindow(QMainWindow):
             try:
                 self.model_path = file_path
                 self.model = RealYOLOPredictor(self.model_path)
+                self.apply_inference_mode()
+                self.job_history = JobHistory(jobs_path_for(self.model_path))
                 class_map = self.model.get_class_names()
                 self.class_names = [class_map[i] for i in sorted(class_map.keys())]
+                self.class_index = {name: i for i, name in enumerate(self.class_names)}
                 self.class_list_widget.clear()
                 self.class_list_widget.addItems(self.class_names)
                 
@@ -161,18 +381,102 @@ class MainWindow(QMainWindow):
                 QMessageBox.critical(self, "Error", f"Failed to load model: {e}")
                 print(e)
 
+    def apply_inference_mode(self, *args):
+        """Switch the loaded model to INT8 CPU inference or back; the INT8 model is built in the background"""
+        model = self.model
+        enabled = self.int8_action.isChecked()
+        if model is None or model.is_quantized() == enabled:
+            return
+        if not enabled:
+            model.set_quantized(False)
+            return
+
+        def on_done(result):
+            if not self.int8_action.isChecked():
+                model.set_quantized(False)  # switched off while building
+            else:
+                self.statusBar().showMessage("INT8 CPU inference on", 3000)
+
+        def on_error(message):
+            self.int8_action.blockSignals(True)
+            self.int8_action.setChecked(False)
+            self.int8_action.blockSignals(False)
+            # The full traceback is printed by the scheduler.
+            QMessageBox.critical(
+                self, "Error",
+                f"Failed to build the INT8 model (needs onnx and onnxruntime): {message.strip().splitlines()[-1]}"
+            )
+
+        self.statusBar().showMessage("Building the INT8 model...")
+        self.scheduler.submit(
+            lambda job: model.set_quantized(True), PRIORITY_EXPORT, "Quantize model", key=("int8", id(model)),
+            on_done=on_done, on_error=on_error,
+        )
+
+    def evaluate_int8(self):
+        """Report float vs INT8 latency and mask agreement on a sample of labeled images"""
+        if self.model is None:
+            QMessageBox.warning(self, "Warning", "Load a model first.")
+            return
+        sample = sample_labeled_images(
+            [p for p, _ in self.image_paths], self.annotation_store.names(), EVAL_SAMPLES
+        )
+        if not sample:
+            QMessageBox.warning(self, "Warning", "No labeled images to evaluate on.")
+            return
+        model_path = self.model_path
+        self.statusBar().showMessage(f"Evaluating INT8 inference on {len(sample)} image(s)...")
+        self.scheduler.submit(
+            lambda job: evaluate(model_path, sample, RealYOLOPredictor.IMGSZ, checkpoint=job.checkpoint),
+            PRIORITY_EXPORT, "Evaluate INT8", key=("int8-eval", model_path),
+            on_done=lambda report: QMessageBox.information(self, "INT8 Evaluation", format_report(report)),
+            on_error=lambda message: QMessageBox.critical(
+                self, "Error", f"INT8 evaluation failed: {message.strip().splitlines()[-1]}"
+            ),
+        )
+
     def open_folder(self):
         folder_path = QFileDialog.getExistingDirectory(self, "Open Image Folder")
         if folder_path:
             if os.path.isdir(os.path.join(folder_path, "images")):
                 folder_path = os.path.join(folder_path, "images")
 
+            # Flush the previous workspace before switching stores.
+            self.folder_watcher.stop()
+            self.save_current_labels()
+            for priority in (PRIORITY_CURRENT, PRIORITY_PREFETCH, PRIORITY_PRELABEL):
+                self.scheduler.cancel_all(priority)
+            if self.train_cache_job is not None:
+                self.train_cache_job.cancel()
+            self.workspace_generation += 1
+            self.pending_prelabels = set()
+            self.frames.clear()
+            self.current_image_index = -1
             self.image_paths = []
-            self.file_list_widget.clear()
+            self.file_list_model.set_paths([])
+            self.image_folder = folder_path
             
             image_files = sorted([f for f in os.listdir(folder_path) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
             labels_dir = os.path.join(os.path.dirname(folder_path), "labels")
             os.makedirs(labels_dir, exist_ok=True)
+
+            if self.annotation_store is not None:
+                self.annotation_store.close()
+            self.annotation_store = AnnotationStore(store_path_for(labels_dir))
+            if self.thumbnail_cache is not None:
+                self.thumbnail_cache.close()
+            self.thumbnail_cache = ThumbnailCache(thumbnail_path_for(labels_dir), self)
+            self.thumbnail_grid.set_cache(self.thumbnail_cache)
+            self.train_cache = TrainImageCache(train_cache_dir_for(labels_dir))
+            stored_names = self.annotation_store.names()
+            self.embedding_store = EmbeddingStore(embedding_dir_for(labels_dir))
+            self.coreset.clear()
+
+            # Cluster near-duplicate frames so only one per cluster is pre-labeled.
+            file_clusters = self.cluster_images(folder_path, image_files)
+            skip_duplicates = self.dedup_action.isChecked()
+            kept = []
+            to_prelabel = []
             
             for i, img_file in enumerate(image_files):
                 self.statusBar().showMessage(f"Processing {i + 1}/{len(image_files)}: {img_file}")
@@ -181,29 +485,43 @@ class MainWindow(QMainWindow):
                 img_path = os.path.join(folder_path, img_file)
                 txt_path = os.path.join(labels_dir, os.path.splitext(img_file)[0] + ".txt")
 
-                img = cv2.imread(img_path)
-                if img is None:
+                # Only the header is read; the image is decoded once, by whichever job or view needs it first.
+                with profiler.span("ingest.read_header"):
+                    size = image_size(img_path)
+                if size is None:
                     print(f"Error reading image {img_path}")
                     continue
-                img_h, img_w = img.shape[:2]
-                self.image_paths.append((img_path, (img_w, img_h)))
-
-                if not os.path.exists(txt_path):
-                    if self.model:
-                        instances, _, _ = self.model.predict_and_optimize(img_path)
-                        shapes_to_save = []
-                        for inst in instances:
-                            class_id, polygon_data, conf = inst
-                            class_name = self.class_names[class_id]
-                            shape = Shape(label=class_name, shape_type='polygon', score=conf)
-                            shape.points = [QPointF(p[0], p[1]) for p in polygon_data]
-                            shape.close()
-                            shapes_to_save.append(shape)
-                        if shapes_to_save:
-                            save_yolo_labels(txt_path, shapes_to_save, img_w, img_h, self.class_names)
+                self.image_paths.append((img_path, size))
+                kept.append(i)
+
+                has_labels = (
+                    img_file in stored_names
+                    or os.path.exists(txt_path)
+                    or os.path.exists(annotation_path_for(txt_path))
+                )
+                is_duplicate = file_clusters[i] != i
+                if not has_labels and not (skip_duplicates and is_duplicate) and self.model:
+                    to_prelabel.append(len(self.image_paths) - 1)
+
+            # Existing txt/.ann label files are imported into the store once.
+            with profiler.span("ingest.import_labels"):
+                self.annotation_store.import_labels_dir(
+                    labels_dir, {os.path.basename(p): d for p, d in self.image_paths}
+                )
 
             self.statusBar().showMessage("Done processing folder.", 5000)
-            self.file_list_widget.addItems([os.path.basename(p) for p, d in self.image_paths])
+            self.file_list_model.set_paths([p for p, d in self.image_paths], self.annotation_store)
+            self.clusters = self.remap_clusters(file_clusters, kept)
+            self.file_list_model.set_clusters(self.clusters)
+            if self.annotation_store.dataset_stats() is None:
+                self.submit_stats_rebuild()
+            self.submit_train_cache()
+
+            # Pre-labeling runs in the background; images fill in as their jobs finish.
+            for index in to_prelabel:
+                self.submit_prelabel(index)
+            if self.watch_folder_action.isChecked():
+                self.folder_watcher.watch(folder_path, image_files)
             
             if len(self.image_paths) > 0:
                 self.load_image_by_index(0)
@@ -214,42 +532,550 @@ class MainWindow(QMainWindow):
                 self.open_folder_action.setEnabled(True)
                 self.load_model_action.setEnabled(True)
 
+    def toggle_watch_folder(self, checked):
+        if not checked:
+            self.folder_watcher.stop()
+        elif self.image_folder is not None and not self.folder_watcher.is_watching():
+            self.folder_watcher.watch(self.image_folder, [os.path.basename(p) for p, _ in self.image_paths])
+            self.statusBar().showMessage(f"Watching {self.image_folder} for new images", 3000)
+
+    def on_watched_files_added(self, paths):
+        """Append images that arrived in the watched folder and queue them for pre-labeling"""
+        with profiler.span("watch.ingest"):
+            new = []
+            for path in paths:
+                # Only the header is read; the image is decoded by its pre-label job.
+                size = image_size(path)
+                if size is None:
+                    print(f"Error reading image {path}")
+                    continue
+                new.append((path, size))
+            if not new:
+                return
+            start = len(self.image_paths)
+            self.image_paths.extend(new)
+            self.clusters = np.concatenate([self.clusters, np.arange(start, len(self.image_paths), dtype=np.int64)])
+            self.annotation_store.import_labels_dir(
+                labels_dir_for(new[0][0]), {os.path.basename(p): d for p, d in new}
+            )
+            self.file_list_model.append_paths([p for p, _ in new])
+            if self.model:
+                for index in range(start, len(self.image_paths)):
+                    if os.path.basename(self.image_paths[index][0]) not in self.annotation_store:
+                        self.submit_prelabel(index)
+        if self.current_image_index == -1:
+            self.load_image_by_index(0)
+            self.set_actions_enabled(True)
+        self.statusBar().showMessage(f"Added {len(new)} new image(s) from the watched folder", 3000)
+
+    def on_watched_files_changed(self, paths):
+        """Refresh images rewritten in place; their unreviewed pre-labels are predicted again"""
+        index_of = {p: i for i, (p, _) in enumerate(self.image_paths)}
+        for path in paths:
+            index = index_of.get(path)
+            size = image_size(path)
+            if index is None or size is None:
+                continue
+            self.image_paths[index] = (path, size)
+            self.frames.discard(path)
+            self.thumbnail_cache.discard(path)
+            if self.segmenter is not None:
+                self.segmenter.discard(path)
+            if index == self.current_image_index:
+                frame = self.frames.get(path)
+                self.viewer.set_image(QPixmap.fromImage(frame.qimage()) if frame is not None else QPixmap())
+                continue
+            name = os.path.basename(path)
+            summary = self.annotation_store.summary(name)
+            if self.model and (summary is None or not summary[2]):
+                self.annotation_store.delete([name])
+                self.submit_prelabel(index)
+            self.file_list_model.refresh_row(index)
+
+    def submit_stats_rebuild(self):
+        """Recount the dataset statistics in the background (a store without saved totals, or changed externally)"""
+        store = self.annotation_store
+        self.scheduler.submit(
+            lambda job: store.rebuild_stats(), PRIORITY_EXPORT, "Count labels",
+            key=("stats", self.workspace_generation),
+            on_done=lambda stats: self.stats_dock.refresh() if self.stats_dock.isVisible() else None,
+        )
+
+    def submit_train_cache(self):
+        """Resize the reviewed images not cached yet for training, in idle time"""
+        if self.train_cache is None:
+            return
+        cache = self.train_cache
+        store = self.annotation_store
+        frames = self.frames
+        image_paths = self.image_paths
+
+        def run(job):
+            paths = {os.path.basename(p): p for p, _ in list(image_paths)}
+            reviewed = {name: updated for name, updated in store.reviewed_items().items() if name in paths}
+            first_pass = not cache.done
+            for name, updated in reviewed.items():
+                if cache.done.get(name) == updated:
+                    continue
+                job.checkpoint()
+                # The image under review is usually decoded already.
+                frame = frames.peek(paths[name])
+                cache.add(paths[name], frame.bgr if frame is not None else None)
+                cache.done[name] = updated
+            if first_pass:
+                cache.prune({cache.cached_path(paths[name]) for name in reviewed})
+
+        self.train_cache_job = self.scheduler.submit(
+            run, PRIORITY_EXPORT, "Cache training images", key=("train_cache", self.workspace_generation),
+        )
+
+    def submit_prelabel(self, index, priority=PRIORITY_PRELABEL):
+        img_path, _ = self.image_paths[index]
+        model = self.model
+        keep_masks = self.keep_masks_action.isChecked()
+        generation = self.workspace_generation
+        frames = self.frames
+
+        def run(job):
+            job.checkpoint()
+            # Frames of images far from the one on screen are used once and not cached.
+            frame = frames.get(img_path, keep=abs(index - self.current_image_index) <= 1)
+            if frame is None:
+                return [], None
+            with model.lock:
+                with profiler.span("ingest.predict"):
+                    instances, _, _ = model.predict_and_optimize(frame.bgr, with_masks=keep_masks)
+                return instances, model.last_embedding
+
+        self.pending_prelabels.add(index)
+        self.scheduler.submit(
+            run, priority, f"Pre-label {os.path.basename(img_path)}", key=("prelabel", generation, index),
+            on_done=lambda result: self.on_prelabel_done(generation, index, keep_masks, result),
+            on_error=lambda message: self.pending_prelabels.discard(index),
+        )
+
+    def on_prelabel_done(self, generation, index, keep_masks, result):
+        if generation != self.workspace_generation:
+            return
+        self.pending_prelabels.discard(index)
+        instances, embedding = result
+        img_path, (img_w, img_h) = self.image_paths[index]
+        name = os.path.basename(img_path)
+        if embedding is not None:
+            self.embedding_store.put(name, embedding)
+        if name in self.annotation_store:
+            return  # labeled by the user in the meantime
+
+        with profiler.span("ingest.save_labels"):
+            # Records go straight to the store; shapes are only built for the image on screen.
+            records = []
+            for inst in instances:
+                class_id, polygon_data, conf = inst[:3]
+                if class_id >= len(self.class_names) or not len(polygon_data):
+                    continue
+                records.append(AnnotationInstance(
+                    class_id, np.asarray(polygon_data, dtype=np.float32).reshape(-1, 2), conf,
+                    provenance=PROVENANCE_MODEL, mask=inst[3] if keep_masks else None,
+                ))
+            if records:
+                self.annotation_store.put(name, img_w, img_h, records, reviewed=False)
+        self.file_list_model.refresh_row(index)
+
+        if index == self.current_image_index and not self.viewer.shapes:
+            self.show_shapes(self.load_labels(img_path, img_w, img_h))
+
+    def submit_prefetch(self, index):
+        self.submit_embedding(index)
+        if not (0 <= index < len(self.image_paths)):
+            return
+        img_path, _ = self.image_paths[index]
+        if img_path in self.frames:
+            return
+        frames = self.frames
+        self.scheduler.submit(
+            lambda job: frames.get(img_path), PRIORITY_PREFETCH, f"Prefetch {os.path.basename(img_path)}",
+            key=("prefetch", self.workspace_generation, index),
+        )
+
+    def submit_embedding(self, index, priority=PRIORITY_PREFETCH):
+        """Compute the click-to-segment image embedding ahead of the first click"""
+        if self.segmenter is None or not (0 <= index < len(self.image_paths)):
+            return
+        img_path, _ = self.image_paths[index]
+        if self.segmenter.has_embedding(img_path):
+            return
+        key = ("embed", self.workspace_generation, index)
+        if self.scheduler.reprioritize(key, priority):
+            return
+        segmenter = self.segmenter
+        frames = self.frames
+
+        def run(job):
+            frame = frames.get(img_path)
+            return segmenter.embed(img_path, frame.bgr if frame is not None else None)
+
+        self.scheduler.submit(
+            run, priority, f"Embed {os.path.basename(img_path)}", key=key,
+        )
+
+    def eventFilter(self, obj, event):
+        if obj is self.viewer:
+            kind = event.type()
+            if kind in (QEvent.MouseButtonPress, QEvent.KeyPress, QEvent.Wheel) or (
+                kind == QEvent.MouseMove and event.buttons()
+            ):
+                self.scheduler.mark_user_activity()
+        return super().eventFilter(obj, event)
+
+    def update_job_status(self):
+        depths, running = self.scheduler.snapshot()
+        now = time.monotonic()
+        wall = now - self._job_status_time
+        self._job_status_time = now
+        cores = os.cpu_count() or 1
+        job_cpu = {}
+        parts = []
+        for job, cpu in running:
+            job_cpu[id(job)] = cpu
+            previous = self._job_cpu.get(id(job))
+            text = PRIORITY_NAMES[job.priority]
+            if cpu is not None and previous is not None and wall > 0:
+                text += f" {100 * (cpu - previous) / wall / cores:.0f}% CPU"
+            parts.append(text)
+        self._job_cpu = job_cpu
+
+        queued = sum(depths)
+        status = f"Jobs: {queued} queued"
+        if parts:
+            status += " | " + ", ".join(parts)
+        if self.scheduler.user_active() and (queued or running):
+            status += " | paused while editing"
+        self.jobs_label.setText(status if queued or parts else "Jobs: idle")
+        self.jobs_label.setToolTip("\n".join(
+            f"{name}: {depth} queued" for name, depth in zip(PRIORITY_NAMES, depths)
+        ))
+
+    def cluster_images(self, folder_path, image_files):
+        """Near-duplicate cluster id of each image file (the index of its representative).
+
+        Hashes are cached in the annotation store and only recomputed for new
+        or modified files.
+        """
+        cached = self.annotation_store.hashes()
+        hashes = np.zeros(len(image_files), dtype=np.uint64)
+        valid = np.zeros(len(image_files), dtype=bool)
+        mtimes = []
+        missing = []
+        for i, img_file in enumerate(image_files):
+            mtime = os.path.getmtime(os.path.join(folder_path, img_file))
+            mtimes.append(mtime)
+            entry = cached.get(img_file)
+            if entry is not None and entry[0] == mtime:
+                hashes[i] = entry[1]
+                valid[i] = True
+            else:
+                missing.append(i)
+
+        if missing:
+            def progress(done, total):
+                self.statusBar().showMessage(f"Hashing {done}/{total} images...")
+                QApplication.processEvents()
+
+            new_hashes, new_valid = compute_hashes(
+                [os.path.join(folder_path, image_files[i]) for i in missing], progress=progress
+            )
+            hashes[missing] = new_hashes
+            valid[missing] = new_valid
+            self.annotation_store.put_hashes(
+                (image_files[i], mtimes[i], int(h))
+                for i, h, ok in zip(missing, new_hashes, new_valid) if ok
+            )
+
+        return cluster_hashes(hashes, valid)
+
+    @staticmethod
+    def remap_clusters(file_clusters, kept):
+        """Map cluster ids over image files onto the images that could be loaded"""
+        kept = np.asarray(kept, dtype=np.int64)
+        position = np.full(len(file_clusters), -1, dtype=np.int64)
+        position[kept] = np.arange(len(kept), dtype=np.int64)
+        clusters = position[file_clusters[kept]]
+        # A representative that failed to load leaves its members on their own.
+        lost = clusters < 0
+        clusters[lost] = np.flatnonzero(lost)
+        return clusters
+
+    def copy_labels_to_cluster(self):
+        if self.current_image_index == -1 or not len(self.clusters):
+            return
+        cluster = self.clusters[self.current_image_index]
+        members = np.flatnonzero(self.clusters == cluster)
+        members = members[members != self.current_image_index]
+        if not len(members):
+            self.statusBar().showMessage("Current image has no near-duplicates.", 3000)
+            return
+
+        self.save_current_labels()
+        _, (src_w, src_h) = self.image_paths[self.current_image_index]
+        source = annotation_instances_from_shapes(self.viewer.shapes, self.class_names, reviewed=False)
+        items = []
+        skipped = 0
+        for row in members:
+            img_path, (img_w, img_h) = self.image_paths[row]
+            name = os.path.basename(img_path)
+            summary = self.annotation_store.summary(name)
+            if summary and summary[2]:
+                skipped += 1  # never overwrite reviewed work
+                continue
+            scale = np.array([img_w / src_w, img_h / src_h], dtype=np.float32)
+            same_size = (img_w, img_h) == (src_w, src_h)
+            instances = [
+                AnnotationInstance(
+                    inst.class_id, inst.points * scale, inst.score, inst.flags, inst.provenance,
+                    inst.mask if same_size else None,
+                )
+                for inst in source
+            ]
+            items.append((name, img_w, img_h, instances, False))
+        self.annotation_store.put_many(items)
+        for row in members:
+            self.file_list_model.refresh_row(int(row))
+        self.statusBar().showMessage(
+            f"Copied labels to {len(items)} near-duplicate(s), skipped {skipped} reviewed.", 5000
+        )
+
+    def select_diverse_batch(self):
+        names, features = self.embedding_store.features() if self.embedding_store else ([], None)
+        if not names:
+            QMessageBox.warning(self, "Warning", "No embeddings yet. They are recorded while pre-labeling images.")
+            return
+        k, ok = QInputDialog.getInt(self, "Select Diverse Batch", "Number of images:", 50, 1, len(self.image_paths))
+        if not ok:
+            return
+
+        with profiler.span("coreset.select"):
+            changed = self.embedding_store.take_changed_rows()
+            if changed is None:
+                # The store was reset; its row numbers start over.
+                self.coreset.clear()
+            self.coreset.update(features, changed or ())
+            image_index = {os.path.basename(p): i for i, (p, _) in enumerate(self.image_paths)}
+            store = self.file_list_model.store
+            store.ensure_all()
+            # Reviewed images, and images no longer in the workspace, already cover their region.
+            covered = []
+            candidates = []
+            for row, name in enumerate(names):
+                index = image_index.get(name)
+                if index is None or store.status[index] == REVIEWED:
+                    covered.append(row)
+                else:
+                    candidates.append(row)
+            self.coreset.add_centers(covered)
+            picked = self.coreset.select(k, candidates)
+
+        self.file_list_model.set_selection([image_index[names[row]] for row in picked])
+        self.file_filter_combo.setCurrentIndex(FileListModel.FILTER_SELECTED)
+        self.statusBar().showMessage(f"Selected {len(picked)} of {len(candidates)} unreviewed image(s).", 5000)
+
     def open_training_dialog(self):
         if not self.model:
             QMessageBox.warning(self, "Warning", "Please load a model first.")
             return
 
-        dialog = TrainingDialog(self)
+        job = self.job_history.resumable()
+        if job is not None:
+            reply = QMessageBox.question(
+                self, "Resume Training",
+                f"Training job {job['id']} ({job['outcome']}) left a checkpoint:\n"
+                f"{JobHistory.last_checkpoint(job)}\n\nResume it?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes,
+            )
+            if reply == QMessageBox.Yes:
+                self.training_round = None
+                self.start_training({'data': job['data'], 'epochs': job['epochs']}, resume_job=job)
+                return
+
+        dialog = TrainingDialog(self, workspace_available=bool(self.image_paths))
+        if self.train_cache is not None:
+            dialog.imgsz_spinbox.setValue(self.train_cache.imgsz)
         if dialog.exec_() == QDialog.Accepted:
             params = dialog.get_parameters()
-            if not params['data']:
+            if dialog.generate_dataset():
+                self.save_current_labels()
+                # Images already resized for this imgsz are linked instead of the originals.
+                self.train_cache.set_imgsz(params['imgsz'])
+                builder = DatasetBuilder(dataset_dir_for(labels_dir_for(self.image_paths[0][0])), dialog.val_fraction())
+                try:
+                    params['data'], stats = builder.build(
+                        self.annotation_store, [p for p, _ in self.image_paths], self.class_names,
+                        image_source=self.train_cache.lookup,
+                    )
+                except OSError as e:
+                    QMessageBox.critical(self, "Error", f"Failed to assemble the training dataset: {e}")
+                    return
+                if not stats['train'] or not stats['val']:
+                    QMessageBox.warning(self, "Warning", "Not enough reviewed images for a train/val split.")
+                    return
+                print(f"Dataset: {stats['train']} train / {stats['val']} val / {stats['gate']} gate "
+                      f"({stats['added']} added, {stats['updated']} updated, {stats['removed']} removed)")
+
+                manifest = builder.manifest()
+                rounds = TrainingRounds(builder.out_dir)
+                plan = rounds.plan(manifest, dialog.incremental(), dialog.replay_ratio())
+                if plan['mode'] == MODE_INCREMENTAL:
+                    if not plan['new']:
+                        QMessageBox.information(self, "Train", "No images were reviewed since the last training round.")
+                        return
+                    # Warm start from the current weights on a short schedule.
+                    params['epochs'] = dialog.incremental_epochs()
+                    params['warmup_epochs'] = 0
+                    train_list = rounds.write_round_list(plan)
+                    params['data'] = builder.write_yaml(
+                        self.class_names, train_list, f"data_round_{plan['round']:03d}.yaml"
+                    )
+                print(f"Training round {plan['round']} ({plan['mode']}): "
+                      f"{len(plan['new'])} new, {len(plan['replay'])} replay image(s)")
+                self.training_round = (rounds, plan, manifest, dict(params))
+            elif not params['data']:
                 QMessageBox.warning(self, "Warning", "Dataset YAML file is required.")
                 return
+            elif self.image_paths:
+                # YOLO txt is only materialized from the store when it is needed.
+                self.save_current_labels()
+                self.annotation_store.materialize_yolo_labels(labels_dir_for(self.image_paths[0][0]))
+            if not dialog.generate_dataset():
+                self.training_round = None
 
-            self.training_thread = TrainingThread(self.model, params)
-            self.training_thread.training_finished.connect(self.on_training_finished)
-            self.training_thread.training_failed.connect(self.on_training_failed)
-            self.training_thread.start()
-            
-            self.train_action.setEnabled(False)
-            self.statusBar().showMessage("Training started... Logs will be shown in the console.")
+            self.start_training(params)
+
+    def start_training(self, params, resume_job=None):
+        self.training_thread = TrainingThread(self.model_path, params, self.job_history, resume_job, self.scheduler)
+        self.training_thread.training_finished.connect(self.on_training_finished)
+        self.training_thread.training_failed.connect(self.on_training_failed)
+        self.training_thread.training_cancelled.connect(self.on_training_cancelled)
+        self.training_thread.epoch_finished.connect(self.on_training_epoch_finished)
+        self.training_thread.start()
+
+        self.train_action.setEnabled(False)
+        self.cancel_training_action.setEnabled(True)
+        self.statusBar().showMessage("Training started... Logs will be shown in the console.")
+
+    def cancel_training(self):
+        if self.training_thread is not None and self.training_thread.isRunning():
+            self.training_thread.cancel()
+            self.cancel_training_action.setEnabled(False)
+            self.statusBar().showMessage("Stopping training after the current batch...")
+
+    def on_training_epoch_finished(self, epoch, epochs):
+        self.statusBar().showMessage(f"Training: epoch {epoch}/{epochs} done.")
+
+    def on_training_cancelled(self):
+        self.training_round = None
+        self.train_action.setEnabled(True)
+        self.cancel_training_action.setEnabled(False)
+        self.statusBar().showMessage("Training cancelled. It can be resumed from its last checkpoint.", 5000)
 
     def on_training_failed(self, error_msg):
+        self.training_round = None
+        self.cancel_training_action.setEnabled(False)
         QMessageBox.critical(self, "Training Failed", error_msg)
         self.statusBar().showMessage("Training failed.", 5000)
         self.train_action.setEnabled(True)
 
     def on_training_finished(self, results):
         self.train_action.setEnabled(True)
+        self.cancel_training_action.setEnabled(False)
+        # The round is only recorded once its weights are promoted.
+        training_round = None
+        if self.training_round is not None:
+            training_round = self.training_round + (self.training_thread.duration, metrics_summary(results))
+            self.training_round = None
+        best_model_path = os.path.join(results.save_dir, 'weights', 'best.pt')
+        if not os.path.exists(best_model_path):
+            QMessageBox.critical(
+                self, "Error", "Failed to update model after training: best.pt not found in results directory."
+            )
+            self.statusBar().showMessage("Error updating model.", 5000)
+            return
+        self.submit_model_gate(best_model_path, training_round)
+
+    def submit_model_gate(self, candidate_path, training_round):
+        """Score the trained weights against the current model in the background before replacing it"""
+        paths, held_out = [], False
+        if self.image_paths:
+            self.save_current_labels()
+            manifest = DatasetBuilder(dataset_dir_for(labels_dir_for(self.image_paths[0][0]))).manifest()
+            paths, held_out = held_out_images(
+                [p for p, _ in self.image_paths], self.annotation_store.reviewed_items(), manifest
+            )
+        if not paths:
+            self.confirm_promotion(
+                candidate_path, training_round, "There are no reviewed images to compare the models on."
+            )
+            return
+
+        store = self.annotation_store
+        current_path = self.model_path
+        device = self.model.device
+        cache_path = predictions_path_for(labels_dir_for(paths[0]))
+
+        def run(job):
+            truths = [ground_truth(store.get(os.path.basename(p))) for p in paths]
+            return compare_models(
+                current_path, candidate_path, paths, truths, RealYOLOPredictor.IMGSZ, device, cache_path,
+                checkpoint=job.checkpoint,
+            )
+
+        self.statusBar().showMessage(f"Evaluating the trained model on {len(paths)} reviewed image(s)...")
+        self.scheduler.submit(
+            run, PRIORITY_TRAINING, "Evaluate trained model", key=("model-gate", candidate_path),
+            on_done=lambda result: self.on_model_gate_done(candidate_path, training_round, held_out, result),
+            on_error=lambda message: self.confirm_promotion(
+                candidate_path, training_round, f"Evaluation failed: {message.strip().splitlines()[-1]}"
+            ),
+        )
+
+    def on_model_gate_done(self, candidate_path, training_round, held_out, result):
+        current, candidate = result["current"], result["candidate"]
+        print(f"Model evaluation: mask mAP current {current['map']:.3f}, candidate {candidate['map']:.3f}; "
+              f"latency {current['latency_ms']:.0f} vs {candidate['latency_ms']:.0f} ms/image")
+        if ModelGateDialog(result, self.class_names, held_out, self).exec_() == QDialog.Accepted:
+            self.promote_model(candidate_path, training_round)
+        else:
+            self.statusBar().showMessage(f"Kept the current model. Trained weights: {candidate_path}", 10000)
+
+    def confirm_promotion(self, candidate_path, training_round, reason):
+        reply = QMessageBox.question(
+            self, "Training Complete", f"{reason}\n\nReplace {self.model_path} with the trained model anyway?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No,
+        )
+        if reply == QMessageBox.Yes:
+            self.promote_model(candidate_path, training_round)
+        else:
+            self.statusBar().showMessage(f"Kept the current model. Trained weights: {candidate_path}", 10000)
+
+    def promote_model(self, candidate_path, training_round=None):
+        """Replace the model file with the candidate weights and reload it.
+
+        training_round is (rounds, plan, manifest, params, duration, metrics)
+        of a round on the generated dataset: it is recorded only now, so the
+        images of a rejected round count as new again in the next one.
+        """
         try:
-            best_model_path = os.path.join(results.save_dir, 'weights', 'best.pt')
-            if os.path.exists(best_model_path):
-                shutil.copy(best_model_path, self.model_path)
-                QMessageBox.information(self, "Training Complete", f"Model has been fine-tuned and updated: {self.model_path}")
-                self.model = RealYOLOPredictor(self.model_path)
-                self.statusBar().showMessage("Training complete. Model reloaded.", 5000)
-            else:
-                raise FileNotFoundError("best.pt not found in results directory.")
+            shutil.copy(candidate_path, self.model_path)
+            report = ""
+            if training_round is not None:
+                rounds, plan, manifest, params, duration, metrics = training_round
+                rounds.record(plan, manifest, duration, metrics, params)
+                report = rounds.report()
+                print(report)
+            QMessageBox.information(
+                self, "Training Complete", f"Model has been fine-tuned and updated: {self.model_path}\n\n{report}"
+            )
+            self.model = RealYOLOPredictor(self.model_path)
+            self.apply_inference_mode()
+            self.statusBar().showMessage("Training complete. Model reloaded.", 5000)
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to update model after training: {e}")
             self.statusBar().showMessage("Error updating model.", 5000)
@@ -258,83 +1084,140 @@ class MainWindow(QMainWindow):
         if not (0 <= index < len(self.image_paths)):
             return
 
-        self.save_current_labels()
+        with profiler.span("load_image"):
+            self._load_image_by_index(index)
+
+    def _load_image_by_index(self, index):
+        with profiler.span("load_image.save_previous"):
+            self.save_current_labels()
         
         self.current_image_index = index
-        self.file_list_widget.setCurrentRow(index)
+        self.select_file_row(index)
         
         img_path, (img_w, img_h) = self.image_paths[index]
-        pixmap = QPixmap(img_path)
+        if index in self.pending_prelabels:
+            self.scheduler.reprioritize(("prelabel", self.workspace_generation, index), PRIORITY_CURRENT)
+        with profiler.span("load_image.decode"):
+            # Usually already decoded by the prefetch or pre-label job.
+            frame = self.frames.get(img_path)
+        with profiler.span("load_image.pixmap"):
+            pixmap = QPixmap.fromImage(frame.qimage()) if frame is not None else QPixmap()
+        self.submit_embedding(index, PRIORITY_CURRENT if self.viewer.prompting() else PRIORITY_PREFETCH)
+        self.submit_prefetch(index + 1)
+        self.submit_prefetch(index - 1)
         if pixmap.isNull():
             QMessageBox.warning(self, "Error", f"Failed to load image: {img_path}")
             return
 
-        txt_file = os.path.splitext(os.path.basename(img_path))[0] + ".txt"
-        labels_dir = os.path.join(os.path.dirname(os.path.dirname(img_path)), "labels")
-        txt_path = os.path.join(labels_dir, txt_file)
-
         self.viewer.clear_polygons()
-        self.instance_list_widget.clear()
-        
+        self.viewer.clear_prompt()
+        self.prompt_request += 1
+
         self.viewer.set_image(pixmap)
         
-        shapes = load_yolo_labels(txt_path, img_w, img_h, self.class_names)
+        with profiler.span("load_image.labels"):
+            shapes = self.load_labels(img_path, img_w, img_h)
+        self.show_shapes(shapes)
+
+        self.viewer.fit_to_window()
+        self.viewer.update()
+
+    def show_shapes(self, shapes):
+        for shape in shapes:
+            self.apply_class_color(shape)
         self.viewer.shapes = shapes
-        self.viewer.store_shapes() # Initial state for undo
-        self.populate_instance_list()
+        self.viewer.reset_shapes_history()
+        with profiler.span("load_image.instance_list"):
+            self.instance_list_model.set_shapes(self.viewer.shapes)
         
         scores = [s.score for s in self.viewer.shapes if s.score is not None]
         avg_conf = sum(scores) / len(scores) if scores else 0.0
         self.conf_label.setText(f"Avg. Confidence: {avg_conf:.2f}")
-
-        self.viewer.fit_to_window()
         self.viewer.update()
 
     def clear_viewer(self):
         self.viewer.clear_polygons()
         self.viewer.set_image(QPixmap())
-        self.instance_list_widget.clear()
+        self.instance_list_model.set_shapes(self.viewer.shapes)
         self.conf_label.setText("Avg. Confidence: N/A")
         self.set_actions_enabled(False)
         self.open_folder_action.setEnabled(True)
         self.load_model_action.setEnabled(True)
 
-    def populate_instance_list(self):
-        self.instance_list_widget.clear()
-        for i, shape in enumerate(self.viewer.shapes):
-            score_text = f"({shape.score:.2f})" if shape.score is not None else ""
-            item = QListWidgetItem(f"[{i}] {shape.label} {score_text}")
-            item.setData(Qt.UserRole, i)
-            
-            try:
-                class_index = self.class_names.index(shape.label)
-                color = self.color_map[class_index % len(self.color_map)]
-                item.setForeground(color)
-                shape.line_color = color
-            except ValueError:
-                pass # Ignore if class name not in list
-
-            self.instance_list_widget.addItem(item)
-
-    def on_file_item_clicked(self, item):
-        index = self.file_list_widget.row(item)
-        self.load_image_by_index(index)
-
-    def on_instance_item_clicked(self, item):
-        instance_id = item.data(Qt.UserRole)
-        shape = self.viewer.shapes[instance_id]
+    def color_for_class(self, class_id):
+        if not self.color_map:
+            return QColor(255, 255, 0)
+        return self.color_map[class_id % len(self.color_map)]
+
+    def annotations_for(self, name):
+        """AnnotationFile of an image in the open workspace, or None"""
+        if self.annotation_store is None:
+            return None
+        return self.annotation_store.get(name)
+
+    def toggle_grid_view(self, checked):
+        if checked:
+            # Saved first so the grid shows the current image's edits.
+            self.save_current_labels()
+            row = self.file_list_model.view_row(self.current_image_index)
+            if row >= 0:
+                index = self.file_list_model.index(row)
+                self.thumbnail_grid.setCurrentIndex(index)
+                self.thumbnail_grid.scrollTo(index, QListView.PositionAtCenter)
+            self.central_stack.setCurrentWidget(self.thumbnail_grid)
+            self.thumbnail_grid.setFocus()
+        else:
+            self.central_stack.setCurrentWidget(self.viewer)
+            self.viewer.setFocus()
+
+    def on_thumbnail_activated(self, model_index):
+        self.load_image_by_index(self.file_list_model.source_row(model_index.row()))
+        self.grid_action.setChecked(False)
+
+    def color_for_label(self, label):
+        class_index = self.class_index.get(label)
+        if class_index is None or not self.color_map:
+            return None # Ignore if class name not in list
+        return self.color_map[class_index % len(self.color_map)]
+
+    def apply_class_color(self, shape):
+        color = self.color_for_label(shape.label)
+        if color is not None:
+            shape.line_color = color
+
+    def select_file_row(self, index):
+        row = self.file_list_model.view_row(index)
+        if row < 0:
+            self.file_list_view.clearSelection()
+            return
+        model_index = self.file_list_model.index(row)
+        self.file_list_view.setCurrentIndex(model_index)
+        self.file_list_view.scrollTo(model_index)
+
+    def on_file_index_clicked(self, model_index):
+        self.load_image_by_index(self.file_list_model.source_row(model_index.row()))
+
+    def on_file_filter_changed(self, *args):
+        self.file_list_model.set_filter(self.file_filter_combo.currentIndex(), self.file_search_edit.text())
+        self.select_file_row(self.current_image_index)
+
+    def on_file_sort_changed(self, *args):
+        order = Qt.DescendingOrder if self.file_sort_desc_checkbox.isChecked() else Qt.AscendingOrder
+        self.file_list_model.set_sort(self.file_sort_combo.currentIndex(), order)
+        self.select_file_row(self.current_image_index)
+
+    def on_instance_item_clicked(self, model_index):
+        shape = self.instance_list_model.shape_at(model_index.row())
         self.viewer.select_shape(shape)
 
     def on_polygon_selected(self, shape):
-        if not shape:
-            self.instance_list_widget.clearSelection()
+        row = self.instance_list_model.row_of(shape) if shape else -1
+        if row < 0:
+            self.instance_list_view.clearSelection()
             return
-        instance_id = self.viewer.shapes.index(shape)
-        for i in range(self.instance_list_widget.count()):
-            item = self.instance_list_widget.item(i)
-            if item.data(Qt.UserRole) == instance_id:
-                item.setSelected(True)
-                break
+        model_index = self.instance_list_model.index(row)
+        self.instance_list_view.setCurrentIndex(model_index)
+        self.instance_list_view.scrollTo(model_index)
 
     def prev_image(self):
         if self.current_image_index > 0:
@@ -345,34 +1228,203 @@ class MainWindow(QMainWindow):
             self.load_image_by_index(self.current_image_index + 1)
 
     def toggle_draw_mode(self, checked):
+        self.region_action.setChecked(False)
+        self.prompt_action.setChecked(False)
         self.viewer.set_draw_mode(checked)
 
+    def toggle_region_mode(self, checked):
+        if checked and not self.model:
+            QMessageBox.warning(self, "Warning", "Please load a model first.")
+            checked = False
+        self.region_action.setChecked(checked)
+        self.draw_poly_action.setChecked(False)
+        self.prompt_action.setChecked(False)
+        self.viewer.set_region_mode(checked)
+
+    def load_segmenter(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Load Segment Model", "", "PyTorch Models (*.pt)")
+        if not file_path:
+            return
+        try:
+            self.segmenter = PromptableSegmenter(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to load segment model: {e}")
+            print(e)
+            return
+        self.statusBar().showMessage(f"Segment model loaded: {os.path.basename(file_path)}")
+        if self.current_image_index != -1:
+            self.submit_embedding(self.current_image_index)
+            self.submit_embedding(self.current_image_index + 1)
+            self.submit_embedding(self.current_image_index - 1)
+
+    def toggle_prompt_mode(self, checked):
+        if checked and self.segmenter is None:
+            self.load_segmenter()
+            checked = self.segmenter is not None
+        self.prompt_action.setChecked(checked)
+        self.draw_poly_action.setChecked(False)
+        self.region_action.setChecked(False)
+        self.viewer.set_prompt_mode(checked)
+        self.prompt_request += 1
+        if checked and self.current_image_index != -1:
+            self.submit_embedding(self.current_image_index, PRIORITY_CURRENT)
+
+    def on_prompt_changed(self):
+        if self.current_image_index == -1 or self.segmenter is None:
+            return
+        self.prompt_request += 1
+        request = self.prompt_request
+        img_path, _ = self.image_paths[self.current_image_index]
+        points = [(p.x(), p.y()) for p, _ in self.viewer.prompt_points]
+        labels = [POSITIVE if positive else NEGATIVE for _, positive in self.viewer.prompt_points]
+        segmenter = self.segmenter
+        frames = self.frames
+        keep_masks = self.keep_masks_action.isChecked()
+        if not segmenter.has_embedding(img_path):
+            self.statusBar().showMessage("Computing image embedding...")
+
+        def run(job):
+            # The viewer's frame, if the embedding still has to be computed.
+            frame = None if segmenter.has_embedding(img_path) else frames.get(img_path)
+            return segmenter.segment(
+                img_path, points, labels, with_masks=keep_masks, img=frame.bgr if frame is not None else None
+            )
+
+        self.scheduler.submit(
+            run, PRIORITY_CURRENT, f"Segment {os.path.basename(img_path)}",
+            on_done=lambda result: self.on_prompt_segmented(request, result),
+        )
+
+    def on_prompt_segmented(self, request, result):
+        if request != self.prompt_request or not self.viewer.prompting():
+            return
+        if result is None:
+            self.viewer.set_prompt_shape(None)
+            self.statusBar().showMessage("No object found at the clicked points", 2000)
+            return
+        polygon_data, score, mask_rle = result
+        shape = Shape(shape_type='polygon', score=score)
+        shape.points = [QPointF(x, y) for x, y in polygon_data]
+        shape.close()
+        shape.fill = True
+        if mask_rle is not None:
+            shape.other_data["mask_rle"] = mask_rle
+        self.viewer.set_prompt_shape(shape)
+        self.statusBar().showMessage("Enter to accept, Esc to clear, right-click to exclude an area", 4000)
+
+    def accept_prompt_shape(self):
+        shape = self.viewer.take_prompt_shape()
+        self.prompt_request += 1
+        if shape is None:
+            return
+        shape.fill = False
+        self.label_new_shape(shape)
+
+    def resegment_region(self, rect):
+        """Run the model on a box of the current image and replace the instances inside it"""
+        if self.current_image_index == -1 or not self.model:
+            return
+        index = self.current_image_index
+        img_path, (img_w, img_h) = self.image_paths[index]
+        rect = rect.intersected(QRectF(0, 0, img_w, img_h))
+        if rect.isEmpty():
+            return
+        region = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        model = self.model
+        keep_masks = self.keep_masks_action.isChecked()
+        generation = self.workspace_generation
+        frames = self.frames
+
+        def run(job):
+            start = time.perf_counter()
+            frame = frames.get(img_path)
+            if frame is None:
+                return [], time.perf_counter() - start
+            with profiler.span("predict.region"):
+                instances, _, _ = model.predict_region(frame.bgr, region, with_masks=keep_masks)
+            return instances, time.perf_counter() - start
+
+        self.statusBar().showMessage("Re-segmenting region...")
+        self.scheduler.submit(
+            run, PRIORITY_CURRENT, f"Re-segment {os.path.basename(img_path)}",
+            on_done=lambda result: self.on_region_segmented(generation, index, rect, keep_masks, result),
+        )
+
+    def on_region_segmented(self, generation, index, rect, keep_masks, result):
+        if generation != self.workspace_generation or index != self.current_image_index:
+            return
+        instances, elapsed = result
+        self.viewer.store_shapes()
+        replaced = [s for s in self.viewer.shapes if rect.contains(s.cached_bounding_rect().center())]
+        self.viewer.deselect_shape()
+        self.instance_list_model.remove_shapes(replaced)
+        for inst in instances:
+            class_id, polygon_data, conf = inst[:3]
+            record = AnnotationInstance(
+                class_id, np.asarray(polygon_data, dtype=np.float32).reshape(-1, 2), conf,
+                provenance=PROVENANCE_MODEL, mask=inst[3] if keep_masks else None,
+            )
+            shape = Shape.from_instance(record, self.class_names)
+            if shape is None:
+                continue
+            self.apply_class_color(shape)
+            self.instance_list_model.append_shape(shape)
+        self.viewer.update()
+        self.viewer.store_shapes()
+        self.statusBar().showMessage(
+            f"Replaced {len(replaced)} instance(s) with {len(instances)} in {elapsed * 1000:.0f} ms", 4000
+        )
+
     def on_new_polygon_drawn(self, shape):
         self.draw_poly_action.setChecked(False)
         self.toggle_draw_mode(False)
+        self.label_new_shape(shape)
+
+    def label_new_shape(self, shape):
         self.viewer.store_shapes()
         class_name, ok = QInputDialog.getItem(self, "Select Class", "Class:", self.class_names, 0, False)
         if ok and class_name:
             shape.label = class_name
             shape.score = 1.0
-            self.viewer.shapes.append(shape)
-            self.populate_instance_list()
+            shape.other_data["provenance"] = PROVENANCE_MANUAL
+            self.apply_class_color(shape)
+            self.instance_list_model.append_shape(shape)
             self.viewer.update()
             self.viewer.store_shapes()
         
-    def save_current_labels(self):
+    def save_current_labels(self, reviewed=None):
+        """Save the shapes on screen; reviewed=True approves them (Ctrl+S).
+
+        Automatic saves (navigation, training, closing) only write shapes the
+        user edited, which marks them reviewed; an untouched pre-label stays
+        unreviewed.
+        """
         if self.current_image_index == -1:
             return
+        if reviewed is None:
+            if not self.viewer.edited:
+                return
+            reviewed = True
+        if self.current_image_index in self.pending_prelabels and not self.viewer.shapes:
+            return  # don't let an empty save pre-empt the pending pre-label
 
         img_path, (img_w, img_h) = self.image_paths[self.current_image_index]
-        
-        txt_file = os.path.splitext(os.path.basename(img_path))[0] + ".txt"
-        labels_dir = os.path.join(os.path.dirname(os.path.dirname(img_path)), "labels")
-        txt_path = os.path.join(labels_dir, txt_file)
-
-        save_yolo_labels(txt_path, self.viewer.shapes, img_w, img_h, self.class_names)
+        self.save_labels(img_path, self.viewer.shapes, img_w, img_h, reviewed)
+        self.viewer.mark_saved()
+        self.file_list_model.refresh_row(self.current_image_index)
+        self.submit_train_cache()
         self.statusBar().showMessage(f"Saved labels for {os.path.basename(img_path)}", 2000)
 
+    def load_labels(self, img_path, img_w, img_h):
+        ann = self.annotation_store.get(os.path.basename(img_path))
+        if ann is None:
+            return []
+        return shapes_from_annotation(ann, img_w, img_h, self.class_names)
+
+    def save_labels(self, img_path, shapes, img_w, img_h, reviewed=True):
+        instances = annotation_instances_from_shapes(shapes, self.class_names, reviewed)
+        self.annotation_store.put(os.path.basename(img_path), img_w, img_h, instances, reviewed=reviewed)
+
     def export_files(self):
         if not self.image_paths:
             QMessageBox.warning(self, "Warning", "No images to export.")
@@ -394,30 +1446,57 @@ class MainWindow(QMainWindow):
 
                 img_filename = os.path.basename(source_img_path)
                 txt_filename = os.path.splitext(img_filename)[0] + ".txt"
-                
-                source_labels_dir = os.path.join(os.path.dirname(os.path.dirname(source_img_path)), "labels")
-                source_txt_path = os.path.join(source_labels_dir, txt_filename)
+                source_txt_path = label_path_for(source_img_path)
 
                 dest_img_path = os.path.join(dest_images_dir, img_filename)
                 dest_txt_path = os.path.join(dest_labels_dir, txt_filename)
 
+                source_ann_path = annotation_path_for(source_txt_path)
+
                 os.rename(source_img_path, dest_img_path)
-                if os.path.exists(source_txt_path):
-                    os.rename(source_txt_path, dest_txt_path)
+                self.annotation_store.write_yolo_txt(img_filename, dest_txt_path)
+                for stale_path in (source_txt_path, source_ann_path):
+                    if os.path.exists(stale_path):
+                        os.remove(stale_path)
 
             QMessageBox.information(self, "Success", f"{total_files} image(s) and their labels have been exported successfully.")
 
             # Clear workspace
+            self.watch_folder_action.setChecked(False)
+            self.image_folder = None
+            self.annotation_store.delete([os.path.basename(p) for p, _ in self.image_paths])
             self.image_paths = []
-            self.file_list_widget.clear()
+            self.clusters = np.empty(0, dtype=np.int64)
+            self.file_list_model.set_paths([])
             self.clear_viewer()
             self.current_image_index = -1
 
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to export files: {e}")
 
+    def closeEvent(self, event):
+        if self.training_thread is not None and self.training_thread.isRunning():
+            reply = QMessageBox.question(self, "Quit", "Training is running. Cancel it and quit?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+            self.training_thread.cancel()
+            self.training_thread.wait()
+        self.folder_watcher.stop()
+        self.save_current_labels()
+        self.scheduler.shutdown()
+        if self.thumbnail_cache is not None:
+            self.thumbnail_cache.close()
+        super().closeEvent(event)
+
     def keyPressEvent(self, event):
-        if event.key() == Qt.Key_Delete or event.key() == Qt.Key_Backspace:
+        if self.viewer.prompting() and event.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self.accept_prompt_shape()
+        elif self.viewer.prompting() and event.key() == Qt.Key_Escape:
+            self.viewer.clear_prompt()
+            self.prompt_request += 1
+        elif event.key() == Qt.Key_Delete or event.key() == Qt.Key_Backspace:
             if self.viewer.selected_shapes:
                 reply = QMessageBox.question(self, "Delete", "Delete selected instances?", 
                                              QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
@@ -428,31 +1507,29 @@ class MainWindow(QMainWindow):
 
     def delete_selected_instances(self):
         self.viewer.store_shapes()
-        for shape in self.viewer.selected_shapes:
-            self.viewer.shapes.remove(shape)
+        self.instance_list_model.remove_shapes(self.viewer.selected_shapes)
         self.viewer.deselect_shape()
-        self.populate_instance_list()
         self.viewer.update()
         
-    def on_instance_double_clicked(self, item):
-        instance_id = item.data(Qt.UserRole)
-        shape = self.viewer.shapes[instance_id]
+    def on_instance_double_clicked(self, model_index):
+        shape = self.instance_list_model.shape_at(model_index.row())
         self.change_instance_class(shape)
         
     def change_instance_class(self, shape):
         self.viewer.store_shapes()
         current_class_name = shape.label
         class_name, ok = QInputDialog.getItem(self, "Select Class", "Class:", self.class_names, 
-                                            self.class_names.index(current_class_name), False)
+                                            self.class_index.get(current_class_name, 0), False)
         if ok and class_name and class_name != current_class_name:
             shape.label = class_name
-            self.populate_instance_list()
+            self.apply_class_color(shape)
+            self.instance_list_model.update_shape(shape)
             self.viewer.update()
             self.viewer.store_shapes()
 
     def undo_shape(self):
         self.viewer.restore_shape()
-        self.populate_instance_list()
+        self.instance_list_model.sync_shapes(self.viewer.shapes)
             
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,280 @@
+"""Candidate vs current model evaluation before trained weights replace the model.
+
+Both models segment the same reviewed images: those of the generated
+dataset's gate split, which is neither trained nor validated on (the
+val split picks the candidate's best.pt, so it would favour the
+candidate). Predicted and reviewed polygons are rasterized on a small grid
+and scored as per-class mask AP, COCO style (IoU 0.50:0.95). Predictions
+are cached per weights file, image and imgsz, so the current model, which
+was the candidate of the previous round or already evaluated, usually
+isn't run again. Only the gate fills the cache: the first evaluation of
+a model (e.g. one loaded from elsewhere) runs it on every image.
+Pre-label results can't stand in for it; they are cut at the pre-label
+confidence, simplified, possibly from the INT8 copy, and replaced by
+the reviewed labels on exactly the images evaluated here.
+"""
+import hashlib
+import io
+import os
+import random
+import sqlite3
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from profiler import profiler
+from quantization import IOU_GRID
+
+PREDICTIONS_FILENAME = "eval_predictions.db"
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+# Reviewed images evaluated at most, and images per inference batch.
+EVAL_IMAGES = 200
+BATCH = 8
+# Lower than the pre-label threshold so AP sees most of the precision / recall curve.
+CONF = 0.1
+
+
+def predictions_path_for(labels_dir):
+    """Prediction cache that sits next to the labels folder, like the annotation store"""
+    return os.path.join(os.path.dirname(os.path.abspath(labels_dir)), PREDICTIONS_FILENAME)
+
+
+def model_key(model_path):
+    """Identity of a weights file by content, so a promoted copy keeps its cached predictions"""
+    digest = hashlib.sha1()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return f"{digest.hexdigest()}:{CONF}"
+
+
+def held_out_images(image_paths, reviewed_names, manifest, limit=EVAL_IMAGES, seed=0):
+    """(paths, held_out) of the reviewed images to evaluate on.
+
+    These are the reviewed images of the dataset's gate split, or of the
+    whole workspace when it has none yet (no generated dataset, or one
+    from before the gate split; held_out is then False), sampled down to
+    limit.
+    """
+    gate = {name for name, entry in manifest.items() if entry["split"] == "gate"}
+    names = sorted(name for name in reviewed_names if name in gate)
+    held_out = bool(names)
+    if not held_out:
+        names = sorted(reviewed_names)
+    if len(names) > limit:
+        names = sorted(random.Random(seed).sample(names, limit))
+    paths = {os.path.basename(p): p for p in image_paths}
+    return [paths[name] for name in names if name in paths], held_out
+
+
+def _grid_size(img_w, img_h):
+    scale = IOU_GRID / max(img_w, img_h)
+    return max(1, round(img_w * scale)), max(1, round(img_h * scale))
+
+
+def _rasterize(polygons, size):
+    """Bool masks (n, h, w) of normalized polygons on a grid of size (w, h)"""
+    w, h = size
+    masks = np.zeros((len(polygons), h, w), dtype=np.uint8)
+    for mask, points in zip(masks, polygons):
+        if len(points) >= 3:
+            cv2.fillPoly(mask, [np.round(np.asarray(points) * (w, h)).astype(np.int32)], 1)
+    return masks.astype(bool)
+
+
+def ground_truth(ann):
+    """(class ids, masks) of an image's reviewed annotations"""
+    size = _grid_size(ann.img_w, ann.img_h)
+    polygons = [ann.normalized_polygon(i) for i in range(len(ann))]
+    return ann.instances["class_id"].astype(np.int64), _rasterize(polygons, size)
+
+
+def _predictions(result, img_w, img_h):
+    """(class ids, scores, masks) of one image's results, rasterized like ground_truth"""
+    if result.masks is None or not len(result.masks):
+        w, h = _grid_size(img_w, img_h)
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros((0, h, w), dtype=bool)
+    return (
+        result.boxes.cls.cpu().numpy().astype(np.int64),
+        result.boxes.conf.cpu().numpy().astype(np.float32),
+        _rasterize(result.masks.xyn, _grid_size(img_w, img_h)),
+    )
+
+
+class PredictionCache:
+    """Predictions of a model on an image, by weights file, image path and mtime, and imgsz"""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions (model TEXT NOT NULL, path TEXT NOT NULL, mtime REAL NOT NULL, "
+            "imgsz INTEGER NOT NULL, latency REAL NOT NULL, data BLOB NOT NULL, PRIMARY KEY (model, path, imgsz))"
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def get(self, model, path, imgsz):
+        """((class ids, scores, masks), latency in seconds), or None"""
+        row = self.conn.execute(
+            "SELECT latency, data FROM predictions WHERE model = ? AND path = ? AND imgsz = ? AND mtime = ?",
+            (model, path, imgsz, os.path.getmtime(path)),
+        ).fetchone()
+        if row is None:
+            return None
+        data = np.load(io.BytesIO(row[1]))
+        n, h, w = data["shape"]
+        masks = np.unpackbits(data["masks"], axis=1, count=h * w).reshape(n, h, w).astype(bool)
+        return (data["classes"], data["scores"], masks), row[0]
+
+    def put(self, model, path, imgsz, prediction, latency):
+        classes, scores, masks = prediction
+        buf = io.BytesIO()
+        np.savez(
+            buf, classes=classes, scores=scores, shape=np.array(masks.shape),
+            masks=np.packbits(masks.reshape(len(masks), -1), axis=1),
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO predictions (model, path, mtime, imgsz, latency, data) VALUES (?, ?, ?, ?, ?, ?)",
+            (model, path, os.path.getmtime(path), imgsz, latency, buf.getvalue()),
+        )
+
+
+def _predict(model, paths, imgsz, device, checkpoint=None):
+    """Predictions and per-image latencies (batch time / batch size) of paths, None for unreadable images"""
+    predictions, latencies = [], []
+    warm = False
+    for start in range(0, len(paths), BATCH):
+        if checkpoint is not None:
+            checkpoint()
+        batch = [cv2.imread(p) for p in paths[start:start + BATCH]]
+        images = [img for img in batch if img is not None]
+        if images and not warm:
+            # The first call initializes the runtime and is not timed.
+            model(images[0], imgsz=imgsz, conf=CONF, device=device, verbose=False)
+            warm = True
+        t = time.perf_counter()
+        with profiler.span("evaluate.inference"):
+            results = iter(model(images, imgsz=imgsz, conf=CONF, device=device, verbose=False) if images else [])
+        latency = (time.perf_counter() - t) / max(1, len(images))
+        for img in batch:
+            if img is None:
+                predictions.append(None)
+                latencies.append(None)
+            else:
+                predictions.append(_predictions(next(results), img.shape[1], img.shape[0]))
+                latencies.append(latency)
+    return predictions, latencies
+
+
+def _iou(masks_a, masks_b):
+    a = masks_a.reshape(len(masks_a), -1).astype(np.float32)
+    b = masks_b.reshape(len(masks_b), -1).astype(np.float32)
+    inter = a @ b.T
+    union = a.sum(1)[:, None] + b.sum(1)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _average_precision(recall, precision):
+    """Area under the precision envelope of a recall / precision curve"""
+    if not len(recall):
+        return 0.0
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum(np.diff(np.concatenate([[0.0], recall])) * precision))
+
+
+def class_ap(predictions, truths):
+    """{class id: {"map", "map50", "instances"}} over the classes in truths or predictions.
+
+    Per image and class, predictions are matched to reviewed instances
+    greedily by score at each IoU threshold; images without a prediction
+    (unreadable) are skipped. A class that is only predicted (all false
+    positives) has AP 0 and no instances.
+    """
+    matches = {}
+    n_truth = Counter()
+    for prediction, (t_classes, t_masks) in zip(predictions, truths):
+        if prediction is None:
+            continue
+        p_classes, p_scores, p_masks = prediction
+        for c in set(t_classes.tolist()) | set(p_classes.tolist()):
+            truth = t_masks[t_classes == c]
+            n_truth[c] += len(truth)
+            order = np.flatnonzero(p_classes == c)
+            order = order[np.argsort(-p_scores[order], kind="stable")]
+            iou = _iou(p_masks[order], truth) if len(order) and len(truth) else np.zeros((len(order), len(truth)))
+            tp = np.zeros((len(order), len(IOU_THRESHOLDS)), dtype=bool)
+            for k, threshold in enumerate(IOU_THRESHOLDS):
+                matched = np.zeros(len(truth), dtype=bool)
+                for i in range(len(order)):
+                    candidates = np.where(matched, -1.0, iou[i])
+                    j = int(candidates.argmax()) if len(candidates) else -1
+                    if j >= 0 and candidates[j] >= threshold:
+                        matched[j] = True
+                        tp[i, k] = True
+            matches.setdefault(c, []).append((p_scores[order], tp))
+
+    aps = {}
+    for c, n in n_truth.items():
+        if not n:
+            aps[c] = {"map": 0.0, "map50": 0.0, "instances": 0}
+            continue
+        scores = np.concatenate([s for s, _ in matches[c]])
+        tp = np.concatenate([t for _, t in matches[c]])[np.argsort(-scores, kind="stable")]
+        ctp = np.cumsum(tp, axis=0)
+        cfp = np.cumsum(~tp, axis=0)
+        recall = ctp / n
+        precision = ctp / np.maximum(ctp + cfp, 1)
+        per_threshold = [_average_precision(recall[:, k], precision[:, k]) for k in range(len(IOU_THRESHOLDS))]
+        aps[c] = {"map": float(np.mean(per_threshold)), "map50": per_threshold[0], "instances": int(n)}
+    return aps
+
+
+def compare_models(current_path, candidate_path, image_paths, truths, imgsz, device="cpu", cache_path=None,
+                   checkpoint=None):
+    """Score the current and candidate weights on image_paths against truths (see ground_truth).
+
+    Returns {"images", "current": {...}, "candidate": {...}}, each model
+    with its per-class AP (see class_ap), mean mAP / mAP50 over the
+    classes, mean latency in ms per image and how many images came from
+    the prediction cache.
+    """
+    cache = PredictionCache(cache_path) if cache_path is not None else None
+    report = {"images": len(image_paths)}
+    try:
+        for role, model_path in (("current", current_path), ("candidate", candidate_path)):
+            key = model_key(model_path)
+            predictions = [None] * len(image_paths)
+            latencies = [None] * len(image_paths)
+            missing = []
+            for i, path in enumerate(image_paths):
+                hit = cache.get(key, path, imgsz) if cache is not None else None
+                if hit is None:
+                    missing.append(i)
+                else:
+                    predictions[i], latencies[i] = hit
+            if missing:
+                out, times = _predict(YOLO(model_path), [image_paths[i] for i in missing], imgsz, device, checkpoint)
+                for i, prediction, latency in zip(missing, out, times):
+                    predictions[i], latencies[i] = prediction, latency
+                    if cache is not None and prediction is not None:
+                        cache.put(key, image_paths[i], imgsz, prediction, latency)
+            aps = class_ap(predictions, truths)
+            # Means over the reviewed classes, as in COCO; predicted-only classes are listed but not averaged.
+            scored = [ap for ap in aps.values() if ap["instances"]]
+            timed = [latency for latency in latencies if latency is not None]
+            report[role] = {
+                "path": model_path,
+                "classes": aps,
+                "map": float(np.mean([ap["map"] for ap in scored])) if scored else 0.0,
+                "map50": float(np.mean([ap["map50"] for ap in scored])) if scored else 0.0,
+                "latency_ms": 1e3 * float(np.mean(timed)) if timed else 0.0,
+                "cached": len(image_paths) - len(missing),
+            }
+    finally:
+        if cache is not None:
+            cache.close()
+    return report
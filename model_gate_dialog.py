@@ -0,0 +1,86 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
+    QDialogButtonBox
+)
+from PyQt5.QtGui import QColor, QFont
+from PyQt5.QtCore import Qt
+
+from model_gate import BATCH
+
+
+class ModelGateDialog(QDialog):
+    """Current vs candidate model scores side by side; accepted means promote the candidate"""
+
+    COLUMNS = ["Class", "Instances", "Current", "Candidate", "Change", "Current @0.5", "Candidate @0.5"]
+
+    def __init__(self, report, class_names, held_out, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Evaluate Trained Model")
+        self.setMinimumWidth(760)
+        layout = QVBoxLayout(self)
+
+        current, candidate = report["current"], report["candidate"]
+        images = f"{report['images']} held-out reviewed image(s) (gate split, never trained or validated on)" \
+            if held_out else f"{report['images']} reviewed image(s), not held out: the generated dataset has no " \
+            "gate split yet, so the candidate may have been trained or validated on them"
+        summary = QLabel(f"Mask mAP at IoU 0.50:0.95 (and at 0.5) on {images}.")
+        summary.setWordWrap(True)
+        layout.addWidget(summary)
+
+        # Either model may lack a class (no instances among its readable images); it then scores zero.
+        zero = {"map": 0.0, "map50": 0.0, "instances": 0}
+        per_class = {
+            class_id: (current["classes"].get(class_id, zero), candidate["classes"].get(class_id, zero))
+            for class_id in set(current["classes"]) | set(candidate["classes"])
+        }
+        classes = sorted(per_class, key=lambda c: (-max(ap["instances"] for ap in per_class[c]), c))
+        self.table = QTableWidget(len(classes) + 1, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+        instances = sum(max(ap["instances"] for ap in aps) for aps in per_class.values())
+        self._set_row(0, "All", instances, current, candidate)
+        bold = QFont()
+        bold.setBold(True)
+        for col in range(len(self.COLUMNS)):
+            self.table.item(0, col).setFont(bold)
+        for row, class_id in enumerate(classes, start=1):
+            name = class_names[class_id] if class_id < len(class_names) else f"class {class_id}"
+            current_ap, candidate_ap = per_class[class_id]
+            self._set_row(row, name, max(current_ap["instances"], candidate_ap["instances"]), current_ap, candidate_ap)
+        layout.addWidget(self.table)
+
+        def latency(model):
+            text = f"{model['latency_ms']:.0f} ms/image"
+            if model["cached"]:
+                text += f" ({model['cached']} of {report['images']} image(s) from the prediction cache)"
+            return text
+
+        layout.addWidget(QLabel(
+            f"Inference latency, batches of {BATCH}:\n  current: {latency(current)}\n  candidate: {latency(candidate)}"
+        ))
+        layout.addWidget(QLabel(f"Candidate weights: {candidate['path']}"))
+
+        buttons = QDialogButtonBox()
+        promote = buttons.addButton("Promote Candidate", QDialogButtonBox.AcceptRole)
+        keep = buttons.addButton("Keep Current", QDialogButtonBox.RejectRole)
+        # Suggest whichever model scores better.
+        (promote if candidate["map"] >= current["map"] else keep).setDefault(True)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def _set_row(self, row, name, instances, current, candidate):
+        change = candidate["map"] - current["map"]
+        values = [name, str(instances), f"{current['map']:.3f}", f"{candidate['map']:.3f}", f"{change:+.3f}",
+                  f"{current['map50']:.3f}", f"{candidate['map50']:.3f}"]
+        for col, value in enumerate(values):
+            item = QTableWidgetItem(value)
+            if col > 0:
+                item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+            if col == 4 and abs(change) >= 0.0005:
+                item.setForeground(QColor(0, 140, 0) if change > 0 else QColor(200, 0, 0))
+            self.table.setItem(row, col, item)
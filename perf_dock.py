@@ -0,0 +1,140 @@
+from PyQt5.QtWidgets import (
+    QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QCheckBox, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QFileDialog, QMessageBox, QAbstractItemView
+)
+from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtCore import Qt, QTimer
+
+from profiler import profiler, SpanStats
+
+
+class HistogramWidget(QWidget):
+    """Bar chart of one span's latency histogram"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.stats = None
+        self.setMinimumHeight(110)
+
+    def set_stats(self, stats):
+        self.stats = stats
+        self.update()
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), self.palette().base())
+        if self.stats is None or not self.stats.count:
+            p.drawText(self.rect(), Qt.AlignCenter, "Select a span")
+            return
+
+        buckets = self.stats.buckets
+        labels = [f"{b:g}" for b in SpanStats.BOUNDS_MS] + [">"]
+        peak = max(buckets) or 1
+        label_h = p.fontMetrics().height()
+        bar_w = self.width() / len(buckets)
+        plot_h = self.height() - label_h - 4
+        for i, n in enumerate(buckets):
+            h = int(plot_h * n / peak)
+            x = int(i * bar_w)
+            p.fillRect(x + 1, plot_h - h, max(1, int(bar_w) - 2), h, QColor(70, 130, 200))
+            p.drawText(x, plot_h + 2, int(bar_w), label_h, Qt.AlignHCenter, labels[i])
+        p.drawText(self.rect().adjusted(4, 2, -4, 0), Qt.AlignLeft | Qt.AlignTop,
+                   f"{self.stats.name} (ms, n={self.stats.count})")
+
+
+class PerfDock(QDockWidget):
+    """Dock showing aggregated span latencies recorded by the profiler"""
+
+    COLUMNS = ["Span", "Count", "Mean (ms)", "p50", "p95", "Max"]
+
+    def __init__(self, parent=None):
+        super().__init__("Performance", parent)
+        self.setObjectName("PerfDock")
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+
+        controls = QHBoxLayout()
+        self.record_checkbox = QCheckBox("Record")
+        self.record_checkbox.setChecked(profiler.enabled)
+        self.record_checkbox.toggled.connect(profiler.set_enabled)
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.reset)
+        self.export_button = QPushButton("Export Trace...")
+        self.export_button.clicked.connect(self.export_trace)
+        controls.addWidget(self.record_checkbox)
+        controls.addStretch()
+        controls.addWidget(self.reset_button)
+        controls.addWidget(self.export_button)
+        layout.addLayout(controls)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.table.itemSelectionChanged.connect(self.on_selection_changed)
+        layout.addWidget(self.table)
+
+        self.histogram = HistogramWidget()
+        layout.addWidget(self.histogram)
+
+        self.setWidget(container)
+
+        self._stats = []
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def on_visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        selected = self.selected_span_name()
+        self._stats = profiler.stats()
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(self._stats))
+        for row, s in enumerate(self._stats):
+            values = [s.name, str(s.count), f"{s.mean_ms:.2f}",
+                      f"{s.percentile(50):.1f}", f"{s.percentile(95):.1f}", f"{s.max_ms:.1f}"]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+            if s.name == selected:
+                self.table.selectRow(row)
+        self.table.blockSignals(False)
+        self.on_selection_changed()
+
+    def selected_span_name(self):
+        rows = self.table.selectionModel().selectedRows()
+        if rows and rows[0].row() < len(self._stats):
+            return self._stats[rows[0].row()].name
+        return None
+
+    def on_selection_changed(self):
+        name = self.selected_span_name()
+        self.histogram.set_stats(next((s for s in self._stats if s.name == name), None))
+
+    def reset(self):
+        profiler.reset()
+        self.refresh()
+
+    def export_trace(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Chrome Trace", "trace.json", "JSON Files (*.json)")
+        if not file_path:
+            return
+        try:
+            n = profiler.export_chrome_trace(file_path)
+            QMessageBox.information(self, "Trace Exported",
+                                    f"{n} span(s) written to {file_path}.\nOpen it in chrome://tracing or Perfetto.")
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export trace: {e}")
@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class _NullSpan:
+    """Span returned while tracing is disabled; does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class SpanStats:
+    """Aggregated latency of one span name, bucketed into a histogram"""
+
+    # Upper bounds of the histogram buckets in milliseconds; the last bucket is open.
+    BOUNDS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = float("inf")
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(self.BOUNDS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+        for i, bound in enumerate(self.BOUNDS_MS):
+            if ms <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def percentile(self, q):
+        """Approximate percentile (0-100) from the histogram bucket bounds"""
+        if not self.count:
+            return 0.0
+        target = self.count * q / 100.0
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                if i < len(self.BOUNDS_MS):
+                    return min(self.BOUNDS_MS[i], self.max_ms)
+                return self.max_ms
+        return self.max_ms
+
+    def copy(self):
+        other = SpanStats(self.name)
+        other.count = self.count
+        other.total_ms = self.total_ms
+        other.min_ms = self.min_ms
+        other.max_ms = self.max_ms
+        other.buckets = list(self.buckets)
+        return other
+
+
+class Profiler:
+    """Lightweight timing spans with histograms and Chrome trace export.
+
+    Usage:
+        with profiler.span("predict.inference"):
+            ...
+
+    While disabled, `span()` returns a shared no-op object, so instrumented
+    code only pays for one attribute check and a method call.
+    """
+
+    MAX_EVENTS = 200000
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._events = deque(maxlen=self.MAX_EVENTS)
+        self._origin = time.perf_counter()
+
+    def set_enabled(self, enabled):
+        self.enabled = bool(enabled)
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name, start, end):
+        """Record a finished span given perf_counter() start and end times"""
+        ms = (end - start) * 1000.0
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = SpanStats(name)
+            stats.add(ms)
+            self._events.append((name, start, end, threading.get_ident()))
+
+    def stats(self):
+        """Return a snapshot of the aggregated stats, sorted by span name"""
+        with self._lock:
+            return [self._stats[k].copy() for k in sorted(self._stats)]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._events.clear()
+            self._origin = time.perf_counter()
+
+    def export_chrome_trace(self, path):
+        """Write recorded spans as Chrome trace-event JSON (chrome://tracing, Perfetto)"""
+        with self._lock:
+            events = list(self._events)
+            origin = self._origin
+        pid = os.getpid()
+        trace_events = []
+        thread_ids = {}
+        for name, start, end, tid in events:
+            if tid not in thread_ids:
+                thread_ids[tid] = len(thread_ids)
+                trace_events.append({
+                    "name": "thread_name", "ph": "M", "pid": pid, "tid": thread_ids[tid],
+                    "args": {"name": "main" if tid == threading.main_thread().ident else f"worker-{tid}"},
+                })
+            trace_events.append({
+                "name": name,
+                "cat": name.split(".", 1)[0],
+                "ph": "X",
+                "ts": (start - origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": pid,
+                "tid": thread_ids[tid],
+            })
+        with open(path, "w") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+
+profiler = Profiler()
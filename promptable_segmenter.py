@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+from rdp import rdp
+from ultralytics import SAM
+
+from profiler import profiler
+from annotation_format import crop_mask, rle_encode
+
+POSITIVE, NEGATIVE = 1, 0
+
+
+def mask_to_polygon(mask, epsilon=1.0):
+    """Largest outer contour of a bool mask as [[x, y], ...], simplified like pre-label polygons"""
+    contours, _ = cv2.findContours(mask.astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    if not contours:
+        return []
+    contour = max(contours, key=cv2.contourArea).reshape(-1, 2).astype(np.float32)
+    if epsilon > 0:
+        with profiler.span("predict.rdp"):
+            contour = rdp(contour, epsilon=epsilon)
+    return contour.tolist()
+
+
+class PromptableSegmenter:
+    """Click-to-segment with a local SAM or MobileSAM checkpoint (e.g. mobile_sam.pt).
+
+    The image encoder runs once per image and its embedding is kept in a
+    small LRU cache, so it can be computed in the background before the
+    user clicks. Each click then only runs the prompt encoder and mask
+    decoder. The network is only read, so embedding and decoding may run
+    on different threads at the same time; only the cache is locked.
+    """
+
+    CACHE_SIZE = 8
+
+    def __init__(self, model_path):
+        self.device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+        self.net = SAM(model_path).model.to(self.device).eval()
+        self.img_size = self.net.image_encoder.img_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def has_embedding(self, img_path):
+        with self._cache_lock:
+            return img_path in self._cache
+
+    def discard(self, img_path):
+        """Forget the embedding of an image whose file changed"""
+        with self._cache_lock:
+            self._cache.pop(img_path, None)
+
+    def _cached(self, img_path):
+        with self._cache_lock:
+            entry = self._cache.get(img_path)
+            if entry is not None:
+                self._cache.move_to_end(img_path)
+            return entry
+
+    def embed(self, img_path, img=None):
+        """Image-encoder embedding of an image, computed once and cached: (features, (h, w)) or None.
+
+        img is the image already decoded as a BGR array, if the caller has it.
+        """
+        entry = self._cached(img_path)
+        if entry is not None:
+            return entry
+        if img is None:
+            with profiler.span("prompt.decode"):
+                img = cv2.imread(img_path)
+        if img is None:
+            print(f"Error: Could not read image {img_path}")
+            return None
+        h, w = img.shape[:2]
+        scale = self.img_size / max(h, w)
+        new_w, new_h = int(w * scale + 0.5), int(h * scale + 0.5)
+        img = cv2.cvtColor(cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+        with torch.inference_mode(), profiler.span("prompt.encode"):
+            x = torch.from_numpy(img).to(self.device).permute(2, 0, 1).float()
+            x = (x - self.net.pixel_mean.view(-1, 1, 1)) / self.net.pixel_std.view(-1, 1, 1)
+            x = F.pad(x, (0, self.img_size - new_w, 0, self.img_size - new_h))
+            features = self.net.image_encoder(x[None])
+        entry = (features, (h, w))
+        with self._cache_lock:
+            self._cache[img_path] = entry
+            while len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return entry
+
+    def segment(self, img_path, points, labels, epsilon=1.0, with_masks=False, img=None):
+        """Mask for positive / negative click points in image coordinates.
+
+        Returns (polygon_points, score, mask_rle or None), or None when
+        nothing was segmented. The embedding is computed first, from img if
+        given (see embed), if it isn't cached yet.
+        """
+        entry = self.embed(img_path, img)
+        if entry is None or not len(points):
+            return None
+        features, (h, w) = entry
+        scale = self.img_size / max(h, w)
+        new_w, new_h = int(w * scale + 0.5), int(h * scale + 0.5)
+        coords = np.asarray(points, dtype=np.float32).reshape(-1, 2) * [new_w / w, new_h / h]
+        # A single click is ambiguous (part vs whole), so let the decoder propose several masks.
+        multimask = len(points) == 1
+        with torch.inference_mode(), profiler.span("prompt.decoder"):
+            coords = torch.as_tensor(coords, device=self.device)[None]
+            labels = torch.as_tensor(np.asarray(labels), dtype=torch.int, device=self.device)[None]
+            sparse, dense = self.net.prompt_encoder(points=(coords, labels), boxes=None, masks=None)
+            masks, scores = self.net.mask_decoder(
+                image_embeddings=features,
+                image_pe=self.net.prompt_encoder.get_dense_pe(),
+                sparse_prompt_embeddings=sparse,
+                dense_prompt_embeddings=dense,
+                multimask_output=multimask,
+            )
+            best = int(scores[0].argmax())
+            # Upsample to the encoder input resolution only; the polygon is scaled back below.
+            mask = F.interpolate(masks[:, best:best + 1], (self.img_size, self.img_size), mode="bilinear", align_corners=False)
+            mask = (mask[0, 0, :new_h, :new_w] > self.net.mask_threshold).cpu().numpy()
+            score = float(scores[0, best])
+
+        with profiler.span("prompt.postprocess"):
+            polygon = mask_to_polygon(mask, epsilon * scale)
+            if len(polygon) < 3:
+                return None
+            polygon = (np.asarray(polygon, dtype=np.float32) * [w / new_w, h / new_h]).tolist()
+            mask_rle = None
+            if with_masks:
+                full = cv2.resize(mask.astype(np.uint8), (w, h), interpolation=cv2.INTER_NEAREST)
+                x, y, crop = crop_mask(full > 0)
+                mask_rle = (x, y, crop.shape[1], crop.shape[0], rle_encode(crop))
+        return polygon, score, mask_rle
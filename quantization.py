@@ -0,0 +1,218 @@
+"""INT8 CPU inference for YOLO-seg models.
+
+The .pt is exported to ONNX and its Conv / MatMul weights are quantized to
+INT8 with ONNX Runtime dynamic quantization (activations are quantized on
+the fly, so no calibration images are needed). The result is cached next
+to the .pt as <name>.int8.onnx and rebuilt when the .pt is newer.
+
+Float vs INT8 report over labeled workspace images:
+
+    python quantization.py model.pt path/to/images --samples 30
+"""
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from profiler import profiler
+
+# Quantizing only weighted ops keeps the head's box / score decode in float.
+QUANTIZED_OPS = ["Conv", "MatMul"]
+# Masks are compared on a grid with this long side, which is plenty for IoU.
+IOU_GRID = 320
+MATCH_IOU = 0.5
+# Labeled images sampled for an evaluation.
+EVAL_SAMPLES = 30
+
+
+def int8_model_path_for(model_path):
+    return os.path.splitext(model_path)[0] + ".int8.onnx"
+
+
+def export_int8(model_path):
+    """Path of the INT8 ONNX model derived from model_path, built if missing or stale"""
+    int8_path = int8_model_path_for(model_path)
+    if os.path.exists(int8_path) and os.path.getmtime(int8_path) >= os.path.getmtime(model_path):
+        return int8_path
+
+    import onnx
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    with tempfile.TemporaryDirectory() as tmp_dir, profiler.span("quantize.export"):
+        # Export from a copy so an existing <name>.onnx next to the .pt isn't overwritten.
+        pt_copy = os.path.join(tmp_dir, "model.pt")
+        shutil.copy(model_path, pt_copy)
+        onnx_path = YOLO(pt_copy).export(format="onnx", dynamic=True, device="cpu")
+        tmp_path = os.path.join(tmp_dir, "model.int8.onnx")
+        # ConvInteger on CPU only takes unsigned INT8 weights.
+        quantize_dynamic(onnx_path, tmp_path, op_types_to_quantize=QUANTIZED_OPS, weight_type=QuantType.QUInt8)
+        # Ultralytics reads class names, stride and task from the model metadata.
+        quantized = onnx.load(tmp_path)
+        if not quantized.metadata_props:
+            quantized.metadata_props.extend(onnx.load(onnx_path).metadata_props)
+            onnx.save(quantized, tmp_path)
+        shutil.move(tmp_path, int8_path + ".tmp")
+    os.replace(int8_path + ".tmp", int8_path)
+    return int8_path
+
+
+def load_int8(model_path):
+    """YOLO wrapper around the INT8 ONNX model of model_path"""
+    return YOLO(export_int8(model_path), task="segment")
+
+
+def _instances(results):
+    """(class ids, bool masks on the IOU_GRID) of one image's results"""
+    r = results[0]
+    if r.masks is None or not len(r.masks):
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 1, 1), dtype=bool)
+    masks = r.masks.data.cpu().numpy()
+    h, w = masks.shape[1:]
+    scale = IOU_GRID / max(h, w)
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    grid = np.stack([cv2.resize(m, size, interpolation=cv2.INTER_AREA) for m in masks]) > 0.5
+    return r.boxes.cls.cpu().numpy().astype(np.int64), grid
+
+
+def _match(classes_a, masks_a, classes_b, masks_b):
+    """Greedy one-to-one matching by mask IoU >= MATCH_IOU: [(iou, same class), ...]"""
+    if not len(masks_a) or not len(masks_b):
+        return []
+    a = masks_a.reshape(len(masks_a), -1).astype(np.float32)
+    b = masks_b.reshape(len(masks_b), -1).astype(np.float32)
+    inter = a @ b.T
+    union = a.sum(1)[:, None] + b.sum(1)[None, :] - inter
+    iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+    pairs = []
+    for flat in np.argsort(iou, axis=None)[::-1]:
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < MATCH_IOU:
+            break
+        if np.isnan(iou[i, j]):
+            continue
+        pairs.append((float(iou[i, j]), bool(classes_a[i] == classes_b[j])))
+        iou[i, :] = np.nan
+        iou[:, j] = np.nan
+    return pairs
+
+
+def _latency_summary(latencies, elapsed):
+    ms = np.asarray(latencies) * 1e3
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "images_per_s": len(ms) / sum(elapsed) if sum(elapsed) > 0 else 0.0,
+    }
+
+
+def evaluate(model_path, image_paths, imgsz, conf=0.25, checkpoint=None):
+    """Run the float and INT8 models over image_paths on the CPU and compare them.
+
+    Latency is the time of one model call (pre-processing, inference and
+    post-processing); throughput also counts decoding the image. Time
+    spent paused in checkpoint() between images is not counted. Instances
+    are matched by mask IoU; agreement is the F1 of the matches, taking
+    the float model as the reference. Returns a dict, see format_report.
+    """
+    variants = {"float": YOLO(model_path), "int8": load_int8(model_path)}
+    outputs = {name: [] for name in variants}
+    timings = {}
+    for name, model in variants.items():
+        # The first call initializes the runtime and is not timed.
+        model(image_paths[0], imgsz=imgsz, conf=conf, device="cpu", retina_masks=True, verbose=False)
+        latencies, elapsed = [], []
+        for path in image_paths:
+            if checkpoint is not None:
+                checkpoint()
+            start = time.perf_counter()
+            img = cv2.imread(path)
+            if img is None:
+                outputs[name].append(None)
+                continue
+            t = time.perf_counter()
+            results = model(img, imgsz=imgsz, conf=conf, device="cpu", retina_masks=True, verbose=False)
+            latencies.append(time.perf_counter() - t)
+            elapsed.append(time.perf_counter() - start)
+            outputs[name].append(_instances(results))
+        timings[name] = _latency_summary(latencies, elapsed)
+
+    n_float = n_int8 = 0
+    pairs = []
+    for reference, candidate in zip(outputs["float"], outputs["int8"]):
+        if reference is None or candidate is None:
+            continue
+        n_float += len(reference[0])
+        n_int8 += len(candidate[0])
+        pairs += _match(*reference, *candidate)
+    matched = len(pairs)
+    return {
+        "images": sum(1 for out in outputs["float"] if out is not None),
+        "float": timings["float"],
+        "int8": timings["int8"],
+        "speedup": timings["float"]["mean_ms"] / timings["int8"]["mean_ms"] if timings["int8"]["mean_ms"] else 0.0,
+        "instances_float": n_float,
+        "instances_int8": n_int8,
+        "agreement": 2 * matched / (n_float + n_int8) if n_float + n_int8 else 1.0,
+        "class_agreement": sum(same for _, same in pairs) / matched if matched else 1.0,
+        "mean_iou": sum(iou for iou, _ in pairs) / matched if matched else 0.0,
+    }
+
+
+def format_report(report):
+    lines = [f"{report['images']} image(s), CPU"]
+    for name in ("float", "int8"):
+        t = report[name]
+        lines.append(
+            f"{name:>5}: {t['mean_ms']:.0f} ms/image (p50 {t['p50_ms']:.0f}, p95 {t['p95_ms']:.0f}), "
+            f"{t['images_per_s']:.2f} images/s"
+        )
+    lines.append(f"Speedup: {report['speedup']:.2f}x")
+    lines.append(f"Instances: float {report['instances_float']}, INT8 {report['instances_int8']}")
+    lines.append(
+        f"Instance agreement: {report['agreement']:.1%} (IoU >= {MATCH_IOU}), "
+        f"same class: {report['class_agreement']:.1%}, mean mask IoU: {report['mean_iou']:.3f}"
+    )
+    return "\n".join(lines)
+
+
+def sample_labeled_images(image_paths, labeled_names, samples, seed=0):
+    """Up to `samples` of image_paths whose basename is in labeled_names, chosen at random"""
+    labeled = [p for p in image_paths if os.path.basename(p) in labeled_names]
+    random.Random(seed).shuffle(labeled)
+    return sorted(labeled[:samples])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from annotation_store import AnnotationStore, store_path_for
+    from yolo_predictor import RealYOLOPredictor
+
+    parser = argparse.ArgumentParser(description="Compare a YOLO-seg model with its INT8 CPU variant.")
+    parser.add_argument("model", help="float .pt model")
+    parser.add_argument("images", help="workspace image folder")
+    parser.add_argument("--samples", type=int, default=EVAL_SAMPLES, help="number of labeled images to run")
+    parser.add_argument("--imgsz", type=int, default=RealYOLOPredictor.IMGSZ)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    images = sorted(
+        os.path.join(args.images, f) for f in os.listdir(args.images) if f.lower().endswith((".png", ".jpg", ".jpeg"))
+    )
+    store_path = store_path_for(os.path.join(os.path.dirname(os.path.abspath(args.images)), "labels"))
+    if os.path.exists(store_path):
+        store = AnnotationStore(store_path)
+        names = store.names()
+        store.close()
+    else:
+        names = {os.path.basename(p) for p in images}
+    sample = sample_labeled_images(images, names, args.samples, args.seed)
+    if not sample:
+        raise SystemExit("No labeled images found.")
+    print(format_report(evaluate(args.model, sample, args.imgsz)))
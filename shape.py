@@ -1,9 +1,14 @@
 import copy
+import itertools
 import math
 import logging
+import types
+import cv2
+import numpy as np
 from PyQt5 import QtCore, QtGui
 
-import utils
+import annotation_format
+import geometry
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +60,41 @@ class Shape:
     scale = 1.5
     line_width = 2.0
 
+    # Level of detail: outlines are drawn simplified to this many screen pixels.
+    lod_screen_tolerance = 0.5
+    # Image-space tolerances of the cached simplified outlines, finest first.
+    LOD_TOLERANCES = (1.0, 2.0, 4.0, 8.0, 16.0, 32.0)
+    # Outlines with fewer vertices are always drawn at full resolution.
+    LOD_MIN_POINTS = 16
+    # Below this zoom, vertex handles are only drawn for the highlighted vertex.
+    min_vertex_scale = 0.2
+
+    # Source of stable ids; copies (e.g. undo backups) keep the id of the original.
+    _ids = itertools.count()
+
+    # Rendering and rarely used state defaults live on the class; instances
+    # only get their own attribute once a value is assigned, so shapes stay
+    # small. Bulk I/O doesn't create shapes at all and works on
+    # annotation_format.AnnotationInstance records instead.
+    fill = False
+    selected = False
+    visible = True
+    cache_label = None
+    cache_description = None
+    attributes = types.MappingProxyType({})
+    kie_linking = ()
+    direction = 0
+    center = None
+    show_degrees = True
+    _highlight_index = None
+    _highlight_mode = NEAR_VERTEX
+    _highlight_settings = {
+        NEAR_VERTEX: (4, P_ROUND),
+        MOVE_VERTEX: (1.5, P_SQUARE),
+    }
+    _vertex_fill_color = None
+    _closed = False
+
     def __init__(
         self,
         label=None,
@@ -66,48 +106,131 @@ class Shape:
         description=None,
         difficult=False,
         direction=0,
-        attributes={},
-        kie_linking=[],
+        attributes=None,
+        kie_linking=None,
     ):
+        self.id = next(Shape._ids)
         self.label = label
         self.score = score
         self.group_id = group_id
         self.description = description
         self.difficult = difficult
-        self.kie_linking = kie_linking
+        if kie_linking:
+            self.kie_linking = list(kie_linking)
         self.points = []
-        self.fill = False
-        self.selected = False
         self.shape_type = shape_type
         self.flags = flags
         self.other_data = {}
-        self.attributes = attributes
-        self.cache_label = None
-        self.cache_description = None
-        self.visible = True
+        if attributes:
+            self.attributes = dict(attributes)
 
         # Rotation setting
-        self.direction = direction
-        self.center = None
-        self.show_degrees = True
-
-        self._highlight_index = None
-        self._highlight_mode = self.NEAR_VERTEX
-        self._highlight_settings = {
-            self.NEAR_VERTEX: (4, self.P_ROUND),
-            self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-        }
-
-        self._vertex_fill_color = None
-
-        self._closed = False
+        if direction:
+            self.direction = direction
 
         if line_color is not None:
             # Override the class line_color attribute
             # with an object attribute. Currently this
             # is used for drawing the pending line a different color.
             self.line_color = line_color
-        self.shape_type = shape_type
+
+    @classmethod
+    def from_instance(cls, inst, class_names):
+        """View-layer shape for an AnnotationInstance record, or None for unknown classes"""
+        if not (0 <= inst.class_id < len(class_names)):
+            print(f"Unknown class id {inst.class_id}")
+            return None
+        shape = cls(label=class_names[inst.class_id], shape_type='polygon', score=inst.score)
+        points = np.asarray(inst.points, dtype=np.float32).reshape(-1, 2)
+        shape.points = [QtCore.QPointF(x, y) for x, y in points.tolist()]
+        shape._points_array = points
+        shape.close()
+        shape.other_data["provenance"] = inst.provenance
+        shape.other_data["review_flags"] = inst.flags
+        if inst.mask is not None:
+            shape.other_data["mask_rle"] = inst.mask
+        return shape
+
+    def to_instance(self, class_id, reviewed=True):
+        """AnnotationInstance record of this shape"""
+        flags = self.other_data.get("review_flags", 0)
+        if reviewed:
+            flags |= annotation_format.FLAG_REVIEWED
+        return annotation_format.AnnotationInstance(
+            class_id,
+            self.points_array(),
+            self.score,
+            flags=flags,
+            provenance=self.other_data.get("provenance", annotation_format.PROVENANCE_IMPORTED),
+            mask=self.other_data.get("mask_rle"),
+        )
+
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, value):
+        self._points = value
+        self.invalidate_geometry()
+
+    def invalidate_geometry(self):
+        """Drop cached geometry; call after mutating points in place"""
+        self._points_array = None
+        self._bbox = None
+        self._lod = {}
+
+    def __getstate__(self):
+        # Caches are rebuilt on demand and are not worth copying (undo backups).
+        state = self.__dict__.copy()
+        state["_points_array"] = None
+        state["_bbox"] = None
+        state["_lod"] = {}
+        return state
+
+    def points_array(self):
+        """Points as a cached (N, 2) float32 array"""
+        if self._points_array is None:
+            self._points_array = np.array(
+                [(p.x(), p.y()) for p in self._points], dtype=np.float32
+            ).reshape(-1, 2)
+        return self._points_array
+
+    def cached_bounding_rect(self):
+        """Bounding rectangle, cached until the points change"""
+        if self._bbox is None:
+            if self.shape_type == "circle" or not self._points:
+                self._bbox = self.bounding_rect() if self._points else QtCore.QRectF()
+            else:
+                arr = self.points_array()
+                x0, y0 = arr.min(axis=0)
+                x1, y1 = arr.max(axis=0)
+                self._bbox = QtCore.QRectF(float(x0), float(y0), float(x1 - x0), float(y1 - y0))
+        return self._bbox
+
+    def intersects_rect(self, rect, margin=0.0):
+        """Check if the cached bounding box (grown by margin) intersects rect"""
+        bbox = self.cached_bounding_rect().adjusted(-margin, -margin, margin, margin)
+        return rect.intersects(bbox)
+
+    def lod_polygon(self, scale):
+        """Outline simplified for the given zoom, or None to draw it at full resolution"""
+        if len(self._points) < self.LOD_MIN_POINTS:
+            return None
+        tolerance = self.lod_screen_tolerance / scale
+        level = None
+        for t in self.LOD_TOLERANCES:
+            if t > tolerance:
+                break
+            level = t
+        if level is None:
+            return None
+        polygon = self._lod.get(level)
+        if polygon is None:
+            approx = cv2.approxPolyDP(self.points_array().reshape(-1, 1, 2), level, self.is_closed())
+            polygon = QtGui.QPolygonF([QtCore.QPointF(x, y) for x, y in approx.reshape(-1, 2).tolist()])
+            self._lod[level] = polygon
+        return polygon
 
     def to_dict(self):
         dictData = {
@@ -119,8 +242,8 @@ class Shape:
             "difficult": self.difficult,
             "shape_type": self.shape_type,
             "flags": self.flags,
-            "attributes": self.attributes,
-            "kie_linking": self.kie_linking,
+            "attributes": dict(self.attributes),
+            "kie_linking": list(self.kie_linking),
         }
         if self.shape_type == "rotation":
             dictData["direction"] = self.direction
@@ -197,6 +320,7 @@ class Shape:
                 self.close()
             else:
                 self.points.append(point)
+        self.invalidate_geometry()
 
     def can_add_point(self):
         """Check if shape supports more points"""
@@ -205,16 +329,20 @@ class Shape:
     def pop_point(self):
         """Remove and return the last point of the shape"""
         if self.points:
-            return self.points.pop()
+            point = self.points.pop()
+            self.invalidate_geometry()
+            return point
         return None
 
     def insert_point(self, i, point):
         """Insert a point to a specific index"""
         self.points.insert(i, point)
+        self.invalidate_geometry()
 
     def remove_point(self, i):
         """Remove point from a specific index"""
         self.points.pop(i)
+        self.invalidate_geometry()
 
     def is_closed(self):
         """Check if the shape is closed"""
@@ -287,18 +415,33 @@ class Shape:
                 assert len(self.points) == 1
                 self.draw_vertex(vrtx_path, 0, True)
             else:
-                line_path.moveTo(self.points[0])
-                # Uncommenting the following line will draw 2 paths
-                # for the 1st vertex, and make it non-filled, which
-                # may be desirable.
-                self.draw_vertex(vrtx_path, 0)
+                show_vertices = self.scale >= self.min_vertex_scale
+                lod = None
+                if not self.selected and self._highlight_index is None:
+                    lod = self.lod_polygon(self.scale)
+
+                if lod is not None:
+                    line_path.addPolygon(lod)
+                    if self.is_closed():
+                        line_path.closeSubpath()
+                    if show_vertices:
+                        self.draw_vertex(vrtx_path, 0)
+                else:
+                    line_path.moveTo(self.points[0])
+                    # Uncommenting the following line will draw 2 paths
+                    # for the 1st vertex, and make it non-filled, which
+                    # may be desirable.
+                    if show_vertices:
+                        self.draw_vertex(vrtx_path, 0)
 
-                for i, p in enumerate(self.points):
-                    line_path.lineTo(p)
-                    if self.selected:
-                        self.draw_vertex(vrtx_path, i)
-                if self.is_closed():
-                    line_path.lineTo(self.points[0])
+                    for i, p in enumerate(self.points):
+                        line_path.lineTo(p)
+                        if self.selected and show_vertices:
+                            self.draw_vertex(vrtx_path, i)
+                    if self.is_closed():
+                        line_path.lineTo(self.points[0])
+                    if not show_vertices and self._highlight_index is not None:
+                        self.draw_vertex(vrtx_path, self._highlight_index)
 
             painter.drawPath(line_path)
             painter.drawPath(vrtx_path)
@@ -355,26 +498,11 @@ class Shape:
         """Find the index of the nearest vertex to a point
         Only consider if the distance is smaller than epsilon
         """
-        min_distance = float("inf")
-        min_i = None
-        for i, p in enumerate(self.points):
-            dist = utils.distance(p - point)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                min_i = i
-        return min_i
+        return geometry.nearest_vertex(self.points_array(), (point.x(), point.y()), epsilon)
 
     def nearest_edge(self, point, epsilon):
         """Get nearest edge index"""
-        min_distance = float("inf")
-        post_i = None
-        for i in range(len(self.points)):
-            line = [self.points[i - 1], self.points[i]]
-            dist = utils.distance_to_line(point, line)
-            if dist <= epsilon and dist < min_distance:
-                min_distance = dist
-                post_i = i
-        return post_i
+        return geometry.nearest_edge(self.points_array(), (point.x(), point.y()), epsilon)
 
     def contains_point(self, point):
         """Check if shape contains a point"""
@@ -418,6 +546,7 @@ class Shape:
     def move_vertex_by(self, i, offset):
         """Move a specific vertex by an offset"""
         self.points[i] = self.points[i] + offset
+        self.invalidate_geometry()
 
     def highlight_vertex(self, i, action):
         """Highlight a vertex appropriately based on the current action
@@ -446,3 +575,4 @@ class Shape:
 
     def __setitem__(self, key, value):
         self.points[key] = value
+        self.invalidate_geometry()
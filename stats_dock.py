@@ -0,0 +1,137 @@
+from PyQt5.QtWidgets import (
+    QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTableWidget, QTableWidgetItem,
+    QHeaderView, QAbstractItemView
+)
+from PyQt5.QtGui import QPainter, QColor
+from PyQt5.QtCore import Qt, QTimer, pyqtSignal
+
+from dataset_stats import SCORE_BINS, VERTEX_BOUNDS
+
+
+class BarChartWidget(QWidget):
+    """Bar chart of one histogram with a label under each bar"""
+
+    def __init__(self, title, labels, color, parent=None):
+        super().__init__(parent)
+        self.title = title
+        self.labels = labels
+        self.color = color
+        self.counts = None
+        self.setMinimumHeight(110)
+
+    def set_counts(self, counts):
+        self.counts = counts
+        self.update()
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), self.palette().base())
+        if self.counts is None or not sum(self.counts):
+            p.drawText(self.rect(), Qt.AlignCenter, f"{self.title}: no instances")
+            return
+
+        peak = max(self.counts) or 1
+        label_h = p.fontMetrics().height()
+        bar_w = self.width() / len(self.counts)
+        plot_h = self.height() - label_h - 4
+        for i, n in enumerate(self.counts):
+            h = int(plot_h * n / peak)
+            x = int(i * bar_w)
+            p.fillRect(x + 1, plot_h - h, max(1, int(bar_w) - 2), h, self.color)
+            p.drawText(x, plot_h + 2, int(bar_w), label_h, Qt.AlignHCenter, self.labels[i])
+        p.drawText(self.rect().adjusted(4, 2, -4, 0), Qt.AlignLeft | Qt.AlignTop,
+                   f"{self.title} (n={sum(self.counts)})")
+
+
+class StatsDock(QDockWidget):
+    """Dock showing class balance and labeling progress of the open workspace.
+
+    workspace() returns (annotation_store, class_names, number of images).
+    The dock only reads the store's running totals, so refreshing it costs
+    the same with 100 or 100k images. When the totals have to be recounted
+    rebuild_requested is emitted and the dock shows the last counts it had.
+    """
+
+    COLUMNS = ["Class", "Instances", "Images", "Share"]
+
+    rebuild_requested = pyqtSignal()
+
+    def __init__(self, workspace, parent=None):
+        super().__init__("Statistics", parent)
+        self.setObjectName("StatsDock")
+        self.workspace = workspace
+
+        container = QWidget()
+        layout = QVBoxLayout(container)
+
+        self.progress_label = QLabel()
+        self.progress_label.setWordWrap(True)
+        layout.addWidget(self.progress_label)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionMode(QAbstractItemView.NoSelection)
+        layout.addWidget(self.table)
+
+        charts = QHBoxLayout()
+        score_labels = [f"{i / SCORE_BINS:.1f}" for i in range(SCORE_BINS)]
+        self.score_chart = BarChartWidget("Confidence", score_labels, QColor(230, 150, 30))
+        vertex_labels = [str(b) for b in VERTEX_BOUNDS] + [">"]
+        self.vertex_chart = BarChartWidget("Vertices", vertex_labels, QColor(70, 130, 200))
+        charts.addWidget(self.score_chart)
+        charts.addWidget(self.vertex_chart)
+        layout.addLayout(charts)
+
+        self.setWidget(container)
+
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def on_visibility_changed(self, visible):
+        if visible:
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        store, class_names, n_images = self.workspace()
+        if store is None:
+            self.progress_label.setText("No folder open")
+            self.table.setRowCount(0)
+            self.score_chart.set_counts(None)
+            self.vertex_chart.set_counts(None)
+            return
+        stats = store.dataset_stats()
+        if stats is None:
+            self.progress_label.setText("Counting labels...")
+            self.rebuild_requested.emit()
+            return
+
+        # Images without instances that aren't reviewed show as unlabeled in the file list.
+        empty = max(0, n_images - stats.reviewed - stats.predicted)
+        num_instances = stats.num_instances
+        mean_vertices = stats.vertex_total / num_instances if num_instances else 0.0
+        self.progress_label.setText(
+            f"Images: {n_images}   Reviewed: {stats.reviewed}   Predicted: {stats.predicted}   "
+            f"Empty: {empty}\nInstances: {num_instances}   Mean vertices: {mean_vertices:.1f}"
+        )
+
+        class_ids = sorted(stats.instances, key=lambda c: -stats.instances[c])
+        self.table.setRowCount(len(class_ids))
+        for row, class_id in enumerate(class_ids):
+            name = class_names[class_id] if class_id < len(class_names) else f"class {class_id}"
+            n = stats.instances[class_id]
+            values = [name, str(n), str(stats.images.get(class_id, 0)), f"{100.0 * n / num_instances:.1f}%"]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.table.setItem(row, col, item)
+        self.score_chart.set_counts(stats.scores.tolist())
+        self.vertex_chart.set_counts(stats.vertices.tolist())
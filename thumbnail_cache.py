@@ -0,0 +1,156 @@
+import os
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+
+import cv2
+from PyQt5.QtCore import QObject, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from profiler import profiler
+
+THUMBNAILS_FILENAME = "thumbnails.db"
+
+
+def thumbnail_path_for(labels_dir):
+    """Thumbnail cache that sits next to the labels folder, like the annotation store"""
+    return os.path.join(os.path.dirname(os.path.abspath(labels_dir)), THUMBNAILS_FILENAME)
+
+
+def make_thumbnail(path, size):
+    """JPEG bytes of an image scaled to fit size x size, or None if it can't be read.
+
+    The image is decoded at a quarter of its resolution, which is much
+    faster than a full decode; only images too small for that are decoded
+    in full.
+    """
+    img = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4)
+    if img is not None and max(img.shape[:2]) < size:
+        img = cv2.imread(path)
+    if img is None:
+        return None
+    h, w = img.shape[:2]
+    scale = size / max(h, w)
+    if scale < 1:
+        img = cv2.resize(img, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    return buf.tobytes() if ok else None
+
+
+class ThumbnailCache(QObject):
+    """Image thumbnails made in worker threads and kept in a SQLite file.
+
+    Thumbnails are stored as JPEG keyed by image name and mtime, so a
+    reopened folder only decodes images that are new or changed. Requests
+    are served newest first and only the latest MAX_PENDING are kept:
+    while scrolling, the cells just scrolled into view are made before
+    those already scrolled past. Recently used thumbnails stay in memory.
+    """
+
+    SIZE = 160
+    MEMORY_SIZE = 1024
+    MAX_PENDING = 256
+    WORKERS = 4
+
+    thumbnail_ready = pyqtSignal(str)
+    # Hands a loaded thumbnail from a worker to the GUI thread.
+    _loaded = pyqtSignal(str, bytes)
+
+    def __init__(self, path, parent=None):
+        super().__init__(parent)
+        self.path = path
+        self._db_lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails (name TEXT PRIMARY KEY, mtime REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._queued = set()
+        self._closed = False
+        self._pixmaps = OrderedDict()
+        self._loaded.connect(self._on_loaded)
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.WORKERS)]
+        for worker in self._workers:
+            worker.start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._pending.clear()
+            self._cond.notify_all()
+        for worker in self._workers:
+            worker.join()
+        with self._db_lock:
+            self.conn.close()
+
+    def get(self, path):
+        """Thumbnail QPixmap of an image, or None until it is ready (thumbnail_ready is emitted then)"""
+        pixmap = self._pixmaps.get(path)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(path)
+            return pixmap
+        with self._cond:
+            if path in self._queued:
+                if path in self._pending:
+                    self._pending.remove(path)
+                    self._pending.append(path)
+                return None
+            self._queued.add(path)
+            self._pending.append(path)
+            if len(self._pending) > self.MAX_PENDING:
+                self._queued.discard(self._pending.popleft())
+            self._cond.notify()
+        return None
+
+    def discard(self, path):
+        """Forget the in-memory thumbnail of an image whose file changed"""
+        self._pixmaps.pop(path, None)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                path = self._pending.pop()
+            data = self._load(path)
+            if data is not None:
+                self._loaded.emit(path, data)
+            else:
+                with self._cond:
+                    self._queued.discard(path)
+
+    def _load(self, path):
+        name = os.path.basename(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        with self._db_lock:
+            row = self.conn.execute(
+                "SELECT data FROM thumbnails WHERE name = ? AND mtime = ?", (name, mtime)
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        with profiler.span("thumbnail.make"):
+            data = make_thumbnail(path, self.SIZE)
+        if data is not None:
+            with self._db_lock:
+                if not self._closed:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO thumbnails (name, mtime, data) VALUES (?, ?, ?)", (name, mtime, data)
+                    )
+        return data
+
+    def _on_loaded(self, path, data):
+        with self._cond:
+            self._queued.discard(path)
+        # QPixmap may only be created on the GUI thread.
+        self._pixmaps[path] = QPixmap.fromImage(QImage.fromData(data, "JPG"))
+        while len(self._pixmaps) > self.MEMORY_SIZE:
+            self._pixmaps.popitem(last=False)
+        self.thumbnail_ready.emit(path)
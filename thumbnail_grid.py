@@ -0,0 +1,108 @@
+import os
+
+from PyQt5.QtCore import Qt, QPointF, QRectF, QSize
+from PyQt5.QtGui import QColor, QPen, QPolygonF
+from PyQt5.QtWidgets import QListView, QStyle, QStyledItemDelegate
+
+from file_list_model import FileListModel, STATUS_COLORS
+from thumbnail_cache import ThumbnailCache
+
+
+class ThumbnailDelegate(QStyledItemDelegate):
+    """Paints one grid cell: the thumbnail, its polygons, a status frame and the file name.
+
+    annotations(name) returns the AnnotationFile of an image or None;
+    color_for_class(class_id) the QColor of its polygons.
+    """
+
+    MARGIN = 4
+
+    def __init__(self, annotations, color_for_class, parent=None):
+        super().__init__(parent)
+        self.cache = None
+        self.annotations = annotations
+        self.color_for_class = color_for_class
+
+    def sizeHint(self, option, index):
+        text_h = option.fontMetrics.height()
+        size = ThumbnailCache.SIZE + 2 * self.MARGIN
+        return QSize(size, size + text_h)
+
+    def paint(self, painter, option, index):
+        painter.save()
+        rect = option.rect
+        if option.state & QStyle.State_Selected:
+            painter.fillRect(rect, option.palette.highlight())
+        text_h = option.fontMetrics.height()
+        cell = QRectF(rect.adjusted(self.MARGIN, self.MARGIN, -self.MARGIN, -self.MARGIN - text_h))
+
+        path = index.data(FileListModel.PathRole)
+        pixmap = self.cache.get(path) if self.cache is not None else None
+        if pixmap is None or pixmap.isNull():
+            painter.fillRect(cell, QColor(60, 60, 60))
+        else:
+            scale = min(cell.width() / pixmap.width(), cell.height() / pixmap.height())
+            w, h = pixmap.width() * scale, pixmap.height() * scale
+            target = QRectF(cell.x() + (cell.width() - w) / 2, cell.y() + (cell.height() - h) / 2, w, h)
+            painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+            self._paint_polygons(painter, os.path.basename(path), target)
+
+        status = index.data(FileListModel.StatusRole)
+        if status in STATUS_COLORS:
+            painter.setPen(QPen(STATUS_COLORS[status], 2))
+            painter.setBrush(Qt.NoBrush)
+            painter.drawRect(cell)
+        painter.setPen(option.palette.color(option.palette.HighlightedText if option.state & QStyle.State_Selected
+                                            else option.palette.Text))
+        name = option.fontMetrics.elidedText(index.data(Qt.DisplayRole), Qt.ElideMiddle, rect.width() - 2 * self.MARGIN)
+        painter.drawText(rect.adjusted(self.MARGIN, 0, -self.MARGIN, 0), Qt.AlignHCenter | Qt.AlignBottom, name)
+        painter.restore()
+
+    def _paint_polygons(self, painter, name, target):
+        ann = self.annotations(name)
+        if ann is None:
+            return
+        painter.setRenderHint(painter.Antialiasing)
+        for i in range(len(ann)):
+            points = ann.normalized_polygon(i)
+            polygon = QPolygonF([QPointF(target.x() + x * target.width(), target.y() + y * target.height())
+                                 for x, y in points.tolist()])
+            color = QColor(self.color_for_class(int(ann.instances[i]["class_id"])))
+            painter.setPen(QPen(color, 1.5))
+            color.setAlpha(60)
+            painter.setBrush(color)
+            painter.drawPolygon(polygon)
+
+
+class ThumbnailGrid(QListView):
+    """Grid of workspace images over the file list model.
+
+    Qt only paints the cells in view, and a thumbnail is only requested
+    when its cell is painted, so the grid scrolls the same with 50k
+    images as with 50. Activating a cell (double-click / Enter) emits
+    activated like any item view.
+    """
+
+    def __init__(self, annotations, color_for_class, parent=None):
+        super().__init__(parent)
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setSpacing(2)
+        self.setSelectionMode(QListView.SingleSelection)
+        self.delegate = ThumbnailDelegate(annotations, color_for_class, self)
+        self.setItemDelegate(self.delegate)
+
+    def set_cache(self, cache):
+        if self.delegate.cache is not None:
+            self.delegate.cache.thumbnail_ready.disconnect(self.on_thumbnail_ready)
+        self.delegate.cache = cache
+        if cache is not None:
+            cache.thumbnail_ready.connect(self.on_thumbnail_ready)
+        self.viewport().update()
+
+    def on_thumbnail_ready(self, path):
+        # Repaints of several thumbnails arriving together are merged by Qt.
+        self.viewport().update()
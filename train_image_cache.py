@@ -0,0 +1,131 @@
+import hashlib
+import json
+import math
+import os
+
+import cv2
+
+from frame import image_size
+from profiler import profiler
+
+TRAIN_CACHE_DIRNAME = "train_cache"
+SETTINGS_FILENAME = "cache.json"
+# The training dialog's default image size.
+DEFAULT_IMGSZ = 640
+# cv2 decodes JPEGs at 1/2, 1/4 or 1/8 scale much faster than in full.
+REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+
+def train_cache_dir_for(labels_dir):
+    """Resized training image folder, next to the labels folder"""
+    return os.path.join(os.path.dirname(os.path.abspath(labels_dir)), TRAIN_CACHE_DIRNAME)
+
+
+def resize_for_training(img, imgsz):
+    """img with its long side scaled to imgsz, rounded like the ultralytics loader so it isn't resized again"""
+    h, w = img.shape[:2]
+    r = imgsz / max(h, w)
+    size = (min(math.ceil(w * r), imgsz), min(math.ceil(h * r), imgsz))
+    if size == (w, h):
+        return img
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA if r < 1 else cv2.INTER_LINEAR)
+
+
+class TrainImageCache:
+    """Reviewed images pre-resized to the training imgsz, made in idle time while annotating.
+
+    Ultralytics loads every training image at full resolution and shrinks
+    it to imgsz, for every epoch. The generated dataset links the cached
+    copy instead, whose long side already is imgsz, so loading it is a
+    small decode and no resize. A cached file is named after the source
+    path and mtime and kept in a folder per imgsz, so an edited image or
+    another imgsz never picks up a stale copy. Images no larger than
+    imgsz, and images not cached yet, are linked as they are.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.settings_path = os.path.join(cache_dir, SETTINGS_FILENAME)
+        self.imgsz = DEFAULT_IMGSZ
+        if os.path.exists(self.settings_path):
+            with open(self.settings_path, "r") as f:
+                self.imgsz = json.load(f).get("imgsz", DEFAULT_IMGSZ)
+        # {name: updated} of the reviewed images already cached (or found not to need it) this session.
+        self.done = {}
+
+    def set_imgsz(self, imgsz):
+        """Cache for another training image size from now on"""
+        if imgsz == self.imgsz:
+            return
+        self.imgsz = imgsz
+        self.done = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.settings_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"imgsz": imgsz}, f)
+        os.replace(tmp_path, self.settings_path)
+
+    def _size_dir(self):
+        return os.path.join(self.cache_dir, str(self.imgsz))
+
+    def cached_path(self, path):
+        """Where the resized copy of an image goes, or None if the image can't be read"""
+        path = os.path.abspath(path)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        key = hashlib.sha1(f"{path}\0{mtime}".encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self._size_dir(), key + os.path.splitext(path)[1].lower())
+
+    def lookup(self, path):
+        """Image to train on for path: its resized copy if there is one, else path itself"""
+        cached = self.cached_path(path)
+        return cached if cached is not None and os.path.exists(cached) else os.path.abspath(path)
+
+    def add(self, path, img=None):
+        """Write the resized copy of an image if it needs one; img is the decoded BGR image if at hand.
+
+        Returns the cached path, or None when the image is used as it is.
+        """
+        cached = self.cached_path(path)
+        if cached is None or os.path.exists(cached):
+            return cached
+        size = image_size(path) if img is None else (img.shape[1], img.shape[0])
+        if size is None or max(size) <= self.imgsz:
+            return None
+        with profiler.span("train_cache.resize"):
+            if img is None:
+                img = self._decode(path, max(size))
+                if img is None:
+                    return None
+            img = resize_for_training(img, self.imgsz)
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            ext = os.path.splitext(cached)[1]
+            tmp_path = cached[:-len(ext)] + ".tmp" + ext
+            params = [cv2.IMWRITE_JPEG_QUALITY, 95] if ext in (".jpg", ".jpeg") else [cv2.IMWRITE_PNG_COMPRESSION, 1]
+            if not cv2.imwrite(tmp_path, img, params):
+                print(f"Error writing training cache image {tmp_path}")
+                return None
+            os.replace(tmp_path, cached)
+        return cached
+
+    def _decode(self, path, long_side):
+        """Decode at the smallest reduced scale that is still at least imgsz"""
+        for factor, flag in REDUCED_FLAGS:
+            if long_side // factor >= self.imgsz:
+                return cv2.imread(path, flag)
+        return cv2.imread(path)
+
+    def prune(self, keep):
+        """Delete the cached files of the current imgsz that are not in keep (cached paths).
+
+        Folders of other image sizes are left alone; a resumed training job
+        may still link to them.
+        """
+        size_dir = self._size_dir()
+        if not os.path.isdir(size_dir):
+            return
+        for entry in os.scandir(size_dir):
+            if entry.path not in keep:
+                os.remove(entry.path)
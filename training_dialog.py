@@ -5,7 +5,7 @@ from PyQt5.QtWidgets import (
 )
 
 class TrainingDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, workspace_available=False):
         super().__init__(parent)
         self.setWindowTitle("Train Model")
         self.setMinimumWidth(600)
@@ -20,6 +20,31 @@ class TrainingDialog(QDialog):
         self.browse_button.clicked.connect(self.browse_yaml)
         self.data_layout.addRow("Dataset YAML:", self.browse_button)
         self.data_layout.addRow("", self.yaml_path_edit)
+        self.generate_checkbox = QCheckBox("Generate from the workspace's reviewed labels")
+        self.generate_checkbox.toggled.connect(self.on_generate_toggled)
+        self.val_fraction_dspinbox = QDoubleSpinBox()
+        self.val_fraction_dspinbox.setRange(0.05, 0.5)
+        self.val_fraction_dspinbox.setSingleStep(0.05)
+        self.val_fraction_dspinbox.setValue(0.2)
+        self.data_layout.addRow("", self.generate_checkbox)
+        self.data_layout.addRow("Validation Fraction:", self.val_fraction_dspinbox)
+
+        self.incremental_checkbox = QCheckBox("Incremental: fine-tune on new images plus a replay buffer")
+        self.incremental_epochs_spinbox = QSpinBox()
+        self.incremental_epochs_spinbox.setRange(1, 1000)
+        self.incremental_epochs_spinbox.setValue(10)
+        self.replay_ratio_dspinbox = QDoubleSpinBox()
+        self.replay_ratio_dspinbox.setRange(0.0, 10.0)
+        self.replay_ratio_dspinbox.setSingleStep(0.5)
+        self.replay_ratio_dspinbox.setValue(1.0)
+        self.incremental_checkbox.toggled.connect(self.on_incremental_toggled)
+        self.data_layout.addRow("", self.incremental_checkbox)
+        self.data_layout.addRow("Incremental Epochs:", self.incremental_epochs_spinbox)
+        self.data_layout.addRow("Replay Ratio (old / new):", self.replay_ratio_dspinbox)
+        self.generate_checkbox.setEnabled(workspace_available)
+        self.generate_checkbox.setChecked(workspace_available)
+        self.incremental_checkbox.setChecked(workspace_available)
+        self.on_generate_toggled(workspace_available)
         self.layout.addWidget(self.data_group)
 
         # Training parameters
@@ -51,6 +76,10 @@ class TrainingDialog(QDialog):
         self.patience_spinbox = QSpinBox()
         self.patience_spinbox.setRange(0, 1000)
         self.patience_spinbox.setValue(50)
+        self.save_period_spinbox = QSpinBox()
+        self.save_period_spinbox.setRange(-1, 1000)
+        self.save_period_spinbox.setValue(10)
+        self.save_period_spinbox.setToolTip("Keep an epoch checkpoint every N epochs (-1 = off). last.pt is always saved.")
 
         self.optimizer_combo = QComboBox()
         self.optimizer_combo.addItems(['auto', 'SGD', 'Adam', 'AdamW'])
@@ -72,6 +101,8 @@ class TrainingDialog(QDialog):
 
         self.training_layout.addWidget(QLabel("Patience:"), 3, 0)
         self.training_layout.addWidget(self.patience_spinbox, 3, 1)
+        self.training_layout.addWidget(QLabel("Checkpoint Every:"), 3, 2)
+        self.training_layout.addWidget(self.save_period_spinbox, 3, 3)
         self.layout.addWidget(self.training_group)
 
         # Augmentation parameters
@@ -167,6 +198,32 @@ class TrainingDialog(QDialog):
         if file_path:
             self.yaml_path_edit.setText(file_path)
 
+    def on_generate_toggled(self, checked):
+        self.browse_button.setEnabled(not checked)
+        self.yaml_path_edit.setEnabled(not checked)
+        self.val_fraction_dspinbox.setEnabled(checked)
+        self.incremental_checkbox.setEnabled(checked)
+        self.on_incremental_toggled(checked and self.incremental_checkbox.isChecked())
+
+    def on_incremental_toggled(self, checked):
+        self.incremental_epochs_spinbox.setEnabled(checked)
+        self.replay_ratio_dspinbox.setEnabled(checked)
+
+    def generate_dataset(self):
+        return self.generate_checkbox.isChecked()
+
+    def val_fraction(self):
+        return self.val_fraction_dspinbox.value()
+
+    def incremental(self):
+        return self.generate_dataset() and self.incremental_checkbox.isChecked()
+
+    def incremental_epochs(self):
+        return self.incremental_epochs_spinbox.value()
+
+    def replay_ratio(self):
+        return self.replay_ratio_dspinbox.value()
+
     def get_parameters(self):
         return {
             'data': self.yaml_path_edit.text(),
@@ -176,6 +233,7 @@ class TrainingDialog(QDialog):
             'lr0': self.lr0_dspinbox.value(),
             'lrf': self.lrf_dspinbox.value(),
             'patience': self.patience_spinbox.value(),
+            'save_period': self.save_period_spinbox.value(),
             'optimizer': self.optimizer_combo.currentText(),
             'degrees': self.degrees_dspinbox.value(),
             'translate': self.translate_dspinbox.value(),
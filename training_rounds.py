@@ -0,0 +1,137 @@
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+ROUNDS_FILENAME = "rounds.json"
+
+MODE_FULL = "full"
+MODE_INCREMENTAL = "incremental"
+
+
+def metrics_summary(results):
+    """mAP values of an ultralytics training result, or None where unavailable"""
+    summary = {}
+    for key, attr in (("mask_map", "seg"), ("box_map", "box")):
+        metric = getattr(results, attr, None)
+        value = getattr(metric, "map", None)
+        summary[key] = None if value is None else float(value)
+        value = getattr(metric, "map50", None)
+        summary[key + "50"] = None if value is None else float(value)
+    return summary
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+def _format_map(value):
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+class TrainingRounds:
+    """History of the training rounds run on a generated dataset.
+
+    Besides each round's mode, duration and mAP, it records which version
+    of every image the model has been trained on, so an incremental round
+    can fine-tune on what is new since then plus a replay sample of older
+    images instead of the whole dataset.
+    """
+
+    def __init__(self, dataset_dir):
+        self.dataset_dir = dataset_dir
+        self.path = os.path.join(dataset_dir, ROUNDS_FILENAME)
+        self.history = []
+        self.trained = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            self.history = data.get("history", [])
+            self.trained = data.get("trained", {})
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"history": self.history, "trained": self.trained}, f)
+        os.replace(tmp_path, self.path)
+
+    def plan(self, manifest, incremental, replay_ratio=1.0, seed=0):
+        """Choose the training images of the next round from the dataset manifest.
+
+        A full round trains on the whole train split. An incremental round
+        takes the images added or edited since they were last trained on,
+        plus about replay_ratio times as many older images, sampled per
+        stratum so the replay buffer keeps the class balance.
+        """
+        train = {name: entry for name, entry in manifest.items() if entry["split"] == "train"}
+        number = len(self.history) + 1
+        if not incremental or not self.trained:
+            return {"round": number, "mode": MODE_FULL, "new": sorted(train), "replay": []}
+
+        new = sorted(name for name, entry in train.items() if self.trained.get(name) != entry["updated"])
+        old = [name for name in sorted(train) if self.trained.get(name) == train[name]["updated"]]
+        budget = min(len(old), int(round(len(new) * replay_ratio)))
+        replay = []
+        if budget:
+            rng = np.random.default_rng(seed + number)
+            strata = {}
+            for name in old:
+                strata.setdefault(train[name]["stratum"], []).append(name)
+            for names in strata.values():
+                share = math.ceil(budget * len(names) / len(old))
+                replay += [names[i] for i in rng.permutation(len(names))[:share]]
+            replay = sorted(replay[i] for i in rng.permutation(len(replay))[:budget])
+        return {"round": number, "mode": MODE_INCREMENTAL, "new": new, "replay": replay}
+
+    def write_round_list(self, plan):
+        """Image list of a round's training images, in the dataset's list format"""
+        path = os.path.join(self.dataset_dir, f"train_round_{plan['round']:03d}.txt")
+        with open(path, "w") as f:
+            f.write("".join(f"./images/train/{name}\n" for name in plan["new"] + plan["replay"]))
+        return os.path.basename(path)
+
+    def record(self, plan, manifest, duration, metrics, params):
+        """Store a finished round and mark its images as trained"""
+        for name in plan["new"] + plan["replay"]:
+            entry = manifest.get(name)
+            if entry is not None:
+                self.trained[name] = entry["updated"]
+        self.history.append({
+            "round": plan["round"],
+            "mode": plan["mode"],
+            "finished": time.time(),
+            "new": len(plan["new"]),
+            "replay": len(plan["replay"]),
+            "epochs": params.get("epochs"),
+            "duration": duration,
+            "metrics": metrics,
+        })
+        self._save()
+
+    def report(self):
+        """Plain-text comparison of incremental rounds against full retraining"""
+        lines = [f"{'Round':>5}  {'Mode':<11}  {'Images':>15}  {'Epochs':>6}  {'Time':>9}  {'Mask mAP':>8}  {'Box mAP':>7}"]
+        for entry in self.history:
+            images = str(entry["new"]) if entry["mode"] == MODE_FULL else f"{entry['new']}+{entry['replay']}"
+            lines.append(
+                f"{entry['round']:>5}  {entry['mode']:<11}  {images:>15}  {entry['epochs'] or '':>6}  "
+                f"{_format_duration(entry['duration']):>9}  {_format_map(entry['metrics'].get('mask_map')):>8}  "
+                f"{_format_map(entry['metrics'].get('box_map')):>7}"
+            )
+
+        full = [e for e in self.history if e["mode"] == MODE_FULL]
+        last = self.history[-1] if self.history else None
+        if full and last is not None and last["mode"] == MODE_INCREMENTAL:
+            reference = full[-1]
+            speedup = reference["duration"] / max(last["duration"], 1e-6)
+            line = f"Last incremental round: {speedup:.1f}x faster than the last full retrain (round {reference['round']})"
+            before = reference["metrics"].get("mask_map")
+            after = last["metrics"].get("mask_map")
+            if before is not None and after is not None:
+                line += f", mask mAP {after - before:+.3f}"
+            lines += ["", line]
+        return "\n".join(lines)
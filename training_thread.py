@@ -1,21 +1,192 @@
+import json
+import os
+import threading
+import time
 import traceback
+import uuid
 from PyQt5.QtCore import QThread, pyqtSignal
+from ultralytics import YOLO
+
+from job_scheduler import PRIORITY_TRAINING, JobCancelled
+
+JOBS_FILENAME = "training_jobs.json"
+
+OUTCOME_RUNNING = "running"
+OUTCOME_FINISHED = "finished"
+OUTCOME_CANCELLED = "cancelled"
+OUTCOME_FAILED = "failed"
+OUTCOME_INTERRUPTED = "interrupted"
+
+
+def jobs_path_for(model_path):
+    """Training job history kept next to the model file it updates"""
+    return os.path.join(os.path.dirname(os.path.abspath(model_path)), JOBS_FILENAME)
+
+
+class TrainingCancelled(Exception):
+    pass
+
+
+class JobHistory:
+    """Persisted list of training jobs with their duration and outcome.
+
+    A job still marked running when the history is loaded belonged to a
+    process that died, so it is marked interrupted; if it left a last.pt
+    behind it can be resumed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.jobs = []
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.jobs = json.load(f)
+        interrupted = [job for job in self.jobs if job["outcome"] == OUTCOME_RUNNING]
+        for job in interrupted:
+            job["outcome"] = OUTCOME_INTERRUPTED
+        if interrupted:
+            self.save()
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.jobs, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def start(self, params, resumed_from=None):
+        job = {
+            "id": uuid.uuid4().hex[:8],
+            "started": time.time(),
+            "finished": None,
+            "duration": 0.0,
+            "outcome": OUTCOME_RUNNING,
+            "data": params.get("data"),
+            "epochs": params.get("epochs"),
+            "save_dir": None,
+            "resumed_from": resumed_from,
+            "error": None,
+        }
+        self.jobs.append(job)
+        self.save()
+        return job
+
+    def finish(self, job, outcome, duration, error=None):
+        job["outcome"] = outcome
+        job["finished"] = time.time()
+        job["duration"] += duration
+        job["error"] = error
+        self.save()
+
+    @staticmethod
+    def last_checkpoint(job):
+        if not job.get("save_dir"):
+            return None
+        path = os.path.join(job["save_dir"], "weights", "last.pt")
+        return path if os.path.exists(path) else None
+
+    def resumable(self):
+        """The latest job if it stopped early and left a checkpoint, else None"""
+        if not self.jobs:
+            return None
+        job = self.jobs[-1]
+        if job["outcome"] in (OUTCOME_CANCELLED, OUTCOME_FAILED, OUTCOME_INTERRUPTED) and self.last_checkpoint(job):
+            return job
+        return None
+
 
 class TrainingThread(QThread):
     training_finished = pyqtSignal(object)
     training_failed = pyqtSignal(str)
+    training_cancelled = pyqtSignal()
+    epoch_finished = pyqtSignal(int, int)
 
-    def __init__(self, model, params, parent=None):
+    def __init__(self, model_path, params, history=None, resume_job=None, scheduler=None, parent=None):
         super().__init__(parent)
-        self.model = model
+        self.model_path = model_path
         self.params = params
+        self.history = history
+        self.resume_job = resume_job
+        self.job = None
+        self.scheduler = scheduler
+        self.governor = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+
+    def cancel(self):
+        """Ask the trainer to stop after the current batch"""
+        self._stop.set()
+
+    def _on_train_start(self, trainer):
+        if self.job is not None:
+            self.job["save_dir"] = str(trainer.save_dir)
+            self.history.save()
+
+    def _on_train_batch_end(self, trainer):
+        if self.governor is not None:
+            # Yields the CPU to the user while they are editing.
+            self.governor.checkpoint()
+        if self._stop.is_set():
+            trainer.stop = True
+            raise TrainingCancelled()
+
+    def _on_fit_epoch_end(self, trainer):
+        self.epoch_finished.emit(trainer.epoch + 1, trainer.epochs)
 
     def run(self):
+        yolo = None
+        callbacks = [
+            ("on_train_start", self._on_train_start),
+            ("on_train_batch_end", self._on_train_batch_end),
+            ("on_fit_epoch_end", self._on_fit_epoch_end),
+        ]
+        start = time.perf_counter()
         try:
+            if self.history is not None:
+                self.job = self.history.start(self.params, self.resume_job["id"] if self.resume_job else None)
+                if self.resume_job is not None:
+                    self.job["save_dir"] = self.resume_job["save_dir"]
+            if self.resume_job is not None:
+                # Resume continues the interrupted job's run from its last.pt.
+                checkpoint = JobHistory.last_checkpoint(self.resume_job)
+                if checkpoint is None:
+                    raise FileNotFoundError(f"Training job {self.resume_job['id']} has no last.pt to resume from")
+                yolo = YOLO(checkpoint)
+                train_args = {"resume": checkpoint}
+            else:
+                # A model of its own: the predictor keeps serving, unchanged if training stops early.
+                yolo = YOLO(self.model_path)
+                train_args = self.params
+            for event, callback in callbacks:
+                yolo.add_callback(event, callback)
+            if self.scheduler is not None:
+                self.governor = self.scheduler.register_external("Training", PRIORITY_TRAINING)
+
             # Start training. Logs will be printed to the console.
-            results = self.model.train(**self.params)
+            results = yolo.train(**train_args)
+            self.duration = time.perf_counter() - start
+            self._finish(OUTCOME_FINISHED)
             self.training_finished.emit(results)
 
+        except (TrainingCancelled, JobCancelled):
+            self.duration = time.perf_counter() - start
+            self._finish(OUTCOME_CANCELLED)
+            self.training_cancelled.emit()
+
         except Exception:
+            self.duration = time.perf_counter() - start
             exc_str = traceback.format_exc()
+            self._finish(OUTCOME_FAILED, exc_str.strip().splitlines()[-1])
             self.training_failed.emit(exc_str)
+
+        finally:
+            if self.governor is not None:
+                self.scheduler.unregister_external(self.governor)
+                self.governor = None
+            if yolo is not None:
+                for event, callback in callbacks:
+                    if callback in yolo.callbacks.get(event, []):
+                        yolo.callbacks[event].remove(callback)
+
+    def _finish(self, outcome, error=None):
+        if self.job is not None:
+            self.history.finish(self.job, outcome, self.duration, error)
@@ -1,88 +1,32 @@
 import os
 import math
-from PyQt5.QtCore import QPointF
 
 def distance(p):
     """Distance between two points"""
     return math.sqrt(p.x() * p.x() + p.y() * p.y())
 
-def distance_to_line(point, line):
-    """Distance from a point to a line"""
-    p1, p2 = line
-    d = p2 - p1
-    l2 = d.x() * d.x() + d.y() * d.y()
-    if l2 == 0:
-        return distance(point - p1)
-    t = max(0, min(1, ((point - p1).x() * d.x() + (point - p1).y() * d.y()) / l2))
-    projection = p1 + t * d
-    return distance(point - projection)
+def labels_dir_for(img_path):
+    """Labels folder that sits next to the image folder"""
+    return os.path.join(os.path.dirname(os.path.dirname(img_path)), "labels")
 
-def load_yolo_labels(txt_path, img_w, img_h, class_names):
-    from shape import Shape
-    shapes = []
-    if not os.path.exists(txt_path):
-        return shapes
-
-    with open(txt_path, 'r') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        parts = line.strip().split()
-        if not parts:
-            continue
-            
-        try:
-            class_id = int(parts[0])
-            class_name = class_names[class_id]
-            
-            # Check if confidence score is present
-            if len(parts) % 2 == 0:
-                score = float(parts[-1])
-                polygon_parts = parts[1:-1]
-            else:
-                score = 1.0
-                polygon_parts = parts[1:]
+def label_path_for(img_path):
+    """YOLO txt label path of an image"""
+    txt_file = os.path.splitext(os.path.basename(img_path))[0] + ".txt"
+    return os.path.join(labels_dir_for(img_path), txt_file)
 
-            polygon_coords = []
-            for j in range(0, len(polygon_parts), 2):
-                x_norm = float(polygon_parts[j])
-                y_norm = float(polygon_parts[j+1])
-                
-                x_abs = x_norm * img_w
-                y_abs = y_norm * img_h
-                polygon_coords.append(QPointF(x_abs, y_abs))
-            
-            shape = Shape(label=class_name, shape_type='polygon', score=score)
-            shape.points = polygon_coords
-            shape.close()
-            shapes.append(shape)
-        except Exception as e:
-            print(f"Error parsing line {line}: {e}")
-
-    return shapes
+def shapes_from_annotation(ann, img_w, img_h, class_names):
+    """Build shapes from an AnnotationFile"""
+    from shape import Shape
+    shapes = (Shape.from_instance(inst, class_names) for inst in ann.records(img_w, img_h))
+    return [shape for shape in shapes if shape is not None]
 
-def save_yolo_labels(txt_path, shapes, img_w, img_h, class_names):
-    lines = []
+def annotation_instances_from_shapes(shapes, class_names, reviewed=True):
+    """Convert shapes to AnnotationInstance records, keeping source masks and provenance"""
+    class_index = {name: i for i, name in enumerate(class_names)}
+    instances = []
     for shape in shapes:
-        class_name = shape.label
-        if class_name not in class_names:
+        class_id = class_index.get(shape.label)
+        if class_id is None or not shape.points:
             continue
-        class_id = class_names.index(class_name)
-        
-        normalized_coords = []
-        for pt in shape.points:
-            x_abs = pt.x()
-            y_abs = pt.y()
-
-            x_norm = max(0.0, min(1.0, x_abs / img_w))
-            y_norm = max(0.0, min(1.0, y_abs / img_h))
-            normalized_coords.append(f"{x_norm:.6f}")
-            normalized_coords.append(f"{y_norm:.6f}")
-        
-        if normalized_coords:
-            score = shape.score if shape.score is not None else 1.0
-            line_parts = [str(class_id)] + normalized_coords + [f"{score:.6f}"]
-            lines.append(" ".join(line_parts))
-    
-    with open(txt_path, 'w') as f:
-        f.write("\n".join(lines))
\ No newline at end of file
+        instances.append(shape.to_instance(class_id, reviewed))
+    return instances
@@ -1,15 +1,36 @@
+import threading
 import cv2
 import numpy as np
 from rdp import rdp
 from ultralytics import YOLO
 import torch
 
+from profiler import profiler
+from annotation_format import crop_mask, rle_encode
+from quantization import load_int8
+
 class RealYOLOPredictor:
+    # Full-image pre-labeling runs at IMGSZ. Region crops are resized to the
+    # smaller ROI_IMGSZ instead, so small objects are upsampled and a crop pass
+    # costs a fraction of a full one.
+    IMGSZ = 1280
+    ROI_IMGSZ = 640
+    # Context added around a region on each side, as a fraction of its size.
+    ROI_CONTEXT = 0.1
+
     def __init__(self, model_path):
         self.device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
         print(f"Initializing model on device: {self.device}")
+        self.model_path = model_path
         self.model = YOLO(model_path)
         self.model.to(self.device)
+        # INT8 ONNX copy used for inference instead of self.model when set (see set_quantized).
+        self.quantized_model = None
+        # Pooled backbone features of the last inference, captured by a forward hook.
+        self.last_embedding = None
+        # Serializes inference from background jobs; hold it to read last_embedding.
+        self.lock = threading.RLock()
+        self._register_embedding_hook()
 
     def is_loaded(self):
         return self.model is not None
@@ -19,19 +40,127 @@ class RealYOLOPredictor:
             return self.model.names
         return {}
 
-    def predict_and_optimize(self, img_path, epsilon=1.0):
-        img = cv2.imread(img_path)
+    def is_quantized(self):
+        return self.quantized_model is not None
+
+    def set_quantized(self, enabled):
+        """Run inference with the INT8 CPU model (built once and cached next to the .pt) or the float one.
+
+        Training always uses the float model. The backbone hook doesn't see
+        INT8 passes, so no embeddings are recorded while it is on.
+        """
+        quantized_model = load_int8(self.model_path) if enabled else None
+        with self.lock:
+            self.quantized_model = quantized_model
+
+    def _infer(self, img, imgsz):
+        if self.quantized_model is not None:
+            return self.quantized_model(img, imgsz=imgsz, conf=0.25, device="cpu", retina_masks=True)
+        return self.model(img, imgsz=imgsz, conf=0.25, device=self.device, retina_masks=True)
+
+    def _register_embedding_hook(self):
+        """Hook the last backbone layer so every forward pass also yields an embedding"""
+        try:
+            layers = self.model.model.model
+            backbone_end = len(self.model.model.yaml["backbone"]) - 1
+            layer = layers[backbone_end]
+        except (AttributeError, KeyError, IndexError, TypeError):
+            print("Backbone layer not found; embeddings are disabled.")
+            return
+        layer.register_forward_hook(self._capture_embedding)
+
+    def _capture_embedding(self, module, inputs, output):
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        # Global average pool over the feature map of the first image in the batch.
+        self.last_embedding = output[0].float().mean(dim=(1, 2)).cpu().numpy()
+
+    def predict_and_optimize(self, image, epsilon=1.0, with_masks=False):
+        """image is an image path or an already decoded BGR array (see frame.Frame)"""
+        with self.lock:
+            return self._predict_and_optimize(image, epsilon, with_masks)
+
+    def _read(self, image):
+        if not isinstance(image, str):
+            return image
+        with profiler.span("predict.decode"):
+            img = cv2.imread(image)
+        if img is None:
+            print(f"Error: Could not read image {image}")
+        return img
+
+    def _predict_and_optimize(self, image, epsilon, with_masks):
+        img = self._read(image)
         if img is None:
-            print(f"Error: Could not read image {img_path}")
             return [], (0, 0), 0.0
             
         img_h, img_w = img.shape[:2]
         
-        results = self.model(img, imgsz=1280, conf=0.25, device=self.device, retina_masks=True)
+        self.last_embedding = None
+        with profiler.span("predict.inference"):
+            results = self._infer(img, self.IMGSZ)
 
         if not results or results[0].masks is None:
             return [], (img_w, img_h), 0.0
 
+        with profiler.span("predict.postprocess"):
+            return self._postprocess(results, img_w, img_h, epsilon, with_masks)
+
+    def predict_region(self, image, region, epsilon=1.0, with_masks=False):
+        """Segment only the (x0, y0, x1, y1) region of an image.
+
+        Returns the instances whose box center lies inside the region, in
+        image coordinates, like predict_and_optimize.
+        """
+        with self.lock:
+            return self._predict_region(image, region, epsilon, with_masks)
+
+    def _predict_region(self, image, region, epsilon, with_masks):
+        img = self._read(image)
+        if img is None:
+            return [], (0, 0), 0.0
+
+        img_h, img_w = img.shape[:2]
+        x0, y0, x1, y1 = region
+        pad_x = (x1 - x0) * self.ROI_CONTEXT
+        pad_y = (y1 - y0) * self.ROI_CONTEXT
+        cx0, cy0 = max(0, int(x0 - pad_x)), max(0, int(y0 - pad_y))
+        cx1, cy1 = min(img_w, int(np.ceil(x1 + pad_x))), min(img_h, int(np.ceil(y1 + pad_y)))
+        if cx1 - cx0 < 2 or cy1 - cy0 < 2:
+            return [], (img_w, img_h), 0.0
+
+        crop = img[cy0:cy1, cx0:cx1]
+        scale = self.ROI_IMGSZ / max(crop.shape[:2])
+        size = (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_LINEAR if scale > 1 else cv2.INTER_AREA)
+
+        self.last_embedding = None
+        with profiler.span("predict.inference"):
+            results = self._infer(crop, self.ROI_IMGSZ)
+
+        if not results or results[0].masks is None:
+            return [], (img_w, img_h), 0.0
+
+        with profiler.span("predict.postprocess"):
+            instances, _, _ = self._postprocess(
+                results, img_w, img_h, epsilon, with_masks, crop_box=(cx0, cy0, cx1 - cx0, cy1 - cy0)
+            )
+
+        # Objects mostly in the added context belong to the surrounding labels.
+        inside = []
+        for inst in instances:
+            points = np.asarray(inst[1])
+            cx, cy = (points.min(axis=0) + points.max(axis=0)) / 2
+            if x0 <= cx <= x1 and y0 <= cy <= y1:
+                inside.append(inst)
+        confs = [inst[2] for inst in inside if inst[2] > 0]
+        return inside, (img_w, img_h), sum(confs) / len(confs) if confs else 0.0
+
+    def _postprocess(self, results, img_w, img_h, epsilon, with_masks=False, crop_box=None):
+        """crop_box is the (x, y, width, height) of the image region the results were predicted on"""
+        if crop_box is None:
+            crop_box = (0, 0, img_w, img_h)
+        off_x, off_y, box_w, box_h = crop_box
         instances = []
         total_conf = 0
         num_insts = 0
@@ -44,12 +173,13 @@ class RealYOLOPredictor:
             
             polygon_points = []
             for p_norm in polygon_points_normalized:
-                x_abs = p_norm[0] * img_w
-                y_abs = p_norm[1] * img_h
+                x_abs = off_x + p_norm[0] * box_w
+                y_abs = off_y + p_norm[1] * box_h
                 polygon_points.append([x_abs, y_abs])
 
             if epsilon > 0:
-                polygon_points = rdp(polygon_points, epsilon=epsilon)
+                with profiler.span("predict.rdp"):
+                    polygon_points = rdp(polygon_points, epsilon=epsilon)
 
             if len(polygon_points) < 3:
                 continue
@@ -57,7 +187,16 @@ class RealYOLOPredictor:
             class_id = int(results[0].boxes.cls[i].cpu().numpy())
             conf = float(results[0].boxes.conf[i].cpu().numpy())
             
-            instances.append((class_id, polygon_points, conf))
+            if with_masks:
+                # Source mask as (x, y, width, height, rle runs), cropped to its bbox.
+                mask = results[0].masks.data[i].cpu().numpy()
+                if mask.shape != (box_h, box_w):
+                    mask = cv2.resize(mask, (box_w, box_h), interpolation=cv2.INTER_LINEAR)
+                x, y, crop = crop_mask(mask > 0.5)
+                mask_rle = (off_x + x, off_y + y, crop.shape[1], crop.shape[0], rle_encode(crop))
+                instances.append((class_id, polygon_points, conf, mask_rle))
+            else:
+                instances.append((class_id, polygon_points, conf))
             
             if conf > 0:
                 total_conf += conf